@@ -0,0 +1,210 @@
+"""
+异步 I/O 引擎：所有飞书（令牌、多维表格检索与写入、附件解析与下载）和大模型请求共用一个后台事件循环与连接池。
+
+- 安装了 httpx 时启用：后台线程运行 asyncio 事件循环，httpx.AsyncClient 复用连接（最多 MAX_CONNECTIONS 个）；
+  设置 ASYNC_IO=0 或未安装 httpx 时停用，http() 直接调用 requests，行为与以前相同；
+- 页面、导出和命令行代码仍是同步的：http() 发一个请求，run_sync(协程) 把一组并发请求交给后台事件循环并等待结果，
+  一个线程即可同时发起上百个请求（整表分片拉取、附件预下载）；
+- 每个请求有超时；run_sync 超时或调用方放弃时取消协程，尚未完成的请求随之取消；
+- 连接失败、超时转换为 requests 的同类异常，离线判断（offline.is_network_error）与页面上的错误提示不变。
+
+asyncio 与 httpx 在第一次发请求时才导入，只读取配置的页面和命令行不付出导入成本。
+"""
+import importlib.util
+import json
+import os
+import threading
+from typing import Any, Awaitable, Iterable, List, Optional
+
+# 连接池上限与默认超时（秒）
+MAX_CONNECTIONS = int(os.getenv("ASYNC_IO_MAX_CONNECTIONS", "64"))
+DEFAULT_TIMEOUT = 15.0
+
+_lock = threading.Lock()
+_loop = None
+_thread: Optional[threading.Thread] = None
+_client = None
+_httpx_available: Optional[bool] = None
+
+
+def enabled() -> bool:
+    """异步引擎是否启用（已安装 httpx 且未设置 ASYNC_IO=0）。"""
+    global _httpx_available
+    if os.getenv("ASYNC_IO", "1") == "0":
+        return False
+    if _httpx_available is None:
+        _httpx_available = importlib.util.find_spec("httpx") is not None
+    return _httpx_available
+
+
+class Response:
+    """与 requests.Response 用法相同的最小响应对象（status_code、ok、content、text、headers、json()、raise_for_status()）。"""
+
+    def __init__(self, status_code: int, content: bytes, headers: Any):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", "replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            import requests
+
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}: {self.text[:200]}", response=self)
+
+
+def _get_loop():
+    import asyncio
+
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="aio-loop", daemon=True)
+            _thread.start()
+        return _loop
+
+
+def _get_client():
+    # 只在事件循环线程中调用，无需加锁
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=DEFAULT_TIMEOUT,
+        )
+    return _client
+
+
+def _reset_after_fork() -> None:
+    # 批量生成的工作进程由 fork 创建：父进程的事件循环线程不会被继承，子进程首次使用时重新创建
+    global _lock, _loop, _thread, _client
+    _lock = threading.Lock()
+    _loop = _thread = _client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """
+    在后台事件循环中运行协程并等待结果（同步代码的入口）。
+    超过 timeout 秒时取消协程并抛出 TimeoutError；不能在事件循环线程内调用。
+    """
+    import asyncio
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    loop = _get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("不能在异步 I/O 事件循环线程中调用 run_sync")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise TimeoutError(f"异步请求超时（{timeout} 秒）") from None
+    except BaseException:
+        # 调用方被中断（如 KeyboardInterrupt）时不留下仍在运行的请求
+        future.cancel()
+        raise
+
+
+async def request(
+    method: str,
+    url: str,
+    *,
+    headers: Optional[dict] = None,
+    params: Optional[dict] = None,
+    json: Any = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    allow_redirects: bool = True,
+) -> Response:
+    """发起一个 HTTP 请求（在事件循环中 await）。连接失败、超时抛出 requests 的 ConnectionError / Timeout。"""
+    import httpx
+    import requests
+
+    try:
+        resp = await _get_client().request(
+            method, url, headers=headers, params=params, json=json, timeout=timeout, follow_redirects=allow_redirects
+        )
+    except httpx.TimeoutException as exc:
+        raise requests.exceptions.Timeout(f"{method} {url} 超时：{exc}") from exc
+    except httpx.TransportError as exc:
+        raise requests.exceptions.ConnectionError(f"{method} {url} 连接失败：{exc}") from exc
+    return Response(resp.status_code, resp.content, resp.headers)
+
+
+def http(method: str, url: str, **kwargs: Any):
+    """
+    同步发一个请求（参数同 request）。引擎启用时走共用的连接池，否则直接调用 requests.get/post/put。
+    """
+    if not enabled():
+        import requests
+
+        return getattr(requests, method.lower())(url, **kwargs)
+    import requests
+
+    timeout = kwargs.get("timeout", DEFAULT_TIMEOUT)
+    # httpx 的超时按每次读取计算，连接慢慢吐数据时不会触发；这里多留几秒作为整个请求的上限
+    try:
+        return run_sync(request(method, url, **kwargs), timeout=timeout + 5)
+    except TimeoutError as exc:
+        # 与 requests 的超时同类，离线判断（offline.is_network_error）照常识别
+        raise requests.exceptions.Timeout(f"{method} {url} 超时：{exc}") from exc
+
+
+async def gather_limited(aws: Iterable[Awaitable], limit: int) -> List[Any]:
+    """并发运行协程（同时最多 limit 个），按传入顺序返回结果；任一协程出错或被取消时取消其余协程。"""
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(aw: Awaitable) -> Any:
+        async with semaphore:
+            return await aw
+
+    tasks = [asyncio.ensure_future(run(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+class AsyncRateLimiter:
+    """令牌桶限速（事件循环内使用）：acquire() 在超出每秒请求数时等待。rate<=0 表示不限速。"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = max(rate, 1.0)
+        self._last: Optional[float] = None
+
+    async def acquire(self) -> None:
+        import asyncio
+
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._last is not None:
+                self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -0,0 +1,158 @@
+"""
+批量组卷：一次处理多份选题计划（按学生、学科、周次等），在多个进程中并行生成。
+
+流程：
+1. 主进程为每份计划确定题目（原题按 seed 抽样；类似题取参考题），汇总所有涉及的图片附件；
+2. 主进程用线程池并发预下载这些附件到共享的磁盘缓存，每张图片整批只下载一次；
+3. 进程池中的工作进程读取缓存组卷、写出文件（类似题在工作进程中调用大模型）；
+4. 写出 manifest.json，记录每份试卷的输出路径、大小、耗时与错误。
+"""
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from feishu_client import prefetch_attachments
+from papers import build_paper, filter_by_subjects, paper_title, render_selections, select_questions, similar_reference_questions
+from records import is_image_file
+from storage import atomic_write_json
+
+# 工作进程内的共享数据，由 _init_worker 设置，避免每个任务重复传输整个题库
+_worker_state: Dict = {}
+
+
+def load_plans(path: str) -> List[Dict]:
+    """读取批量计划文件：计划列表，或 {"plans": [...]}。每份计划与 cli.py export 的计划文件格式相同。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    plans = data.get("plans") if isinstance(data, dict) else data
+    if not isinstance(plans, list):
+        raise ValueError(f"批量计划文件格式错误：需要计划列表或 {{\"plans\": [...]}}: {path}")
+    for idx, plan in enumerate(plans):
+        if not isinstance(plan.get("subjects"), list) or not isinstance(plan.get("plan"), dict):
+            raise ValueError(f"第 {idx + 1} 份计划格式错误：需要 subjects（列表）与 plan（知识点 -> 题数）")
+    return plans
+
+
+def _plan_name(plan: Dict, idx: int) -> str:
+    return plan.get("name") or f"{idx + 1:03d}_{paper_title(plan['subjects'], bool(plan.get('similar')))}"
+
+
+def _prepare(records: List[Dict], plan: Dict, idx: int) -> Dict:
+    """在主进程中确定一份计划的题目，返回任务描述。"""
+    subjects = plan["subjects"]
+    selected_plan = {k: int(v) for k, v in plan["plan"].items()}
+    filtered = filter_by_subjects(records, subjects)
+    task = {
+        "index": idx,
+        "name": _plan_name(plan, idx),
+        "subjects": subjects,
+        "plan": selected_plan,
+        "format": plan.get("format") or "docx",
+        "similar": bool(plan.get("similar")),
+        "output": plan.get("output"),
+    }
+    if task["similar"]:
+        refs = similar_reference_questions(filtered, selected_plan)
+        # 大模型只看第一张图片
+        task["_attachments"] = [
+            att for qs in refs.values() for q in qs
+            for att in [a for a in (q.get("attachments") or []) if is_image_file(a.get("name"), a.get("mime"))][:1]
+        ]
+    else:
+        rng = random.Random(plan.get("seed", idx))
+        task["selections"] = select_questions(filtered, selected_plan, rng)
+        task["_attachments"] = [att for qs in task["selections"].values() for q in qs for att in (q.get("attachments") or [])]
+    return task
+
+
+def _init_worker(records: List[Dict], token: str, llm_settings: Dict) -> None:
+    _worker_state.update(records=records, token=token, llm=llm_settings)
+
+
+def _run_task(task: Dict, out_dir: str) -> Dict:
+    """工作进程：生成一份试卷并写出文件。"""
+    started = time.time()
+    fmt = task["format"]
+    output = task.get("output") or os.path.join(out_dir, f"{task['name']}.{fmt}")
+    result = {
+        "index": task["index"],
+        "name": task["name"],
+        "subjects": task["subjects"],
+        "plan": task["plan"],
+        "format": fmt,
+        "similar": task["similar"],
+        "output": output,
+        "pid": os.getpid(),
+    }
+    try:
+        token = _worker_state["token"]
+        if task["similar"]:
+            llm = _worker_state["llm"]
+            data = build_paper(
+                _worker_state["records"], task["subjects"], task["plan"], fmt, True, token,
+                llm.get("api_key"), llm.get("api_base"), llm.get("model"),
+            )
+        else:
+            if not task["selections"]:
+                raise ValueError("没有可用题目")
+            data = render_selections(task["subjects"], task["selections"], fmt, token)
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "wb") as f:
+            f.write(data)
+        result.update(status="ok", bytes=len(data), error=None)
+    except Exception as exc:  # noqa: BLE001
+        result.update(status="failed", bytes=0, error=str(exc))
+    result["seconds"] = round(time.time() - started, 3)
+    return result
+
+
+def run_batch(
+    plans: List[Dict],
+    records: List[Dict],
+    token: str,
+    out_dir: str,
+    llm_settings: Optional[Dict] = None,
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """
+    批量生成试卷并写出 manifest.json，返回 manifest 内容。
+    llm_settings: {"api_key", "api_base", "model"}，只有类似题计划需要。
+    """
+    started = time.time()
+    os.makedirs(out_dir, exist_ok=True)
+    llm_settings = llm_settings or {}
+
+    tasks = [_prepare(records, plan, idx) for idx, plan in enumerate(plans)]
+    if any(t["similar"] for t in tasks) and not llm_settings.get("api_key"):
+        raise ValueError("批量计划中包含类似题试卷，需要配置 LLM_API_KEY")
+    prefetch = prefetch_attachments([att for t in tasks for att in t.pop("_attachments")], token)
+
+    results: List[Dict] = []
+    max_workers = max_workers or min(len(tasks), os.cpu_count() or 1) or 1
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(records, token, llm_settings)) as pool:
+        futures = [pool.submit(_run_task, task, out_dir) for task in tasks]
+        for fut in as_completed(futures):
+            result = fut.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    results.sort(key=lambda r: r["index"])
+
+    finished = time.time()
+    manifest = {
+        "started_at": started,
+        "finished_at": finished,
+        "seconds": round(finished - started, 3),
+        "workers": max_workers,
+        "prefetch": prefetch,
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "papers": results,
+    }
+    atomic_write_json(Path(out_dir) / "manifest.json", manifest)
+    return manifest
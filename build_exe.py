@@ -3,6 +3,38 @@ import PyInstaller.__main__
 import sys
 from pathlib import Path
 
+# app.py 由 Streamlit 按源码运行，它导入的模块也需要随包分发
+APP_MODULES = [
+    'aio.py',
+    'app.py',
+    'batch.py',
+    'cli.py',
+    'dedupe.py',
+    'events.py',
+    'export_jobs.py',
+    'exporters.py',
+    'feishu_client.py',
+    'llm.py',
+    'llm_router.py',
+    'metrics.py',
+    'offline.py',
+    'papers.py',
+    'practice_ledger.py',
+    'record_store.py',
+    'records.py',
+    'retrieval.py',
+    'scheduler.py',
+    'settings.py',
+    'similar_jobs.py',
+    'storage.py',
+    'usage.py',
+    'ui_common.py',
+    'ui_diagnostics.py',
+    'ui_exam.py',
+    'ui_practice.py',
+    'warmup.py',
+]
+
 def build():
     app_dir = Path(__file__).parent
     
@@ -12,7 +44,7 @@ def build():
         '--onefile',
         '--windowed',  # Windows下隐藏控制台窗口
         '--icon=NONE',  # 可以添加图标文件路径
-        '--add-data=app.py;.',
+        *[f'--add-data={name};.' for name in APP_MODULES],
         '--hidden-import=streamlit',
         '--hidden-import=streamlit.web.cli',
         '--hidden-import=docx',
@@ -20,6 +52,7 @@ def build():
         '--hidden-import=numpy',
         '--hidden-import=PIL',
         '--hidden-import=requests',
+        '--hidden-import=httpx',
         '--collect-all=streamlit',
         '--collect-all=docx',
     ])
@@ -0,0 +1,370 @@
+"""
+命令行入口：不启动 Streamlit 即可同步题库、按计划文件生成试卷、预生成类似题，适合放进计划任务。
+
+用法示例：
+    python cli.py sync
+    python cli.py export plan.json -o 数学周练.docx
+    python cli.py batch plans.json --out-dir 本周试卷 --workers 4
+    python cli.py pregenerate --subject 数学 --limit 20
+    python cli.py pregenerate --due --until 06:30 --rate 20 --max-cost 2
+    python cli.py compact --dry-run
+    python cli.py subscribe
+    python cli.py usage --days 30 --format csv -o 用量.csv
+
+计划文件（JSON）：
+    {"subjects": ["数学"], "plan": {"分数加减": 3, "方程": 2}, "format": "docx", "similar": false}
+其中 plan 与页面上「每个知识点的题目数量」相同。
+
+凭据与页面相同，从环境变量或 .feishu_config.json 读取（FEISHU_APP_ID、FEISHU_APP_SECRET、LLM_API_KEY 等）。
+为保证启动速度，重量级依赖只在具体命令中导入。
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def _log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+def _get_token(config: Dict) -> str:
+    from feishu_client import get_tenant_access_token
+    from settings import get_setting
+
+    app_id = get_setting("FEISHU_APP_ID", config)
+    app_secret = get_setting("FEISHU_APP_SECRET", config)
+    if not app_id or not app_secret:
+        raise SystemExit("缺少 FEISHU_APP_ID / FEISHU_APP_SECRET，请通过环境变量或 .feishu_config.json 配置")
+    return get_tenant_access_token(app_id, app_secret)
+
+
+def _llm_settings(config: Dict):
+    from llm import DEFAULT_LLM_API_BASE, DEFAULT_LLM_MODEL
+    from settings import get_setting
+
+    return (
+        get_setting("LLM_API_KEY", config),
+        get_setting("LLM_API_BASE", config, DEFAULT_LLM_API_BASE),
+        get_setting("LLM_MODEL", config, DEFAULT_LLM_MODEL),
+    )
+
+
+def _sync(token: str) -> List[Dict]:
+    from record_store import get_record_store
+
+    return get_record_store().sync(token)
+
+
+def _load_records(token: str, use_snapshot: bool) -> List[Dict]:
+    """读取题库：use_snapshot 时优先用本地快照，没有快照再同步。"""
+    if use_snapshot:
+        from record_store import get_record_store
+
+        store = get_record_store()
+        if store.load_from_snapshot():
+            return store.records
+        _log("本地没有题库快照，先同步一次")
+    return _sync(token)
+
+
+def cmd_warmup(args, config: Dict) -> int:
+    from warmup import warm_up
+
+    report = warm_up(config, log=_log)
+    print(json.dumps(report, ensure_ascii=False))
+    return 0 if report["ok"] else 1
+
+
+def cmd_sync(args, config: Dict) -> int:
+    from offline import drain_outbox
+
+    started = time.time()
+    token = _get_token(config)
+    # 先补写页面离线期间排队的练习记录
+    pushed = drain_outbox(token)
+    records = _sync(token)
+    print(json.dumps({
+        "records": len(records), "practice_pushed": pushed["pushed"], "practice_failed": pushed["failed"],
+        "seconds": round(time.time() - started, 2),
+    }, ensure_ascii=False))
+    return 0
+
+
+def _load_plan(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if not isinstance(plan.get("subjects"), list) or not isinstance(plan.get("plan"), dict):
+        raise SystemExit(f"计划文件格式错误：需要 subjects（列表）与 plan（知识点 -> 题数）: {path}")
+    return plan
+
+
+def cmd_export(args, config: Dict) -> int:
+    from papers import build_paper, paper_title
+
+    plan = _load_plan(args.plan)
+    fmt = args.format or plan.get("format") or "docx"
+    similar = bool(args.similar or plan.get("similar"))
+    token = _get_token(config)
+    records = _load_records(token, args.snapshot)
+    llm_api_key, llm_api_base, llm_model = _llm_settings(config)
+    if similar and not llm_api_key:
+        raise SystemExit("生成类似题试卷需要配置 LLM_API_KEY")
+
+    started = time.time()
+    last = [-1]
+
+    def report(progress: float, message: str = "") -> None:
+        pct = int(progress * 100)
+        if args.verbose and pct != last[0]:
+            last[0] = pct
+            _log(f"[{pct:3d}%] {message}")
+
+    data = build_paper(
+        records, plan["subjects"], {k: int(v) for k, v in plan["plan"].items()}, fmt, similar, token,
+        llm_api_key, llm_api_base, llm_model, report=report,
+    )
+    output = args.output or plan.get("output") or f"{paper_title(plan['subjects'], similar)}.{fmt}"
+    with open(output, "wb") as f:
+        f.write(data)
+    print(json.dumps({"output": output, "bytes": len(data), "seconds": round(time.time() - started, 2)}, ensure_ascii=False))
+    return 0
+
+
+def cmd_batch(args, config: Dict) -> int:
+    from batch import load_plans, run_batch
+
+    plans = load_plans(args.plans)
+    token = _get_token(config)
+    records = _load_records(token, args.snapshot)
+    llm_api_key, llm_api_base, llm_model = _llm_settings(config)
+
+    def on_result(result: Dict) -> None:
+        if args.verbose:
+            status = "✓" if result["status"] == "ok" else f"✗ {result['error']}"
+            _log(f"[{result['index'] + 1}/{len(plans)}] {result['name']} {result['seconds']}s {status}")
+
+    manifest = run_batch(
+        plans, records, token, args.out_dir,
+        {"api_key": llm_api_key, "api_base": llm_api_base, "model": llm_model},
+        max_workers=args.workers or None,
+        on_result=on_result,
+    )
+    summary = {k: manifest[k] for k in ("ok", "failed", "seconds", "workers", "prefetch")}
+    summary["manifest"] = str(Path(args.out_dir) / "manifest.json")
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if manifest["failed"] else 0
+
+
+def _pregenerate_candidates(args, config: Dict, token: str, records: List[Dict]) -> List[Dict]:
+    """预生成的题目：--due 时为 horizon 内到期的题（按下次练习时间，先到期的在前），否则为全部题目（新录入的在前）。"""
+    candidates = [
+        r for r in records
+        if (r.get("record_id") or "").strip()
+        and (r.get("handwriting_text") or r.get("attachments"))
+        and (not args.subject or r.get("subject") in args.subject)
+    ]
+    if args.due:
+        from record_store import get_practice_map
+        from scheduler import due_questions
+        from settings import get_setting
+
+        practice_table_id = get_setting("FEISHU_PRACTICE_TABLE_ID", config)
+        if not practice_table_id:
+            raise SystemExit("缺少 FEISHU_PRACTICE_TABLE_ID，无法计算到期题目")
+        practice_map = get_practice_map(token, practice_table_id, max_age=0)
+        return due_questions(candidates, practice_map, int(time.time() * 1000), int(args.horizon_hours * 3600 * 1000))
+    # 新录入的题目优先
+    candidates.sort(key=lambda r: r.get("created_time", 0), reverse=True)
+    return candidates
+
+
+def _parse_until(value: str) -> float:
+    """HH:MM -> 下一次到达该时刻的时间戳（今天已过则为明天）。"""
+    from datetime import datetime, timedelta
+
+    try:
+        hour, minute = (int(x) for x in value.split(":"))
+        deadline = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
+    except ValueError:
+        raise SystemExit(f"--until 格式应为 HH:MM：{value}")
+    if deadline <= datetime.now():
+        deadline += timedelta(days=1)
+    return deadline.timestamp()
+
+
+def _budget_stop(args, spent: Dict, attempted: int, generated: int, deadline: Optional[float]) -> str:
+    """检查预算，返回停止原因（空字符串表示继续）；token 与费用按已生成题目的平均值预留下一道题的用量。"""
+    if args.limit and generated >= args.limit:
+        return "limit"
+    if deadline and time.time() >= deadline:
+        return "until"
+    per_question = max(attempted, 1)
+    if args.max_tokens and spent["tokens"] + spent["tokens"] / per_question > args.max_tokens:
+        return "max_tokens"
+    if args.max_cost and spent["cost"] + spent["cost"] / per_question > args.max_cost:
+        return "max_cost"
+    return ""
+
+
+def cmd_pregenerate(args, config: Dict) -> int:
+    from llm import generate_similar_questions_with_llm, load_similar_from_store, save_similar_to_store
+    from usage import get_usage_ledger
+
+    llm_api_key, llm_api_base, llm_model = _llm_settings(config)
+    if not llm_api_key:
+        raise SystemExit("预生成类似题需要配置 LLM_API_KEY")
+    token = _get_token(config)
+    records = _load_records(token, args.snapshot)
+    candidates = _pregenerate_candidates(args, config, token, records)
+    purpose = "nightly" if args.due else "cli_pregenerate"
+    deadline = _parse_until(args.until) if args.until else None
+    interval = 60.0 / args.rate if args.rate > 0 else 0.0
+
+    stats = {"candidates": len(candidates), "generated": 0, "cached": 0, "failed": 0}
+    started = time.time()
+    ledger = get_usage_ledger()
+    stopped = ""
+    last_call = 0.0
+    for i, r in enumerate(candidates):
+        if not args.force and len(load_similar_from_store(r)) >= 2:
+            stats["cached"] += 1
+            continue
+        stopped = _budget_stop(args, ledger.spent(started, purpose), stats["generated"] + stats["failed"], stats["generated"], deadline)
+        if stopped:
+            stats["remaining"] = len(candidates) - i
+            break
+        # 限速：两次调用之间至少间隔 60/rate 秒
+        wait = last_call + interval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        last_call = time.time()
+        try:
+            texts = generate_similar_questions_with_llm(r, 2, llm_api_key, llm_api_base, llm_model, token, purpose=purpose)
+            save_similar_to_store(r, texts)
+            stats["generated"] += 1
+        except Exception as exc:  # noqa: BLE001
+            stats["failed"] += 1
+            _log(f"{r.get('record_id')}: {exc}")
+    spent = ledger.spent(started, purpose)
+    if args.max_cost and spent["unpriced_calls"]:
+        _log(f"注意：{spent['unpriced_calls']} 次调用的模型未在 LLM_PRICES 中配置单价，未计入费用预算")
+    stats.update(stopped=stopped, tokens=spent["tokens"], cost=spent["cost"])
+    # 已有两道类似题的比例，即明早练习时「不会」可直接命中缓存的比例
+    stats["ready"] = round((stats["cached"] + stats["generated"]) / len(candidates), 3) if candidates else 1.0
+    stats["seconds"] = round(time.time() - started, 2)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 1 if stats["failed"] and not stats["generated"] else 0
+
+
+def cmd_compact(args, config: Dict) -> int:
+    from practice_ledger import compact_practice_table
+    from settings import get_setting
+
+    practice_table_id = get_setting("FEISHU_PRACTICE_TABLE_ID", config)
+    if not practice_table_id:
+        raise SystemExit("缺少 FEISHU_PRACTICE_TABLE_ID，无法清理练习记录表")
+    stats = compact_practice_table(_get_token(config), practice_table_id, dry_run=args.dry_run)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+def cmd_subscribe(args, config: Dict) -> int:
+    from feishu_client import APP_TOKEN, subscribe_bitable_events
+
+    subscribe_bitable_events(_get_token(config))
+    print(json.dumps({"subscribed": APP_TOKEN}, ensure_ascii=False))
+    return 0
+
+
+def cmd_usage(args, config: Dict) -> int:
+    from usage import get_usage_ledger, report_csv
+
+    ledger = get_usage_ledger()
+    rows = ledger.rows(days=args.days) if args.detail else ledger.summary(days=args.days, group_by=tuple(args.group_by.split(",")))
+    if args.format == "csv":
+        text = report_csv(rows)
+    else:
+        text = json.dumps(rows, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8-sig" if args.format == "csv" else "utf-8")
+        _log(f"已写入 {args.output}（{len(rows)} 行）")
+    else:
+        sys.stdout.write(text if text.endswith("\n") or not text else text + "\n")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="错题本命令行工具（无需启动 Streamlit）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sync", help="补写排队中的练习记录，拉取错题表并保存本地快照")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("warmup", help="预热：获取令牌、加载题库与练习记录、预下载到期题目图片")
+    p.set_defaults(func=cmd_warmup)
+
+    p = sub.add_parser("export", help="按计划文件生成试卷")
+    p.add_argument("plan", help="计划文件（JSON）")
+    p.add_argument("-o", "--output", help="输出文件路径（默认：学科_原题试卷.docx）")
+    p.add_argument("--format", choices=["docx", "html"], help="导出格式，覆盖计划文件中的 format")
+    p.add_argument("--similar", action="store_true", help="生成类似题试卷")
+    p.add_argument("--snapshot", action="store_true", help="使用本地题库快照，不重新拉取")
+    p.add_argument("-v", "--verbose", action="store_true", help="输出进度")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("batch", help="批量生成多份试卷（多进程并行）")
+    p.add_argument("plans", help="批量计划文件（JSON 计划列表，每项格式同 export 的计划文件，可另加 name/output/seed）")
+    p.add_argument("--out-dir", default="batch_output", help="输出目录（默认 batch_output），manifest.json 写在这里")
+    p.add_argument("--workers", type=int, default=0, help="工作进程数（默认按 CPU 核数）")
+    p.add_argument("--snapshot", action="store_true", help="使用本地题库快照，不重新拉取")
+    p.add_argument("-v", "--verbose", action="store_true", help="逐份输出结果")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("pregenerate", help="为题库中的题目预生成类似题（--due 只处理即将到期的题，适合夜间计划任务）")
+    p.add_argument("--subject", action="append", help="只处理指定学科（可重复）")
+    p.add_argument("--due", action="store_true", help="只处理 --horizon-hours 内到期的题（按练习记录表的下次练习时间）")
+    p.add_argument("--horizon-hours", type=float, default=24, help="--due 时的到期范围（小时，默认 24）")
+    p.add_argument("--limit", type=int, default=0, help="最多调用大模型的题数（0 表示不限）")
+    p.add_argument("--rate", type=float, default=0, help="每分钟最多为几道题调用大模型（0 表示不限速）")
+    p.add_argument("--until", help="到该时刻（HH:MM）停止，如 06:30，避免占用早上的练习时段")
+    p.add_argument("--max-tokens", type=int, default=0, help="本次最多消耗的 token 数（0 表示不限）")
+    p.add_argument("--max-cost", type=float, default=0, help="本次最多花费的金额（元，按 LLM_PRICES 计算；0 表示不限）")
+    p.add_argument("--force", action="store_true", help="忽略已有缓存重新生成")
+    p.add_argument("--snapshot", action="store_true", help="使用本地题库快照，不重新拉取")
+    p.set_defaults(func=cmd_pregenerate)
+
+    p = sub.add_parser("compact", help="合并练习记录表中同一题的重复行")
+    p.add_argument("--dry-run", action="store_true", help="只统计重复行，不修改飞书表")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("subscribe", help="订阅多维表格记录变更事件（配合 EVENTS_PORT 使用，只需执行一次）")
+    p.set_defaults(func=cmd_subscribe)
+
+    p = sub.add_parser("usage", help="导出大模型用量报告（按天、用途、模型汇总，或逐次明细）")
+    p.add_argument("--days", type=int, default=7, help="最近多少天（默认 7）")
+    p.add_argument("--group-by", default="day,purpose,model", help="汇总维度，逗号分隔：day、purpose、kind、subject、model")
+    p.add_argument("--detail", action="store_true", help="输出逐次调用明细而不是汇总")
+    p.add_argument("--format", choices=["json", "csv"], default="json", help="输出格式（默认 json）")
+    p.add_argument("-o", "--output", help="写入文件（默认输出到终端）")
+    p.set_defaults(func=cmd_usage)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    from settings import load_config
+
+    try:
+        return args.func(args, load_config())
+    except KeyboardInterrupt:
+        return 130
+    except (RuntimeError, ValueError, OSError) as exc:
+        _log(f"错误：{exc}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+近似重复题检测：学生常把同一道题（或几乎相同的题）录入多次。
+
+每道题计算一个 64 位指纹：有题干文字时对归一化后的文字取 3 字符分片做 SimHash，
+只有图片时对图片做差值哈希（dHash，需要 Pillow，图片取自附件磁盘缓存，不额外下载；
+图片尚未缓存时先用 file_token 代替，缓存后再补算）。同一学科内指纹的汉明距离不超过 MAX_DISTANCE 视为重复，
+归入同一簇，簇以最早录入的那道题为代表。
+
+索引随题库同步增量更新（只计算新增、修改的题），保存在数据目录，命令行和批量生成进程直接读取。用途：
+- 类似题缓存按簇共用：簇内任一道题生成过类似题，其他题直接复用，不再调用大模型（llm.load_similar_from_store）；
+- 组卷时同一簇只抽一道，试卷里不会出现重复题（papers.select_questions / similar_reference_questions）。
+"""
+import hashlib
+import io
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import timed
+from storage import atomic_write_json, get_data_dir, read_json
+
+_INDEX_NAME = "duplicate_index.json"
+_INDEX_FORMAT = 1
+
+# 汉明距离阈值；指纹切成 MAX_DISTANCE + 1 段，重复题至少有一段完全相同（按段分桶找候选）
+MAX_DISTANCE = 3
+_BANDS = MAX_DISTANCE + 1
+_BAND_BITS = 64 // _BANDS
+# 题干去掉空白和标点后不足该长度时不按文字判断（如只写了「见图」）
+MIN_TEXT_LENGTH = 8
+
+_NOISE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def text_simhash(text: str) -> Optional[int]:
+    """文字的 SimHash 指纹；有效文字过短时返回 None。"""
+    normalized = _NOISE.sub("", text or "").lower()
+    if len(normalized) < MIN_TEXT_LENGTH:
+        return None
+    shingles = {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+    bits = [format(_hash64(s.encode("utf-8")), "064b") for s in shingles]
+    # 逐位统计：超过半数分片该位为 1，则指纹该位为 1
+    half = len(bits) / 2
+    return int("".join("1" if column.count("1") > half else "0" for column in zip(*bits)), 2)
+
+
+def image_dhash(data: bytes) -> Optional[int]:
+    """图片的差值哈希（缩放为 9x8 灰度图，比较相邻像素）；Pillow 不可用或图片无法解析时返回 None。"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            pixels = list(img.convert("L").resize((9, 8)).getdata())
+    except Exception:  # noqa: BLE001
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _image_attachments(record: Dict) -> List[Dict]:
+    from records import is_image_file
+
+    return [a for a in record.get("attachments") or [] if is_image_file(a.get("name") or "", a.get("mime"))]
+
+
+def record_signature(record: Dict) -> Tuple[str, List[int], bool]:
+    """
+    计算题目指纹，返回 (类型, 指纹列表, 是否有图片尚未缓存)。
+    类型为 text / image；没有可用内容时为 ("", [], False)。
+    """
+    h = text_simhash(record.get("handwriting_text") or "")
+    if h is not None:
+        return "text", [h], False
+    from feishu_client import read_cached_attachment
+
+    hashes: List[int] = []
+    pending = False
+    for att in _image_attachments(record):
+        data = read_cached_attachment(att.get("url") or "", att.get("file_token") or "")
+        h = image_dhash(data) if data else None
+        if h is None:
+            # 同一张图片（同一 file_token）仍能判为重复
+            pending = pending or data is None
+            h = _hash64((att.get("file_token") or att.get("url") or "").encode("utf-8"))
+        hashes.append(h)
+    return ("image", hashes, pending) if hashes else ("", [], False)
+
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _bands(h: int) -> List[int]:
+    mask = (1 << _BAND_BITS) - 1
+    return [h >> (i * _BAND_BITS) & mask for i in range(_BANDS)]
+
+
+class DuplicateIndex:
+    """题目指纹与重复簇（record_id → 簇代表的 record_id），增量维护并持久化。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # record_id -> {"v": 版本, "s": 学科, "k": 类型, "h": 指纹列表, "p": 图片未缓存, "c": 簇代表, "t": 录入时间}
+        self.entries: Dict[str, Dict] = {}
+        self._buckets: Dict[Tuple, Set[str]] = {}
+        self._clusters: Dict[str, Set[str]] = {}
+        self._loaded = False
+
+    def _bucket_keys(self, entry: Dict) -> List[Tuple]:
+        # 按第一个指纹分桶；图片题另要求图片张数相同。没有指纹的题不参与比较
+        if not entry["h"]:
+            return []
+        return [(entry["s"], entry["k"], len(entry["h"]), i, band) for i, band in enumerate(_bands(entry["h"][0]))]
+
+    def _index(self, rid: str, entry: Dict) -> None:
+        for key in self._bucket_keys(entry):
+            self._buckets.setdefault(key, set()).add(rid)
+        self._clusters.setdefault(entry["c"], set()).add(rid)
+
+    def _unindex(self, rid: str, entry: Dict) -> None:
+        for key in self._bucket_keys(entry):
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.discard(rid)
+                if not bucket:
+                    del self._buckets[key]
+        members = self._clusters.get(entry["c"])
+        if members:
+            members.discard(rid)
+            if not members:
+                del self._clusters[entry["c"]]
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        data = read_json(get_data_dir() / _INDEX_NAME)
+        if not isinstance(data, dict) or data.get("format") != _INDEX_FORMAT:
+            return
+        self.entries = data.get("entries") or {}
+        for rid, entry in self.entries.items():
+            self._index(rid, entry)
+
+    def save(self) -> None:
+        try:
+            atomic_write_json(get_data_dir() / _INDEX_NAME, {"format": _INDEX_FORMAT, "entries": self.entries})
+        except OSError:
+            pass
+
+    def _is_duplicate(self, a: Dict, b: Dict) -> bool:
+        return a["k"] == b["k"] and len(a["h"]) == len(b["h"]) and all(
+            _distance(x, y) <= MAX_DISTANCE for x, y in zip(a["h"], b["h"])
+        )
+
+    def _assign(self, rid: str, entry: Dict, old: Optional[Dict] = None) -> None:
+        """为新指纹找簇：与候选中最早录入的重复题同簇，没有则自成一簇。"""
+        matches = set()
+        for key in self._bucket_keys(entry):
+            matches.update(self._buckets.get(key, ()))
+        matches.discard(rid)
+        # 候选已按分桶筛过，这里逐一核对完整指纹
+        dups = [self.entries[m] for m in matches if self._is_duplicate(entry, self.entries[m])]
+        if dups:
+            first = min(dups, key=lambda e: (e["t"], e["c"]))
+            entry["c"] = first["c"]
+        elif rid in self._clusters and not (old and old["v"] == entry["v"]):
+            # 原来的代表题改得不再重复：原簇保留原标识，这道题另起一簇（只是补算图片指纹时保留原标识）
+            entry["c"] = f"{rid}#{entry['v']}"
+        else:
+            entry["c"] = rid
+
+    def update(self, records: Iterable[Dict]) -> Dict[str, int]:
+        """
+        按当前题库增量更新：删除已不存在的题，只为新增、修改以及图片刚被缓存的题计算指纹并归簇。
+        有变化时保存到磁盘。返回统计。
+        """
+        with self._lock, timed("dedupe.update") as m:
+            self._load()
+            current = {r["record_id"]: r for r in records if r.get("record_id")}
+            stats = {"added": 0, "removed": 0}
+            for rid in [rid for rid in self.entries if rid not in current]:
+                self._unindex(rid, self.entries.pop(rid))
+                stats["removed"] += 1
+            changed = []
+            for rid, r in current.items():
+                entry = self.entries.get(rid)
+                if entry is None or entry["v"] != r.get("version") or (entry.get("p") and self._images_cached(r)):
+                    changed.append(r)
+            # 按录入时间处理，簇代表是最早录入的那道题
+            changed.sort(key=lambda r: (r.get("created_time") or 0, r["record_id"]))
+            for r in changed:
+                rid = r["record_id"]
+                old = self.entries.pop(rid, None)
+                if old is not None:
+                    self._unindex(rid, old)
+                kind, hashes, pending = record_signature(r)
+                entry = {
+                    "v": r.get("version"),
+                    "s": r.get("subject") or "",
+                    "k": kind,
+                    "h": hashes,
+                    "p": pending,
+                    "t": r.get("created_time") or 0,
+                }
+                self._assign(rid, entry, old)
+                self.entries[rid] = entry
+                self._index(rid, entry)
+                stats["added"] += 1
+            if stats["added"] or stats["removed"]:
+                self.save()
+            stats["clusters"] = len(self._clusters)
+            m.update(**stats)
+        return stats
+
+    def _images_cached(self, record: Dict) -> bool:
+        from feishu_client import is_attachment_cached
+
+        return all(is_attachment_cached(a.get("url") or "", a.get("file_token") or "") for a in _image_attachments(record))
+
+    def cluster_of(self, record_id: str) -> str:
+        """该题所在簇的代表 record_id；未收录的题自成一簇。"""
+        with self._lock:
+            self._load()
+            entry = self.entries.get(record_id)
+        return entry["c"] if entry else record_id
+
+    def members(self, record_id: str) -> List[Tuple[str, str]]:
+        """与该题同簇的其他题 [(record_id, 版本)]，代表排在最前。"""
+        with self._lock:
+            self._load()
+            entry = self.entries.get(record_id)
+            if not entry:
+                return []
+            cluster = entry["c"]
+            others = [(rid, self.entries[rid]) for rid in self._clusters.get(cluster, ()) if rid != record_id]
+        others.sort(key=lambda item: (item[0] != cluster, item[1]["t"]))
+        return [(rid, e["v"]) for rid, e in others]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._load()
+            return {
+                "records": len(self.entries),
+                "clusters": len(self._clusters),
+                "duplicates": len(self.entries) - len(self._clusters),
+            }
+
+
+_index: Optional[DuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
+
+
+def question_cluster(question: Dict) -> Optional[str]:
+    """题目所在重复簇的标识；没有 record_id 的题（如生成的类似题）返回 None。"""
+    rid = (question.get("record_id") or "").strip()
+    return get_duplicate_index().cluster_of(rid) if rid else None
+
+
+def dedupe_questions(questions: List[Dict], exclude: Optional[Set[str]] = None) -> List[Dict]:
+    """每个重复簇只保留第一道题（保持原顺序），并排除 exclude 中的簇（如其他知识点已选用的）。"""
+    seen = set(exclude or ())
+    result = []
+    for q in questions:
+        cluster = question_cluster(q)
+        if cluster is not None:
+            if cluster in seen:
+                continue
+            seen.add(cluster)
+        result.append(q)
+    return result
@@ -0,0 +1,217 @@
+"""
+飞书多维表格记录变更事件接入：错题表新增、修改、删除一条记录时，飞书把变更推送过来，
+本模块只拉取变化的几条记录，直接应用到进程内题库（record_store）、索引与快照，并清理这些题目的片段、类似题缓存，
+不必为发现一道新错题而轮询整张表。事件服务启动后，整表轮询降为兜底（RECORDS_FALLBACK_TTL_SECONDS，默认 30 分钟）。
+
+事件服务与 /metrics 一样在后台线程运行：设置 EVENTS_PORT 时在该端口监听 POST /feishu/events。
+配置步骤：飞书开发者后台「事件与回调」的请求地址填 http://<主机>:<端口>/feishu/events，
+添加事件「多维表格记录变更」（drive.file.bitable_record_changed_v1），再执行一次 python cli.py subscribe 订阅该多维表格。
+设置 FEISHU_EVENT_TOKEN（Verification Token）时校验请求中的 token；不支持加密推送（Encrypt Key 需留空）。
+事件可以改写、删除题库中的记录：默认只监听本机（EVENTS_HOST=127.0.0.1，由反向代理转发）；
+监听其他地址（如 0.0.0.0）必须配置 FEISHU_EVENT_TOKEN，否则不启动。
+
+飞书要求 3 秒内响应，收到的事件先入队立即返回，由后台线程批量处理；同一事件重复推送只处理一次。
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import timed
+
+EVENT_TYPE = "drive.file.bitable_record_changed_v1"
+EVENTS_PATH = "/feishu/events"
+
+# 记住最近处理过的 event_id，飞书超时重推时去重
+_SEEN_LIMIT = 2000
+
+_lock = threading.Lock()
+_queue: "queue.Queue[Dict]" = queue.Queue()
+_seen: "OrderedDict[str, None]" = OrderedDict()
+_server = None
+_stats: Dict[str, Any] = {"received": 0, "duplicates": 0, "applied": 0, "deleted": 0, "failed": 0, "last_event_at": 0.0, "last_error": ""}
+
+
+def _verification_token() -> str:
+    return os.getenv("FEISHU_EVENT_TOKEN", "")
+
+
+def handle_callback(payload: Dict) -> Tuple[int, Dict]:
+    """处理一次事件推送，返回 (HTTP 状态码, 响应体)。记录变更事件入队后由后台线程处理。"""
+    if "encrypt" in payload:
+        return 400, {"msg": "不支持加密推送，请在飞书开发者后台清空 Encrypt Key"}
+    header = payload.get("header") or {}
+    expected = _verification_token()
+    if expected and (header.get("token") or payload.get("token")) != expected:
+        return 403, {"msg": "token 校验失败"}
+    if payload.get("type") == "url_verification":
+        return 200, {"challenge": payload.get("challenge")}
+    if header.get("event_type") != EVENT_TYPE:
+        return 200, {}
+    event_id = header.get("event_id") or ""
+    with _lock:
+        _stats["received"] += 1
+        if event_id:
+            if event_id in _seen:
+                _stats["duplicates"] += 1
+                return 200, {}
+            _seen[event_id] = None
+            while len(_seen) > _SEEN_LIMIT:
+                _seen.popitem(last=False)
+    _queue.put(payload.get("event") or {})
+    return 200, {}
+
+
+def _collect_changes(events: List[Dict], table_id: str) -> Tuple[List[str], List[str]]:
+    """把一批事件合并为 (需要重新读取的 record_id, 已删除的 record_id)，同一记录以最后一次动作为准。"""
+    from feishu_client import APP_TOKEN
+
+    last_action: Dict[str, str] = {}
+    for event in events:
+        if event.get("table_id") != table_id:
+            continue
+        if event.get("file_token") and event["file_token"] != APP_TOKEN:
+            continue
+        for action in event.get("action_list") or []:
+            rid = action.get("record_id")
+            if rid:
+                last_action[rid] = action.get("action") or ""
+    deleted = [rid for rid, action in last_action.items() if action == "record_deleted"]
+    changed = [rid for rid, action in last_action.items() if action != "record_deleted"]
+    return changed, deleted
+
+
+def apply_record_events(token: str, events: List[Dict]) -> Dict[str, int]:
+    """
+    把一批记录变更事件应用到进程内题库：新增、修改的记录按 record_id 重新读取并解析，删除的直接移除；
+    被替换、删除的旧记录清理其片段与类似题缓存，最后保存一次快照。返回统计。
+    """
+    from exporters import drop_cached_fragments
+    from feishu_client import fetch_records_by_ids
+    from llm import drop_similar_from_store
+    from record_store import get_record_store
+    from records import parse_records
+
+    store = get_record_store()
+    changed, deleted = _collect_changes(events, store.table_id)
+    if not changed and not deleted:
+        return {"changed": 0, "deleted": 0}
+    with timed("events.apply", changed=len(changed), deleted=len(deleted)):
+        upserts = parse_records(fetch_records_by_ids(token, changed)) if changed else []
+        # 读取时已被删除的记录按删除处理
+        found = {r["record_id"] for r in upserts}
+        deleted = deleted + [rid for rid in changed if rid not in found]
+        old = store.apply_changes(upserts, deleted)
+        versions = {r["record_id"]: r.get("version") for r in upserts}
+        for r in old:
+            if versions.get(r.get("record_id")) != r.get("version"):
+                drop_cached_fragments(r)
+                drop_similar_from_store(r)
+        if old or upserts:
+            store.save_snapshot()
+    return {"changed": len(upserts), "deleted": len(deleted)}
+
+
+def _worker() -> None:
+    from offline import background_token
+
+    while True:
+        events = [_queue.get()]
+        # 一起处理已经排队的事件（批量编辑时飞书会连续推送很多条）
+        while True:
+            try:
+                events.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            token = background_token()
+            if not token:
+                raise RuntimeError("尚未获得飞书访问令牌")
+            result = apply_record_events(token, events)
+        except Exception as exc:  # noqa: BLE001
+            with _lock:
+                _stats["failed"] += len(events)
+                _stats["last_error"] = str(exc)[:300]
+            # 处理不了的变更交给整表同步：让题库按过期处理
+            from record_store import get_record_store
+
+            get_record_store().mark_stale()
+            continue
+        with _lock:
+            _stats["applied"] += result["changed"]
+            _stats["deleted"] += result["deleted"]
+            _stats["last_event_at"] = time.time()
+
+
+def event_stats() -> Dict[str, Any]:
+    with _lock:
+        return dict(_stats, queued=_queue.qsize(), running=_server is not None)
+
+
+def _is_loopback(host: str) -> bool:
+    import ipaddress
+
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def start_event_server(port: Optional[int] = None, host: Optional[str] = None) -> bool:
+    """
+    在后台线程启动事件接收服务（进程内只启动一次）。端口默认取 EVENTS_PORT，未设置时不启动；
+    地址默认取 EVENTS_HOST（默认 127.0.0.1），非本机地址且未配置 FEISHU_EVENT_TOKEN 时不启动。
+    启动后整表轮询改为兜底间隔。端口被占用等启动失败时静默返回 False。
+    """
+    global _server
+    port = port if port is not None else int(os.getenv("EVENTS_PORT") or 0)
+    if not port:
+        return False
+    host = host or os.getenv("EVENTS_HOST", "127.0.0.1")
+    if not _is_loopback(host) and not _verification_token():
+        # 不校验 token 的事件服务不对外开放：任何人都能借它改写题库
+        with _lock:
+            _stats["last_error"] = f"EVENTS_HOST={host} 不是本机地址，需配置 FEISHU_EVENT_TOKEN 才能启动事件服务"
+        return False
+    with _lock:
+        if _server is not None:
+            return True
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?")[0] != EVENTS_PATH:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+                except ValueError:
+                    payload = None
+                status, body = handle_callback(payload) if isinstance(payload, dict) else (400, {"msg": "invalid json"})
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError:
+            return False
+        _server.daemon_threads = True
+    from record_store import enable_event_updates
+
+    enable_event_updates()
+    threading.Thread(target=_server.serve_forever, name="events-server", daemon=True).start()
+    threading.Thread(target=_worker, name="events-worker", daemon=True).start()
+    return True
@@ -0,0 +1,168 @@
+"""
+后台导出任务：在线程池中生成试卷，任务状态与生成结果保存到磁盘。
+
+页面只负责提交任务和展示进度，生成过程不阻塞 Streamlit 脚本线程；
+离开页面、刷新或换一个会话后，仍可从任务列表下载已完成的文件。
+"""
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from metrics import record as record_metric
+from storage import atomic_write_bytes, atomic_write_json, get_data_dir, read_json
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 任务函数签名：work(report) -> 文件内容；report(进度0~1, 说明文字)
+ProgressReporter = Callable[[float, str], None]
+JobWork = Callable[[ProgressReporter], bytes]
+
+_ARTIFACT_NAME = "artifact.bin"
+_STATE_NAME = "job.json"
+
+
+class ExportJobManager:
+    """导出任务管理器：提交、执行、查询、读取结果。"""
+
+    def __init__(self, root: Path, max_workers: int = 2, keep_jobs: int = 50):
+        self.root = root
+        self.keep_jobs = keep_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export-job")
+        self._lock = threading.Lock()
+        self._active: set = set()
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def _save_state(self, state: Dict) -> None:
+        atomic_write_json(self._job_dir(state["job_id"]) / _STATE_NAME, state)
+
+    def _update(self, job_id: str, **changes) -> None:
+        with self._lock:
+            state = read_json(self._job_dir(job_id) / _STATE_NAME) or {"job_id": job_id}
+            state.update(changes)
+            state["updated_at"] = time.time()
+            self._save_state(state)
+
+    def submit(self, title: str, filename: str, mime: str, work: JobWork, extra: Optional[Dict] = None) -> str:
+        """提交一个导出任务，立即返回 job_id。extra 中的字段原样保存在任务状态里（如重试所需的组卷参数）。"""
+        job_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        now = time.time()
+        state = {
+            "job_id": job_id,
+            "title": title,
+            "filename": filename,
+            "mime": mime,
+            "status": JOB_PENDING,
+            "progress": 0.0,
+            "message": "排队中...",
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "size": 0,
+        }
+        state.update(extra or {})
+        with self._lock:
+            self._save_state(state)
+            self._active.add(job_id)
+        self._prune()
+        self._executor.submit(self._run, job_id, work)
+        return job_id
+
+    def _run(self, job_id: str, work: JobWork) -> None:
+        started = time.time()
+        self._update(job_id, status=JOB_RUNNING, message="开始生成...", started_at=started)
+
+        def report(progress: float, message: str = "") -> None:
+            self._update(job_id, progress=max(0.0, min(1.0, float(progress))), message=message)
+
+        try:
+            data = work(report)
+            atomic_write_bytes(self._job_dir(job_id) / _ARTIFACT_NAME, data)
+            record_metric("export.job", time.time() - started, len(data))
+            self._update(
+                job_id,
+                status=JOB_DONE,
+                progress=1.0,
+                message="生成完成",
+                size=len(data),
+                finished_at=time.time(),
+                duration=time.time() - started,
+            )
+        except Exception as exc:  # noqa: BLE001
+            record_metric("export.job", time.time() - started, error=True)
+            self._update(
+                job_id,
+                status=JOB_FAILED,
+                message="生成失败",
+                error=str(exc) or traceback.format_exc(limit=1),
+                finished_at=time.time(),
+                duration=time.time() - started,
+            )
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """读取任务状态；上次进程退出时未完成的任务标记为失败。"""
+        state = read_json(self._job_dir(job_id) / _STATE_NAME)
+        if not state:
+            return None
+        if state.get("status") in (JOB_PENDING, JOB_RUNNING) and job_id not in self._active:
+            state["status"] = JOB_FAILED
+            state["message"] = "生成失败"
+            state["error"] = "服务已重启，任务中断，请重新生成"
+        return state
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """按创建时间倒序列出任务。"""
+        if not self.root.exists():
+            return []
+        ids = sorted((p.name for p in self.root.iterdir() if p.is_dir()), reverse=True)
+        jobs = []
+        for job_id in ids[:limit]:
+            state = self.get(job_id)
+            if state:
+                jobs.append(state)
+        return jobs
+
+    def read_artifact(self, job_id: str) -> Optional[bytes]:
+        """读取已完成任务的文件内容。"""
+        try:
+            return (self._job_dir(job_id) / _ARTIFACT_NAME).read_bytes()
+        except OSError:
+            return None
+
+    def delete(self, job_id: str) -> None:
+        """删除任务及其文件（运行中的任务不删除）。"""
+        if job_id in self._active:
+            return
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def _prune(self) -> None:
+        """只保留最近 keep_jobs 个任务。"""
+        ids = sorted((p.name for p in self.root.iterdir() if p.is_dir()), reverse=True)
+        for job_id in ids[self.keep_jobs:]:
+            self.delete(job_id)
+
+
+_manager: Optional[ExportJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> ExportJobManager:
+    """获取进程内共享的任务管理器（所有 Streamlit 会话共用同一个线程池）。"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ExportJobManager(get_data_dir("jobs"))
+        return _manager
@@ -0,0 +1,372 @@
+"""
+试卷导出：单题片段缓存、原题试卷成品缓存，以及 Word/HTML 组卷。
+python-docx 与 Pillow 只在真正导出时导入。
+"""
+import base64
+import hashlib
+import html
+import io
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from feishu_client import fetch_attachment_cached, prefetch_attachments
+from records import is_image_file, record_version
+from storage import DiskCache
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# 原题试卷成品缓存：相同的题目集合（含各题版本）与格式直接复用已生成的文件
+_artifact_cache = DiskCache("artifacts", max_bytes=300 * 1024 * 1024)
+# 单题片段缓存：每道题按记录版本渲染一次，组卷时直接拼接
+_fragment_cache = DiskCache("fragments", max_bytes=200 * 1024 * 1024)
+# 规范化后的图片，按内容哈希存放，多道题引用同一图片时只存一份
+_asset_cache = DiskCache("assets", max_bytes=500 * 1024 * 1024)
+
+# 片段格式版本：渲染逻辑变化时递增，使旧片段自然失效
+_FRAGMENT_FORMAT = 1
+# 规范化图片的最大宽度（像素），Word 中按 5.5 英寸显示，更大的分辨率没有意义
+_MAX_IMAGE_WIDTH = 1600
+
+
+def selection_fingerprint(subjects: List[str], selections: Dict[str, List[Dict]], fmt: str) -> str:
+    """
+    计算试卷选题指纹：学科、各知识点下的题目 record_id 及其版本、导出格式。
+    同一知识点内的题目顺序不影响指纹；任一题目或附件变化会改变其版本，从而使缓存自然失效。
+    """
+    sections = []
+    for kp, questions in selections.items():
+        if not questions:
+            continue
+        items = sorted([q.get("record_id") or "", q.get("version") or record_version(q)] for q in questions)
+        sections.append([kp, items])
+    raw = json.dumps({"fmt": fmt, "subjects": list(subjects), "sections": sections}, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached_artifact(fingerprint: str) -> Optional[bytes]:
+    """读取已生成的试卷文件，未命中返回 None。"""
+    return _artifact_cache.get(fingerprint)
+
+
+def put_cached_artifact(fingerprint: str, data: bytes) -> None:
+    _artifact_cache.put(fingerprint, data)
+
+
+def _normalize_image(data: bytes, content_type: str) -> Tuple[bytes, str]:
+    """
+    规范化图片：按 EXIF 方向摆正、限制最大宽度，非 PNG/JPEG 格式（如 webp，Word 不支持）转为 PNG。
+    未安装 Pillow 或图片无法识别时原样返回。
+    """
+    mime = content_type.split(";")[0].strip() if content_type and "image" in content_type else "image/png"
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return data, mime
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        orientation = img.getexif().get(0x0112, 1)
+        if fmt in ("PNG", "JPEG") and img.width <= _MAX_IMAGE_WIDTH and orientation == 1:
+            return data, "image/png" if fmt == "PNG" else "image/jpeg"
+        img = ImageOps.exif_transpose(img)
+        if img.width > _MAX_IMAGE_WIDTH:
+            img.thumbnail((_MAX_IMAGE_WIDTH, _MAX_IMAGE_WIDTH * 10))
+        out = io.BytesIO()
+        if fmt == "JPEG":
+            img.convert("RGB").save(out, "JPEG", quality=90)
+            return out.getvalue(), "image/jpeg"
+        if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            img = img.convert("RGBA")
+        img.save(out, "PNG")
+        return out.getvalue(), "image/png"
+    except Exception:  # noqa: BLE001
+        return data, mime
+
+
+def _fragment_key(q: Dict, fmt: str) -> Optional[str]:
+    """单题片段的缓存键；没有 record_id 的题目（如 AI 生成的类似题）不缓存。"""
+    record_id = (q.get("record_id") or "").strip()
+    if not record_id:
+        return None
+    version = q.get("version") or record_version(q)
+    raw = f"{_FRAGMENT_FORMAT}:{fmt}:{record_id}:{version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def drop_cached_fragments(q: Dict) -> None:
+    """删除一道题（该版本）的 Word/HTML 片段缓存；题目被修改或删除时调用，不必等容量淘汰。"""
+    for fmt in ("docx", "html"):
+        key = _fragment_key(q, fmt)
+        if key:
+            _fragment_cache.delete(key)
+
+
+def _reason_text(q: Dict) -> str:
+    return f"{q.get('reason_type') or ''} {q.get('reason_detail') or ''}".strip()
+
+
+def _render_docx_fragment(q: Dict, token: str) -> Dict:
+    """
+    将一道题渲染为 Word 中间片段：按顺序排列的文本/图片块，图片已下载、规范化并按内容哈希入库。
+    返回 {"blocks": [...], "note": 错因备注或 None, "errors": [...]}。
+    """
+    blocks: List[Dict] = []
+    errors: List[str] = []
+    attachments = q.get("attachments") or []
+    handwriting_text = (q.get("handwriting_text") or "").strip()
+
+    if attachments:
+        for att in attachments:
+            url = att.get("url")
+            name = att.get("name") or "附件"
+            if not url:
+                continue
+            if not is_image_file(name, att.get("mime")):
+                blocks.append({"type": "link", "name": name, "url": url})
+                continue
+            data, content_type, error = fetch_attachment_cached(url, token, name, att.get("file_token") or "")
+            if not data:
+                error = error or f"[附件处理失败] {name}"
+                blocks.append({"type": "error", "text": error})
+                errors.append(error)
+                continue
+            data, mime = _normalize_image(data, content_type)
+            asset = hashlib.sha256(data).hexdigest()
+            _asset_cache.put(asset, data)
+            blocks.append({"type": "image", "asset": asset, "mime": mime, "name": name})
+    elif handwriting_text:
+        blocks.append({"type": "text", "text": handwriting_text})
+    else:
+        blocks.append({"type": "text", "text": "（无题干）"})
+
+    note = None
+    if q.get("reason_type") or q.get("reason_detail"):
+        note = f"错因：{q.get('reason_type') or ''} {q.get('reason_detail') or ''}".strip()
+    return {"blocks": blocks, "note": note, "errors": errors}
+
+
+def _docx_fragment(q: Dict, token: str) -> Dict:
+    """获取一道题的 Word 片段：优先读缓存（且引用的图片仍在），否则渲染并缓存。"""
+    key = _fragment_key(q, "docx")
+    if key:
+        cached = _fragment_cache.get_json(key)
+        if cached and all(_asset_cache.contains(b["asset"]) for b in cached["blocks"] if b["type"] == "image"):
+            return cached
+    fragment = _render_docx_fragment(q, token)
+    # 有附件下载失败的片段不缓存，下次重试
+    if key and not fragment["errors"]:
+        _fragment_cache.put_json(key, fragment)
+    return fragment
+
+
+def _html_fragment(q: Dict, token: str) -> Dict:
+    """
+    获取一道题的 HTML 片段：题目内容与错因两段 HTML，图片已内联为 data URI。
+    由 Word 片段转换而来，因此同一道题的图片在两种格式间只下载一次。
+    """
+    key = _fragment_key(q, "html")
+    if key:
+        cached = _fragment_cache.get_json(key)
+        if cached:
+            return cached
+
+    docx_fragment = _docx_fragment(q, token)
+    errors = list(docx_fragment["errors"])
+    lines: List[str] = []
+    for block in docx_fragment["blocks"]:
+        kind = block["type"]
+        if kind == "image":
+            data = _asset_cache.get(block["asset"])
+            if data is None:
+                text = f"[图片加载失败] {block['name']}"
+                lines.append(f"            <p class='error-note'>{html.escape(text)}</p>")
+                errors.append(text)
+                continue
+            img_base64 = base64.b64encode(data).decode("utf-8")
+            lines.append(f"            <img src='data:{block['mime']};base64,{img_base64}' alt='{html.escape(block['name'])}' />")
+        elif kind == "link":
+            lines.append(f"            <p>附件：<a href='{block['url']}' target='_blank'>{block['name']}</a></p>")
+        elif kind == "error":
+            lines.append(f"            <p class='error-note'>{html.escape(block['text'])}</p>")
+        else:
+            escaped_text = html.escape(block["text"])
+            lines.append(f"            <div>{escaped_text.replace(chr(10), '<br>')}</div>")
+
+    reason = _reason_text(q)
+    fragment = {
+        "content": "\n".join(lines),
+        "reason": f"        <div class='reason'>错因：{html.escape(reason)}</div>" if reason else "",
+        "errors": errors,
+    }
+    if key and not errors:
+        _fragment_cache.put_json(key, fragment)
+    return fragment
+
+
+def _prefetch_images(selections: Dict[str, List[Dict]], token: str, fmt: str) -> None:
+    """
+    拼接前并发下载尚无 fmt 格式缓存片段的题目的图片（见 feishu_client.prefetch_attachments），
+    逐题渲染时图片都已在磁盘缓存中，导出耗时不再是各张图片下载时间之和。
+    """
+    attachments: List[Dict] = []
+    for questions in selections.values():
+        for q in questions:
+            key = _fragment_key(q, fmt)
+            if not (key and _fragment_cache.contains(key)):
+                attachments.extend(q.get("attachments") or [])
+    if attachments:
+        prefetch_attachments(attachments, token)
+
+
+def _add_docx_text(doc, para, text: str, italic: bool, first: bool) -> None:
+    """写入一段文字：第一块放进编号段落，其余另起段落。"""
+    if first:
+        r = para.add_run(text)
+        r.italic = italic
+    else:
+        p = doc.add_paragraph(text)
+        if italic and p.runs:
+            p.runs[0].italic = True
+
+
+def build_doc(
+    subjects: List[str],
+    selections: Dict[str, List[Dict]],
+    token: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    errors: Optional[List[str]] = None,
+) -> bytes:
+    """
+    根据选择生成 Word 文档二进制内容：每道题取（或生成）缓存的单题片段，再按试卷结构拼接。
+    on_progress(已完成题数, 总题数) 在每道题写入后回调，用于后台任务显示进度；
+    传入 errors 列表时，附件下载/插入失败的说明会追加到其中。
+    """
+    from docx import Document
+    from docx.shared import Inches
+
+    _prefetch_images(selections, token, "docx")
+    doc = Document()
+    title = "、".join(subjects) if subjects else "错题"
+    doc.add_heading(f"{title} 错题专项训练", 0)
+    total_questions = sum(len(qs) for qs in selections.values())
+    done_questions = 0
+
+    for kp, questions in selections.items():
+        # 跳过空列表（生成失败的题目）
+        if not questions:
+            continue
+        doc.add_heading(kp, level=1)
+        for q in questions:
+            fragment = _docx_fragment(q, token)
+            if errors is not None:
+                errors.extend(fragment["errors"])
+
+            # 使用 List Number 编号；第一块内容放入 para，避免空编号
+            para = doc.add_paragraph(style="List Number")
+            first = True
+            for block in fragment["blocks"]:
+                kind = block["type"]
+                if kind == "image":
+                    image_data = _asset_cache.get(block["asset"])
+                    try:
+                        if image_data is None:
+                            raise ValueError("图片缓存缺失")
+                        image_stream = io.BytesIO(image_data)
+                        if first:
+                            para.add_run().add_picture(image_stream, width=Inches(5.5))
+                        else:
+                            doc.add_picture(image_stream, width=Inches(5.5))
+                    except Exception as img_exc:  # noqa: BLE001
+                        text = f"附件：{block['name']}（图片插入失败：{img_exc}）"
+                        if errors is not None:
+                            errors.append(text)
+                        _add_docx_text(doc, para, text, True, first)
+                elif kind == "link":
+                    text = f"附件：{block['name']}（非图片，下载链接：{block['url']}）"
+                    _add_docx_text(doc, para, text, True, first)
+                else:
+                    _add_docx_text(doc, para, block["text"], False, first)
+                first = False
+
+            # 追加备注信息，便于回顾错因
+            if fragment.get("note"):
+                doc.add_paragraph(fragment["note"]).italic = True
+
+            done_questions += 1
+            if on_progress:
+                on_progress(done_questions, total_questions)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+def build_html(
+    subjects: List[str],
+    selections: Dict[str, List[Dict]],
+    token: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    errors: Optional[List[str]] = None,
+) -> str:
+    """
+    根据选择生成 HTML 文档内容：每道题取（或生成）缓存的单题片段，再按试卷结构拼接。
+    on_progress(已完成题数, 总题数) 在每道题写入后回调，用于后台任务显示进度；
+    传入 errors 列表时，附件下载失败的说明会追加到其中。
+    """
+    _prefetch_images(selections, token, "html")
+    title = "、".join(subjects) if subjects else "错题"
+    total_questions = sum(len(qs) for qs in selections.values())
+    done_questions = 0
+    
+    html_parts = [
+        "<!DOCTYPE html>",
+        "<html lang='zh-CN'>",
+        "<head>",
+        "    <meta charset='UTF-8'>",
+        "    <meta name='viewport' content='width=device-width, initial-scale=1.0'>",
+        f"    <title>{title} 错题专项训练</title>",
+        "    <style>",
+        "        body { font-family: 'Microsoft YaHei', Arial, sans-serif; line-height: 1.6; padding: 20px; max-width: 1200px; margin: 0 auto; }",
+        "        h1 { color: #333; border-bottom: 3px solid #4CAF50; padding-bottom: 10px; }",
+        "        h2 { color: #555; margin-top: 30px; border-left: 5px solid #2196F3; padding-left: 15px; }",
+        "        .question { margin: 20px 0; padding: 15px; background: #f9f9f9; border-radius: 5px; }",
+        "        .question-number { font-weight: bold; color: #2196F3; margin-right: 10px; }",
+        "        .question-content { margin: 10px 0; }",
+        "        .question-content img { max-width: 100%; height: auto; margin: 10px 0; border: 1px solid #ddd; border-radius: 5px; }",
+        "        .reason { font-style: italic; color: #666; margin-top: 10px; padding-left: 20px; }",
+        "        .error-note { color: #ff9800; font-size: 0.9em; }",
+        "    </style>",
+        "</head>",
+        "<body>",
+        f"    <h1>{title} 错题专项训练</h1>",
+    ]
+    
+    for kp, questions in selections.items():
+        # 跳过空列表（生成失败的题目）
+        if not questions:
+            continue
+        html_parts.append(f"    <h2>{kp}</h2>")
+        
+        for idx, q in enumerate(questions, start=1):
+            fragment = _html_fragment(q, token)
+            if errors is not None:
+                errors.extend(fragment["errors"])
+            html_parts.append("    <div class='question'>")
+            html_parts.append(f"        <div class='question-number'>{idx}.</div>")
+            html_parts.append("        <div class='question-content'>")
+            if fragment["content"]:
+                html_parts.append(fragment["content"])
+            html_parts.append("        </div>")
+            if fragment["reason"]:
+                html_parts.append(fragment["reason"])
+            html_parts.append("    </div>")
+            done_questions += 1
+            if on_progress:
+                on_progress(done_questions, total_questions)
+    
+    html_parts.extend([
+        "</body>",
+        "</html>"
+    ])
+    
+    return "\n".join(html_parts)
@@ -0,0 +1,672 @@
+"""
+飞书开放平台客户端：获取访问令牌、拉取错题表与练习记录表、写入练习记录、下载附件。
+
+本模块不依赖 Streamlit，可在命令行、后台任务中直接使用。
+请求经 aio.http 发出（安装了 httpx 时共用异步 I/O 引擎的连接池，见 aio.py），requests / httpx 按需导入，导入本模块本身几乎没有开销。
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import aio
+from metrics import count_cache, record as record_metric, timed
+from offline import is_network_error, is_offline, note_network_error
+from records import P_FIELD_COUNT, P_FIELD_LAST, P_FIELD_MASTERY, P_FIELD_NEXT, P_FIELD_RID, is_image_file
+from storage import DiskCache
+
+# 飞书多维表格配置（支持环境变量覆盖；FEISHU_API_BASE 可指向本地模拟服务，见 tools/standin_server.py）
+API_BASE = os.getenv("FEISHU_API_BASE", "https://open.feishu.cn/open-apis").rstrip("/")
+APP_TOKEN = os.getenv("FEISHU_APP_TOKEN", "NO9nbcpjraKeUCsSQkBcHL9gnhh")
+TABLE_ID = os.getenv("FEISHU_TABLE_ID", "tblchSd315sqHTCt")
+
+# 整表同步的并发分片数（1 为逐页顺序拉取）与飞书接口每秒请求上限（多维表格检索接口约 20 次/秒）
+FULL_SYNC_WORKERS = int(os.getenv("FEISHU_SYNC_WORKERS", "4"))
+FEISHU_RATE_LIMIT = float(os.getenv("FEISHU_RATE_LIMIT", "15"))
+# 异步 I/O 引擎预下载附件的并发数
+PREFETCH_CONCURRENCY = int(os.getenv("FEISHU_PREFETCH_CONCURRENCY", "32"))
+
+# tenant_access_token 有效期 2 小时，进程内缓存 50 分钟（离线优先时最长沿用到 110 分钟）
+_TOKEN_TTL = 50 * 60
+_TOKEN_MAX_AGE = 110 * 60
+_token_cache: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_token_lock = threading.Lock()
+
+# 附件原始内容的磁盘缓存：按 file_token（没有时按下载地址）存放，多进程、多会话共用
+_attachment_cache = DiskCache("attachments", max_bytes=500 * 1024 * 1024)
+
+
+def get_tenant_access_token(app_id: str, app_secret: str) -> str:
+    """
+    获取 tenant_access_token，用于后续调用多维表格接口（进程内缓存，所有会话共用）。
+    """
+    key = (app_id, app_secret)
+    with _token_lock:
+        cached = _token_cache.get(key)
+        if cached and time.time() - cached[1] < _TOKEN_TTL:
+            return cached[0]
+    url = f"{API_BASE}/auth/v3/tenant_access_token/internal/"
+    with timed("feishu.token"):
+        resp = aio.http("POST", url, json={"app_id": app_id, "app_secret": app_secret}, timeout=10)
+        resp.raise_for_status()
+        data = resp.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"获取 tenant_access_token 失败: {data}")
+    with _token_lock:
+        _token_cache[key] = (data["tenant_access_token"], time.time())
+    return data["tenant_access_token"]
+
+
+def peek_tenant_access_token(app_id: str, app_secret: str) -> Optional[str]:
+    """返回仍在有效期内的缓存令牌（不发请求），没有返回 None；到期前的刷新由后台同步线程负责。"""
+    with _token_lock:
+        cached = _token_cache.get((app_id, app_secret))
+    if cached and time.time() - cached[1] < _TOKEN_MAX_AGE:
+        return cached[0]
+    return None
+
+
+def _search_url() -> str:
+    return f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records/search"
+
+
+def _search_payload(page_token: Optional[str], record_filter: Optional[Dict[str, Any]]) -> Dict[str, object]:
+    # automatic_fields：返回 created_time 等系统字段（分片结果按创建时间合并、重复簇取最早录入的题都依赖它）
+    payload: Dict[str, object] = {"page_size": 100, "automatic_fields": True}
+    if page_token:
+        payload["page_token"] = page_token
+    if record_filter:
+        payload["filter"] = record_filter
+    return payload
+
+
+def _search_page(resp) -> Tuple[List[Dict], Optional[str]]:
+    """解析一页检索结果，返回 (记录, 下一页的 page_token)；没有下一页时 page_token 为 None。"""
+    if not resp.ok:
+        # 返回更友好的错误信息，便于排查 token/table 权限问题
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise RuntimeError(f"拉取记录失败 HTTP {resp.status_code}: {detail}")
+    data = resp.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"拉取记录失败: {data}")
+    items = data["data"].get("items", [])
+    return items, data["data"].get("page_token") if data["data"].get("has_more") else None
+
+
+def _search_records(token: str, record_filter: Optional[Dict[str, Any]] = None, limiter: Optional["RateLimiter"] = None) -> List[Dict]:
+    """按筛选条件（为空时整表）分页拉取错题表记录；limiter 用于多个分片并发拉取时共同限速。"""
+    headers = {"Authorization": f"Bearer {token}"}
+    page_token = None
+    records: List[Dict] = []
+
+    while True:
+        if limiter:
+            limiter.acquire()
+        with timed("feishu.records_page") as m:
+            resp = aio.http("POST", _search_url(), headers=headers, json=_search_payload(page_token, record_filter), timeout=10)
+            m.update(bytes=len(resp.content), error=not resp.ok)
+        items, page_token = _search_page(resp)
+        records.extend(items)
+        if not page_token:
+            break
+
+    return records
+
+
+async def _search_records_async(token: str, record_filter: Optional[Dict[str, Any]], limiter: "aio.AsyncRateLimiter") -> List[Dict]:
+    """_search_records 的协程版本（异步 I/O 引擎中各分片并发翻页）。"""
+    headers = {"Authorization": f"Bearer {token}"}
+    page_token = None
+    records: List[Dict] = []
+
+    while True:
+        await limiter.acquire()
+        with timed("feishu.records_page") as m:
+            resp = await aio.request("POST", _search_url(), headers=headers, json=_search_payload(page_token, record_filter), timeout=10)
+            m.update(bytes=len(resp.content), error=not resp.ok)
+        items, page_token = _search_page(resp)
+        records.extend(items)
+        if not page_token:
+            break
+
+    return records
+
+
+class RateLimiter:
+    """令牌桶限速：acquire() 在超出每秒请求数时等待。rate<=0 表示不限速。"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = max(rate, 1.0)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def fetch_field_options(token: str, field_name: str) -> List[str]:
+    """读取错题表中单选/多选字段的选项名；字段不存在或不是选项字段时返回空列表。"""
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/fields"
+    headers = {"Authorization": f"Bearer {token}"}
+    resp = aio.http("GET", url, headers=headers, params={"page_size": 100}, timeout=10)
+    if not resp.ok:
+        return []
+    try:
+        data = resp.json()
+    except ValueError:
+        return []
+    if not isinstance(data, dict) or data.get("code") != 0:
+        return []
+    for field in (data.get("data") or {}).get("items") or []:
+        if field.get("field_name") == field_name:
+            options = (field.get("property") or {}).get("options") or []
+            return [o["name"] for o in options if o.get("name")]
+    return []
+
+
+def _subject_partitions(subjects: List[str]) -> List[Dict[str, Any]]:
+    """按 学科 把错题表分成互不相交的分片：每个学科一片，再加一片「不属于这些学科」（含学科为空）兜底。"""
+    partitions: List[Dict[str, Any]] = [
+        {"conjunction": "and", "conditions": [{"field_name": "学科", "operator": "is", "value": [s]}]}
+        for s in subjects
+    ]
+    partitions.append({
+        "conjunction": "and",
+        "conditions": [{"field_name": "学科", "operator": "isNot", "value": [s]} for s in subjects],
+    })
+    return partitions
+
+
+def fetch_records(token: str, subjects: Optional[List[str]] = None, max_workers: int = FULL_SYNC_WORKERS) -> List[Dict]:
+    """
+    拉取表格全部记录，自动翻页。
+    指定 subjects（学科列表）且 max_workers > 1 时按学科分片并发拉取（另加一片兜底其他学科），
+    各分片共用 FEISHU_RATE_LIMIT 限速，结果按 record_id 合并，顺序按创建时间排列。
+    异步 I/O 引擎启用时所有分片在事件循环中同时翻页，不受 max_workers 线程数限制。
+    """
+    if not subjects or max_workers <= 1:
+        return _search_records(token)
+
+    partitions = _subject_partitions(sorted(set(subjects)))
+    merged: Dict[str, Dict] = {}
+    with timed("feishu.records_sharded", shards=len(partitions), engine="async" if aio.enabled() else "threads"):
+        if aio.enabled():
+            shards = aio.run_sync(_fetch_partitions_async(token, partitions))
+        else:
+            limiter = RateLimiter(FEISHU_RATE_LIMIT)
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(partitions)), thread_name_prefix="sync-shard") as pool:
+                shards = list(pool.map(lambda f: _search_records(token, f, limiter), partitions))
+        for items in shards:
+            for item in items:
+                merged.setdefault(item.get("record_id") or f"_{len(merged)}", item)
+    return sorted(merged.values(), key=lambda it: (int(it.get("created_time") or 0), it.get("record_id") or ""))
+
+
+async def _fetch_partitions_async(token: str, partitions: List[Dict[str, Any]]) -> List[List[Dict]]:
+    limiter = aio.AsyncRateLimiter(FEISHU_RATE_LIMIT)
+    return await aio.gather_limited([_search_records_async(token, f, limiter) for f in partitions], len(partitions))
+
+
+def fetch_records_by_ids(token: str, record_ids: List[str]) -> List[Dict]:
+    """
+    按 record_id 批量读取错题表中的记录（每次最多 100 条），返回与 fetch_records 相同结构的原始记录；
+    已被删除的记录不在结果中。用于按变更事件只拉取变化的几条。
+    """
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records/batch_get"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    records: List[Dict] = []
+    for i in range(0, len(record_ids), 100):
+        chunk = record_ids[i:i + 100]
+        with timed("feishu.records_batch_get", rows=len(chunk)) as m:
+            resp = aio.http("POST", url, headers=headers, json={"record_ids": chunk, "automatic_fields": True}, timeout=10)
+            m.update(bytes=len(resp.content), error=not resp.ok)
+        if not resp.ok:
+            try:
+                detail = resp.json()
+            except Exception:
+                detail = resp.text
+            raise RuntimeError(f"读取记录失败 HTTP {resp.status_code}: {detail}")
+        data = resp.json()
+        if data.get("code") != 0:
+            raise RuntimeError(f"读取记录失败: {data}")
+        records.extend(r for r in (data.get("data") or {}).get("records") or [] if r.get("record_id"))
+    return records
+
+
+def subscribe_bitable_events(token: str) -> None:
+    """订阅多维表格的云文档事件（记录变更事件需先订阅，每个多维表格只需一次）。"""
+    url = f"{API_BASE}/drive/v1/files/{APP_TOKEN}/subscribe"
+    headers = {"Authorization": f"Bearer {token}"}
+    resp = aio.http("POST", url, headers=headers, params={"file_type": "bitable"}, timeout=10)
+    if not resp.ok:
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise RuntimeError(f"订阅多维表格事件失败 HTTP {resp.status_code}: {detail}")
+    data = resp.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"订阅多维表格事件失败: {data}")
+
+
+def parse_practice_item(item: Dict) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    解析练习记录表的一行，返回 (错题record_id, {practice_record_id, 上次练习时间, 掌握程度, 练习次数, 下次练习时间})；
+    没有 错题record_id 的行返回 None。
+    """
+    fields = item.get("fields", {})
+    # 处理 rid 字段，可能是字符串或列表
+    rid_raw = fields.get(P_FIELD_RID)
+    if isinstance(rid_raw, list):
+        rid = rid_raw[0].strip() if rid_raw and isinstance(rid_raw[0], str) else None
+    else:
+        rid = (rid_raw or "").strip() or None
+    if not rid:
+        return None
+    try:
+        last_ms = int(fields.get(P_FIELD_LAST) or 0)
+    except (TypeError, ValueError):
+        last_ms = 0
+    try:
+        cnt = int(fields.get(P_FIELD_COUNT) or 0)
+    except (TypeError, ValueError):
+        cnt = 0
+    try:
+        next_ms = int(fields.get(P_FIELD_NEXT) or 0)
+    except (TypeError, ValueError):
+        next_ms = 0
+    # 处理 mastery 字段，可能是字符串或列表
+    mastery_raw = fields.get(P_FIELD_MASTERY)
+    if isinstance(mastery_raw, list):
+        mastery = mastery_raw[0].strip() if mastery_raw and isinstance(mastery_raw[0], str) else "不会"
+    else:
+        mastery = (mastery_raw or "").strip() or "不会"
+    return rid, {
+        "practice_record_id": item.get("record_id"),
+        P_FIELD_LAST: last_ms,
+        P_FIELD_MASTERY: mastery,
+        P_FIELD_COUNT: cnt,
+        P_FIELD_NEXT: next_ms,
+    }
+
+
+def _iter_practice_pages(token: str, practice_table_id: str, extra: Optional[Dict[str, Any]] = None):
+    """按页拉取练习记录表，逐页返回原始 items；extra 为附加的检索条件（sort / filter）。"""
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{practice_table_id}/records/search"
+    headers = {"Authorization": f"Bearer {token}"}
+    page_token = None
+
+    while True:
+        payload: Dict[str, object] = {"page_size": 100}
+        payload.update(extra or {})
+        if page_token:
+            payload["page_token"] = page_token
+        with timed("feishu.practice_page", query=",".join(sorted(extra or {}))) as m:
+            resp = aio.http("POST", url, headers=headers, json=payload, timeout=10)
+            m.update(bytes=len(resp.content), error=not resp.ok)
+        if not resp.ok:
+            try:
+                detail = resp.json()
+            except Exception:
+                detail = resp.text
+            raise RuntimeError(f"拉取练习记录失败 HTTP {resp.status_code}: {detail}")
+        data = resp.json()
+        if data.get("code") != 0:
+            raise RuntimeError(f"拉取练习记录失败: {data}")
+
+        yield data.get("data", {}).get("items", [])
+
+        page_token = data.get("data", {}).get("page_token")
+        if not data.get("data", {}).get("has_more"):
+            break
+
+
+def fetch_practice_records(token: str, practice_table_id: str, since_ms: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    拉取练习记录表，返回 错题record_id -> {practice_record_id, 上次练习时间, 掌握程度, 练习次数, 下次练习时间}。
+    同一错题若有多条，保留 上次练习时间 最大的一条。
+    传入 since_ms 时为增量拉取：按 上次练习时间 倒序翻页，遇到早于 since_ms 的行即停止。
+    """
+    extra = {"sort": [{"field_name": P_FIELD_LAST, "desc": True}]} if since_ms is not None else None
+    out: Dict[str, Dict[str, Any]] = {}
+    for items in _iter_practice_pages(token, practice_table_id, extra):
+        reached_old = False
+        for item in items:
+            parsed = parse_practice_item(item)
+            if not parsed:
+                continue
+            rid, entry = parsed
+            if since_ms is not None and entry[P_FIELD_LAST] < since_ms:
+                reached_old = True
+                continue
+            # 若已存在，只保留 上次练习时间 更大的一条
+            if rid in out and (out[rid].get(P_FIELD_LAST) or 0) >= entry[P_FIELD_LAST]:
+                continue
+            out[rid] = entry
+        if reached_old:
+            break
+    return out
+
+
+def fetch_practice_rows(token: str, practice_table_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """拉取练习记录表的全部行（不去重），返回 [(错题record_id, 练习状态), ...]，供清理重复行使用。"""
+    rows = []
+    for items in _iter_practice_pages(token, practice_table_id):
+        for item in items:
+            parsed = parse_practice_item(item)
+            if parsed:
+                rows.append(parsed)
+    return rows
+
+
+def find_practice_record(token: str, practice_table_id: str, question_record_id: str) -> Optional[Dict[str, Any]]:
+    """按 错题record_id 在练习记录表中查找已有的行（多条时取 上次练习时间 最大的一条），没有返回 None。"""
+    extra = {
+        "filter": {
+            "conjunction": "and",
+            "conditions": [{"field_name": P_FIELD_RID, "operator": "is", "value": [question_record_id]}],
+        }
+    }
+    best: Optional[Dict[str, Any]] = None
+    for items in _iter_practice_pages(token, practice_table_id, extra):
+        for item in items:
+            parsed = parse_practice_item(item)
+            if parsed and parsed[0] == question_record_id:
+                if best is None or parsed[1][P_FIELD_LAST] > best[P_FIELD_LAST]:
+                    best = parsed[1]
+    return best
+
+
+def create_practice_record(
+    token: str,
+    practice_table_id: str,
+    question_record_id: str,
+    mastery: str,
+    count: int,
+    next_ts_ms: int,
+    client_token: Optional[str] = None,
+    last_ms: Optional[int] = None,
+) -> Optional[str]:
+    """
+    在练习记录表中新建一条记录，返回新记录的 record_id。上次练习时间默认取当前时间，补写离线练习时传入原值。
+    client_token（uuid 格式）为幂等标识：同一 client_token 重复提交（如超时重试）不会新建第二行。
+    """
+    now_ms = last_ms if last_ms is not None else int(time.time() * 1000)
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{practice_table_id}/records"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    body = {
+        "fields": {
+            P_FIELD_RID: question_record_id,
+            P_FIELD_LAST: now_ms,
+            P_FIELD_MASTERY: mastery,
+            P_FIELD_COUNT: count,
+            P_FIELD_NEXT: next_ts_ms,
+        }
+    }
+    params = {"client_token": client_token} if client_token else None
+    with timed("feishu.practice_create") as m:
+        resp = aio.http("POST", url, headers=headers, params=params, json=body, timeout=10)
+        m["error"] = not resp.ok
+    if not resp.ok:
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise RuntimeError(f"创建练习记录失败 HTTP {resp.status_code}: {detail}")
+    data = resp.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"创建练习记录失败: {data}")
+    rec = (data.get("data") or {}).get("record") or {}
+    return rec.get("record_id")
+
+
+def update_practice_record(
+    token: str,
+    practice_table_id: str,
+    practice_record_id: str,
+    mastery: str,
+    count: int,
+    next_ts_ms: int,
+    last_ms: Optional[int] = None,
+) -> None:
+    """更新练习记录表中一条记录。上次练习时间默认取当前时间，合并重复行时传入原值。"""
+    now_ms = last_ms if last_ms is not None else int(time.time() * 1000)
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{practice_table_id}/records/{practice_record_id}"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    body = {
+        "fields": {
+            P_FIELD_LAST: now_ms,
+            P_FIELD_MASTERY: mastery,
+            P_FIELD_COUNT: count,
+            P_FIELD_NEXT: next_ts_ms,
+        }
+    }
+    with timed("feishu.practice_update") as m:
+        resp = aio.http("PUT", url, headers=headers, json=body, timeout=10)
+        m["error"] = not resp.ok
+    if not resp.ok:
+        try:
+            detail = resp.json()
+        except Exception:
+            detail = resp.text
+        raise RuntimeError(f"更新练习记录失败 HTTP {resp.status_code}: {detail}")
+    data = resp.json()
+    if data.get("code") != 0:
+        raise RuntimeError(f"更新练习记录失败: {data}")
+
+
+def batch_delete_practice_records(token: str, practice_table_id: str, practice_record_ids: List[str]) -> int:
+    """批量删除练习记录表中的行（每次最多 500 条），返回删除的行数。"""
+    url = f"{API_BASE}/bitable/v1/apps/{APP_TOKEN}/tables/{practice_table_id}/records/batch_delete"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    deleted = 0
+    for i in range(0, len(practice_record_ids), 500):
+        chunk = practice_record_ids[i:i + 500]
+        with timed("feishu.practice_delete", rows=len(chunk)) as m:
+            resp = aio.http("POST", url, headers=headers, json={"records": chunk}, timeout=30)
+            m["error"] = not resp.ok
+        if not resp.ok:
+            try:
+                detail = resp.json()
+            except Exception:
+                detail = resp.text
+            raise RuntimeError(f"删除练习记录失败 HTTP {resp.status_code}: {detail}")
+        data = resp.json()
+        if data.get("code") != 0:
+            raise RuntimeError(f"删除练习记录失败: {data}")
+        deleted += len(chunk)
+    return deleted
+
+
+def _attachment_first_response(resp, name: str, seconds: float) -> Tuple[Optional[bytes], str, str, Optional[str]]:
+    """
+    处理附件地址的响应：飞书可能先返回带临时下载地址的 JSON（解析地址），也可能直接返回文件内容（下载）。
+    返回 (内容, Content-Type, 错误说明, 临时下载地址)；需要再按临时地址下载时内容为 None、地址非空。
+    """
+    content_type = resp.headers.get("Content-Type", "").lower()
+    is_json = resp.ok and "application/json" in content_type
+    record_metric(
+        "feishu.attachment_resolve" if is_json else "feishu.attachment_download",
+        seconds, len(resp.content), error=not resp.ok,
+    )
+    if not resp.ok:
+        return None, "", f"[附件下载失败] {name} - HTTP {resp.status_code}", None
+    if not is_json:
+        return resp.content, content_type, "", None
+    try:
+        json_data = resp.json()
+    except ValueError:
+        return resp.content, content_type, "", None
+    if not (isinstance(json_data, dict) and json_data.get("code") == 0):
+        return resp.content, content_type, "", None
+    data = json_data.get("data", {})
+    tmp_urls = data.get("tmp_download_urls", [])
+    if tmp_urls and isinstance(tmp_urls, list):
+        real_url = tmp_urls[0].get("tmp_download_url") if isinstance(tmp_urls[0], dict) else None
+    else:
+        real_url = data.get("tmp_download_url") or data.get("download_url") or json_data.get("download_url")
+    if not real_url:
+        return None, "", f"[无法获取附件下载地址] {name}", None
+    return None, "", "", real_url
+
+
+def _attachment_download_response(resp, name: str) -> Tuple[Optional[bytes], str, str]:
+    if not resp.ok:
+        return None, "", f"[附件下载失败] {name} - HTTP {resp.status_code}"
+    return resp.content, resp.headers.get("Content-Type", "image/png").lower(), ""
+
+
+def fetch_attachment_bytes(url: str, token: str, name: str = "附件") -> Tuple[Optional[bytes], str, str]:
+    """
+    下载附件内容，兼容飞书先返回临时下载地址 JSON 的情况。
+    返回 (内容, Content-Type, 错误说明)；成功时错误说明为空字符串。
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        started = time.perf_counter()
+        resp = aio.http("GET", url, headers=headers, timeout=15, allow_redirects=True)
+        data, content_type, error, real_url = _attachment_first_response(resp, name, time.perf_counter() - started)
+        if not real_url:
+            return data, content_type, error
+        with timed("feishu.attachment_download") as m:
+            resp2 = aio.http("GET", real_url, headers=headers, timeout=15, allow_redirects=True)
+            m.update(bytes=len(resp2.content), error=not resp2.ok)
+        return _attachment_download_response(resp2, name)
+    except Exception as exc:  # noqa: BLE001
+        if is_network_error(exc):
+            note_network_error(exc)
+        return None, "", f"[附件处理异常] {name}: {exc}"
+
+
+async def _fetch_attachment_bytes_async(url: str, token: str, name: str = "附件") -> Tuple[Optional[bytes], str, str]:
+    """fetch_attachment_bytes 的协程版本。"""
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        started = time.perf_counter()
+        resp = await aio.request("GET", url, headers=headers, timeout=15, allow_redirects=True)
+        data, content_type, error, real_url = _attachment_first_response(resp, name, time.perf_counter() - started)
+        if not real_url:
+            return data, content_type, error
+        with timed("feishu.attachment_download") as m:
+            resp2 = await aio.request("GET", real_url, headers=headers, timeout=15, allow_redirects=True)
+            m.update(bytes=len(resp2.content), error=not resp2.ok)
+        return _attachment_download_response(resp2, name)
+    except Exception as exc:  # noqa: BLE001
+        if is_network_error(exc):
+            note_network_error(exc)
+        return None, "", f"[附件处理异常] {name}: {exc}"
+
+
+def _attachment_key(url: str, file_token: str = "") -> str:
+    return hashlib.sha256((file_token or url).encode("utf-8")).hexdigest()
+
+
+def _read_attachment_cache(key: str) -> Optional[Tuple[bytes, str]]:
+    cached = _attachment_cache.get(key)
+    count_cache("images", cached is not None)
+    if cached is None:
+        return None
+    content_type, _, data = cached.partition(b"\n")
+    return data, content_type.decode("ascii", "ignore")
+
+
+def _write_attachment_cache(key: str, data: Optional[bytes], content_type: str) -> None:
+    if data:
+        header = (content_type or "").encode("ascii", "ignore").replace(b"\n", b"")
+        _attachment_cache.put(key, header + b"\n" + data)
+
+
+def fetch_attachment_cached(url: str, token: str, name: str = "附件", file_token: str = "") -> Tuple[Optional[bytes], str, str]:
+    """
+    与 fetch_attachment_bytes 相同，但先查磁盘缓存：同一附件在所有会话、后台任务和批量生成进程中只下载一次。
+    """
+    key = _attachment_key(url, file_token)
+    cached = _read_attachment_cache(key)
+    if cached is not None:
+        return cached[0], cached[1], ""
+    if is_offline():
+        # 飞书不可达期间不再逐张等待超时，网络恢复后再下载
+        return None, "", f"[离线模式] {name} 尚未缓存，网络恢复后显示"
+    data, content_type, error = fetch_attachment_bytes(url, token, name)
+    _write_attachment_cache(key, data, content_type)
+    return data, content_type, error
+
+
+async def _fetch_attachment_cached_async(url: str, token: str, name: str = "附件", file_token: str = "") -> Tuple[Optional[bytes], str, str]:
+    """fetch_attachment_cached 的协程版本。"""
+    key = _attachment_key(url, file_token)
+    cached = _read_attachment_cache(key)
+    if cached is not None:
+        return cached[0], cached[1], ""
+    if is_offline():
+        return None, "", f"[离线模式] {name} 尚未缓存，网络恢复后显示"
+    data, content_type, error = await _fetch_attachment_bytes_async(url, token, name)
+    _write_attachment_cache(key, data, content_type)
+    return data, content_type, error
+
+
+def is_attachment_cached(url: str, file_token: str = "") -> bool:
+    return _attachment_cache.contains(_attachment_key(url, file_token))
+
+
+def read_cached_attachment(url: str, file_token: str = "") -> Optional[bytes]:
+    """只读磁盘缓存中的附件内容，未缓存时返回 None（不下载）。"""
+    key = _attachment_key(url, file_token)
+    if not _attachment_cache.contains(key):
+        return None
+    cached = _attachment_cache.get(key)
+    return cached.partition(b"\n")[2] if cached is not None else None
+
+
+def prefetch_attachments(attachments: List[Dict], token: str, max_workers: int = 8) -> Dict:
+    """
+    并发预下载附件到共享磁盘缓存（按 file_token/地址去重），返回统计信息。
+    异步 I/O 引擎启用时在事件循环中同时下载（最多 PREFETCH_CONCURRENCY 个），否则用 max_workers 个线程。
+    """
+    unique: Dict[str, Dict] = {}
+    for att in attachments:
+        url = att.get("url")
+        if url and is_image_file(att.get("name"), att.get("mime")):
+            unique.setdefault(att.get("file_token") or url, att)
+    pending = [a for a in unique.values() if not is_attachment_cached(a["url"], a.get("file_token") or "")]
+    started = time.time()
+    failed = 0
+    if pending and aio.enabled():
+        results = aio.run_sync(aio.gather_limited([
+            _fetch_attachment_cached_async(a["url"], token, a.get("name") or "附件", a.get("file_token") or "")
+            for a in pending
+        ], PREFETCH_CONCURRENCY))
+        failed = sum(1 for data, _, _ in results if not data)
+    elif pending:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch") as pool:
+            futures = [
+                pool.submit(fetch_attachment_cached, a["url"], token, a.get("name") or "附件", a.get("file_token") or "")
+                for a in pending
+            ]
+            for fut in as_completed(futures):
+                data, _, _ = fut.result()
+                if not data:
+                    failed += 1
+    return {
+        "attachments": len(unique),
+        "downloaded": len(pending) - failed,
+        "failed": failed,
+        "seconds": round(time.time() - started, 3),
+    }
@@ -0,0 +1,486 @@
+"""
+调用大模型（智谱AI）生成类似题，以及类似题的持久化缓存。
+只有图片的参考题先请视觉模型转写为文字（每张图片每个模型只转写一次，结果持久化），生成类似题时只发送文字。
+请求经 aio.http 发出（安装了 httpx 时共用异步 I/O 引擎的连接池），HTTP 库在调用接口时才导入，读取默认配置等轻量用途不会付出导入成本。
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+from feishu_client import fetch_attachment_cached
+from metrics import count_cache, timed
+from records import is_image_file, record_version
+from storage import DiskCache
+from usage import MAX_TOKENS_CEILING, suggest_max_tokens
+
+# LLM_API_BASE 可指向本地模拟服务（见 tools/standin_server.py）
+DEFAULT_LLM_API_BASE = os.getenv("LLM_API_BASE", "https://open.bigmodel.cn/api/paas/v4")
+DEFAULT_LLM_MODEL = "glm-4.6v"
+# 纯文字提示（含图片已转写的题目）优先发往更快的文字模型；备用视觉模型用于主模型熔断或过慢时对冲。设为空字符串可停用
+DEFAULT_LLM_TEXT_MODEL = os.getenv("LLM_TEXT_MODEL", "glm-4-flash")
+DEFAULT_LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "glm-4v-flash")
+
+# 参考题图片的 base64 缓存（进程内 LRU，所有会话与后台任务共用）
+_IMAGE_CACHE_SIZE = 64
+_image_cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+# 类似题持久化缓存：按 错题record_id + 记录版本 存放，题目修改后自然失效
+_similar_store = DiskCache("similar", max_bytes=50 * 1024 * 1024)
+# 图片题目转写缓存：按图片 file_token 存放 {模型: 转写文字}
+_transcript_store = DiskCache("transcripts", max_bytes=50 * 1024 * 1024)
+
+_NO_QUESTION = "无题目"
+_TRANSCRIBE_PROMPT = f"""请把图片中的题目完整转写为文字，要求：
+- 只输出题目本身（题干、选项、图中给出的已知条件），不要解答，不要添加任何说明
+- 数学公式用普通文字或 LaTeX 表示，保留原有的编号和换行
+- 忽略手写的作答痕迹和批改痕迹
+- 如果图片中没有题目，只输出「{_NO_QUESTION}」"""
+
+
+def get_cached_image_base64(img_url: str, token: str, file_token: str = "") -> Optional[Tuple[str, str]]:
+    """
+    获取图片的base64编码，优先从缓存读取
+    返回 (base64_data, mime_type) 或 None
+    """
+    if not img_url:
+        return None
+    with _image_cache_lock:
+        if img_url in _image_cache:
+            _image_cache.move_to_end(img_url)
+            return _image_cache[img_url]
+
+    # 缓存未命中，下载图片
+    image_data, content_type, _ = fetch_attachment_cached(img_url, token, file_token=file_token)
+    if not image_data:
+        return None
+    img_base64 = base64.b64encode(image_data).decode('utf-8')
+    img_mime = content_type if content_type and "image" in content_type else "image/png"
+    result = (img_base64, img_mime)
+    with _image_cache_lock:
+        _image_cache[img_url] = result
+        while len(_image_cache) > _IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return result
+
+
+def _similar_key(question: Dict) -> Optional[str]:
+    record_id = (question.get("record_id") or "").strip()
+    if not record_id:
+        return None
+    return f"{record_id}-{question.get('version') or record_version(question)}"
+
+
+def load_similar_from_store(question: Dict) -> List[str]:
+    """
+    读取持久化缓存中该题已生成的类似题；该题没有时复用同一重复簇（见 dedupe.py）中其他题的类似题，
+    都没有则返回空列表。
+    """
+    key = _similar_key(question)
+    if not key:
+        return []
+    texts = _similar_store.get_json(key) or []
+    if not texts:
+        from dedupe import get_duplicate_index
+
+        for rid, version in get_duplicate_index().members(question["record_id"].strip()):
+            texts = _similar_store.get_json(f"{rid}-{version}") or []
+            if texts:
+                break
+    count_cache("similar", bool(texts))
+    return texts
+
+
+def save_similar_to_store(question: Dict, texts: List[str]) -> None:
+    """把生成的类似题写入持久化缓存，供其他会话、命令行预生成共用。"""
+    key = _similar_key(question)
+    if key and texts:
+        _similar_store.put_json(key, list(texts))
+
+
+def drop_similar_from_store(question: Dict) -> None:
+    """删除该题（该版本）已生成的类似题；题目被修改或删除时调用。"""
+    key = _similar_key(question)
+    if key:
+        _similar_store.delete(key)
+
+
+def _supports_vision(model: str) -> bool:
+    """模型是否支持图片输入。"""
+    model_lower = (model or "").lower()
+    return any(tag in model_lower for tag in ("4.6v", "glm-4-6v", "4v", "vision", "4o"))
+
+
+def route_models(kind: str, model: Optional[str] = None) -> List[str]:
+    """
+    按优先级排列的候选模型（见 llm_router.py）。kind 为 text 时：文字模型 → 配置的模型 → 备用模型；
+    为 vision 时只取支持图片的：配置的模型 → 备用模型。
+    """
+    model = model or DEFAULT_LLM_MODEL
+    if kind == "text":
+        candidates = [DEFAULT_LLM_TEXT_MODEL, model, DEFAULT_LLM_FALLBACK_MODEL]
+    else:
+        candidates = [m for m in (model, DEFAULT_LLM_FALLBACK_MODEL) if _supports_vision(m)]
+    return [m for m in dict.fromkeys(candidates) if m]
+
+
+def _post_chat(api_url: str, api_key: str, payload: Dict, stage: str = "llm.chat", usage: Optional[Dict] = None, **labels) -> Dict:
+    """
+    发送一次 chat/completions 请求并返回响应 JSON；HTTP 错误时抛出带说明的异常。
+    usage 为记账字段（用途、类型、学科、道数），每次调用（含失败）都记入用量账本（见 usage.py）。
+    """
+    import aio
+    from usage import record_call
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    call = dict(usage or {}, model=payload.get("model") or "", max_tokens=payload.get("max_tokens") or 0, ok=0)
+    started = time.time()
+    try:
+        with timed(stage, model=payload.get("model"), **labels) as m:
+            response = aio.http("POST", api_url, headers=headers, json=payload, timeout=60)
+            m.update(bytes=len(response.content), error=not response.ok)
+            if response.ok:
+                body = response.json() or {}
+                tokens = body.get("usage") or {}
+                call.update(
+                    ok=1,
+                    prompt_tokens=tokens.get("prompt_tokens", 0),
+                    completion_tokens=tokens.get("completion_tokens", 0),
+                    truncated=int(_truncated(body)),
+                )
+                m.update(prompt_tokens=call["prompt_tokens"], completion_tokens=call["completion_tokens"])
+    finally:
+        record_call(seconds=round(time.time() - started, 3), **call)
+
+    # 检查响应状态
+    if not response.ok:
+        # 获取详细的错误信息
+        try:
+            error_detail = response.json()
+            error_msg = f"API错误 {response.status_code}: {error_detail}"
+        except Exception:
+            error_msg = f"API错误 {response.status_code}: {response.text[:200]}"
+
+        # 根据不同错误码提供更详细的提示
+        if response.status_code == 400:
+            error_msg += f"\n请求URL: {api_url}\n模型: {payload.get('model')}\n请检查模型名称、API Key和请求格式是否正确。"
+        elif response.status_code == 401:
+            error_msg += f"\n请求URL: {api_url}\n模型: {payload.get('model')}\n⚠️ API Key无效或已过期，请检查：\n1. API Key是否正确\n2. API Key是否已过期\n3. API Key是否有足够的权限访问该模型"
+
+        raise Exception(error_msg)
+
+    result = response.json()
+    # 检查响应格式
+    if not result or "choices" not in result or not result["choices"]:
+        raise Exception(f"API响应格式错误: {result}")
+    return result
+
+
+def _chat_url(api_base: Optional[str]) -> str:
+    if api_base and api_base.endswith("/chat/completions"):
+        return api_base
+    return (api_base or DEFAULT_LLM_API_BASE).rstrip('/') + "/chat/completions"
+
+
+def _transcript_key(att: Dict) -> Optional[str]:
+    ident = att.get("file_token") or att.get("url")
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest() if ident else None
+
+
+def load_transcript(att: Dict, model: Optional[str] = None) -> Optional[str]:
+    """读取图片已保存的题目转写；model 为空时取任一模型的转写。未转写过返回 None。"""
+    key = _transcript_key(att)
+    stored = (_transcript_store.get_json(key) if key else None) or {}
+    if model:
+        return stored.get(model)
+    return next(iter(stored.values()), None)
+
+
+def question_text(question: Dict) -> str:
+    """题目的文字内容：题干文字；只有图片时为已保存的图片转写（没有则为空）。"""
+    text = (question.get("handwriting_text") or "").strip()
+    if text:
+        return text
+    parts = [load_transcript(att) for att in question.get("attachments") or [] if is_image_file(att.get("name", ""), att.get("mime"))]
+    return "\n".join(p for p in parts if p)
+
+
+def _truncated(result: Dict) -> bool:
+    return any(c.get("finish_reason") == "length" for c in result.get("choices") or [])
+
+
+def transcribe_image(
+    att: Dict, api_key: str, api_base: str = None, model: str = None, token: str = None, purpose: str = "", subject: str = ""
+) -> Optional[str]:
+    """
+    请视觉模型把图片中的题目转写为文字，结果按 file_token + 模型持久化，同一张图片每个模型只转写一次。
+    候选视觉模型（配置的模型、备用模型）任一已转写过即直接使用。
+    下载或调用失败、图片中没有题目时返回 None（不缓存，下次再试）。
+    """
+    from llm_router import call_routed
+
+    models = route_models("vision", model)
+    key = _transcript_key(att)
+    if not key or not models:
+        return None
+    stored = _transcript_store.get_json(key) or {}
+    for m in models:
+        if stored.get(m):
+            count_cache("transcripts", True)
+            return stored[m]
+    count_cache("transcripts", False)
+    if not token:
+        return None
+    cached = get_cached_image_base64(att.get("url") or "", token, att.get("file_token") or "")
+    if not cached:
+        return None
+    img_base64, img_mime = cached
+    messages = [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": f"data:{img_mime};base64,{img_base64}"}},
+        {"type": "text", "text": _TRANSCRIBE_PROMPT},
+    ]}]
+
+    usage = {"purpose": purpose, "kind": "transcribe", "subject": subject, "items": 1}
+    max_tokens = suggest_max_tokens("transcribe", subject, 1)
+
+    def call(m: str) -> str:
+        payload = {"model": m, "messages": messages, "temperature": 0, "max_tokens": max_tokens}
+        result = _post_chat(_chat_url(api_base), api_key, payload, "llm.transcribe", usage)
+        if _truncated(result) and max_tokens < MAX_TOKENS_CEILING:
+            result = _post_chat(_chat_url(api_base), api_key, dict(payload, max_tokens=MAX_TOKENS_CEILING), "llm.transcribe", usage)
+        return result["choices"][0]["message"]["content"].strip()
+
+    try:
+        text, used = call_routed(call, models)
+    except Exception:  # noqa: BLE001
+        return None
+    if not text or text == _NO_QUESTION:
+        return None
+    # 重新读取再写入，保留其他模型的转写
+    stored = _transcript_store.get_json(key) or {}
+    stored[used] = text
+    _transcript_store.put_json(key, stored)
+    return text
+
+
+def transcribe_question_images(
+    question: Dict, api_key: str, api_base: str = None, model: str = None, token: str = None, purpose: str = ""
+) -> str:
+    """转写题目的全部图片（已转写的直接读取），按顺序合并；全部失败时返回空字符串。"""
+    images = [att for att in question.get("attachments") or [] if is_image_file(att.get("name", ""), att.get("mime"))]
+    subject = question.get("subject") or ""
+    parts = [transcribe_image(att, api_key, api_base, model, token, purpose, subject) for att in images]
+    return "\n".join(p for p in parts if p)
+
+
+def generate_similar_questions_with_llm(
+    reference_question: Dict, count: int, api_key: str, api_base: str = None, model: str = None, token: str = None, purpose: str = ""
+) -> List[str]:
+    """
+    使用大模型生成类似题目。
+    
+    Args:
+        reference_question: 参考题目（包含handwriting_text或attachments）
+        count: 需要生成的题目数量
+        api_key: API密钥
+        api_base: API基础URL（智谱AI API Base URL）
+        model: 模型名称（可选，如果不指定则根据api_base自动选择）
+        purpose: 调用用途（如 practice、pregenerate、exam），记入用量账本
+    
+    Returns:
+        生成的题目列表
+
+    调用经 llm_router 路由：纯文字提示优先发往文字模型，带图片的提示发往视觉模型，
+    熔断中的模型跳过，过慢的调用对冲到下一个候选模型。
+    """
+    from llm_router import call_routed
+
+    # 构建参考题目的文本描述
+    ref_text = reference_question.get("handwriting_text", "").strip()
+    attachments = reference_question.get("attachments", [])
+    
+    if not ref_text and not attachments:
+        raise ValueError("参考题目不能为空")
+    
+    # 检查是否有图片附件
+    image_attachments = [att for att in attachments if is_image_file(att.get("name", ""), att.get("mime"))]
+    has_images = len(image_attachments) > 0
+
+    # 默认使用智谱AI GLM-4.6V（支持多模态）
+    if not model:
+        model = DEFAULT_LLM_MODEL
+    supports_vision = bool(route_models("vision", model))
+
+    # 只有图片的题目先转写为文字（每张图片只调用一次视觉模型，结果持久化），之后都用纯文本提示；
+    # 转写失败时仍按原方式把图片发给模型
+    if not ref_text and has_images and supports_vision:
+        ref_text = transcribe_question_images(reference_question, api_key, api_base, model, token, purpose)
+        if ref_text:
+            has_images = False
+    
+    # 构建提示词
+    if ref_text:
+        question_description = ref_text
+    elif has_images:
+        question_description = "（请查看图片中的题目内容）"
+    else:
+        question_description = "[题目内容]"
+    
+    prompt_text = f"""你是一位经验丰富的教师，需要基于参考题目生成类似的新题目。
+
+参考题目：{question_description}
+
+请生成 {count} 道类似的题目，要求：
+
+1. **保持核心要素一致**：
+   - 保持相同的知识点和解题方法
+   - 保持相同的题目类型（如选择题、填空题、计算题等）
+   - 保持相同的难度级别
+   - 如果是数学题，保持相同的运算类型和公式结构
+
+2. **只改变可变要素**：
+   - 可以改变具体数字、数值（如：把"5+3"改为"7+4"）
+   - 可以改变具体的人物、物品、场景名称
+   - 可以改变题目的表述方式，但核心意思保持一致
+   - 保持题目的结构和解题步骤一致
+
+3. **输出格式**：
+   - 每道题目单独一行
+   - 只输出题目内容，不要编号，不要添加"题目1"、"题目2"等前缀
+   - 不要添加任何解释说明
+   - 确保每道题目都是完整、独立、可以直接使用的
+
+4. **质量要求**：
+   - 题目必须合理、可解，不能出现逻辑错误
+   - 题目必须与原题难度相当
+   - 不能生成完全相同的题目，但也不能偏离太远
+   - 生成的题目应该可以直接用于练习
+
+请严格按照以上要求生成 {count} 道类似题目，每行一道："""
+    
+    # 调用智谱AI API
+    api_url = _chat_url(api_base)
+    
+    # 构建消息内容
+    if has_images and supports_vision:
+        # 构建多模态消息（包含图片）
+        content_list = []
+        image_added = False
+        
+        # 添加图片（使用缓存）
+        for img_att in image_attachments[:1]:  # 只使用第一张图片
+            img_url = img_att.get("url")
+            if img_url and token:
+                # 使用缓存获取图片
+                cached = get_cached_image_base64(img_url, token, img_att.get("file_token") or "")
+                if cached:
+                    img_base64, img_mime = cached
+                    content_list.append({
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{img_mime};base64,{img_base64}"
+                        }
+                    })
+                    image_added = True
+        
+        # 添加文本提示
+        content_list.append({
+            "type": "text",
+            "text": prompt_text
+        })
+        
+        # 如果成功添加了图片，使用多模态消息；否则回退到纯文本
+        if image_added:
+            messages = [{"role": "user", "content": content_list}]
+        else:
+            # 图片添加失败，如果有文本内容，使用文本；否则抛出错误
+            if ref_text:
+                # 有文本内容，重新构建提示词（不提及图片）
+                fallback_prompt = f"""你是一位经验丰富的教师，需要基于参考题目生成类似的新题目。
+
+参考题目：{ref_text}
+
+请生成 {count} 道类似的题目，要求：
+
+1. **保持核心要素一致**：
+   - 保持相同的知识点和解题方法
+   - 保持相同的题目类型（如选择题、填空题、计算题等）
+   - 保持相同的难度级别
+   - 如果是数学题，保持相同的运算类型和公式结构
+
+2. **只改变可变要素**：
+   - 可以改变具体数字、数值（如：把"5+3"改为"7+4"）
+   - 可以改变具体的人物、物品、场景名称
+   - 可以改变题目的表述方式，但核心意思保持一致
+   - 保持题目的结构和解题步骤一致
+
+3. **输出格式**：
+   - 每道题目单独一行
+   - 只输出题目内容，不要编号，不要添加"题目1"、"题目2"等前缀
+   - 不要添加任何解释说明
+   - 确保每道题目都是完整、独立、可以直接使用的
+
+4. **质量要求**：
+   - 题目必须合理、可解，不能出现逻辑错误
+   - 题目必须与原题难度相当
+   - 不能生成完全相同的题目，但也不能偏离太远
+   - 生成的题目应该可以直接用于练习
+
+请严格按照以上要求生成 {count} 道类似题目，每行一道："""
+                messages = [{"role": "user", "content": fallback_prompt}]
+            else:
+                # 没有文本也没有图片，无法生成题目
+                raise ValueError("题目包含图片但图片处理失败，且没有文本内容，无法生成类似题目。请检查图片URL或网络连接。")
+    else:
+        # 纯文本消息
+        messages = [{"role": "user", "content": prompt_text}]
+    
+    # 带图片的消息只发往视觉模型
+    kind = "vision" if isinstance(messages[0]["content"], list) else "text"
+
+    # max_tokens 按道数与该学科最近的输出长度估算；输出被截断时以上限重试一次
+    subject = reference_question.get("subject") or ""
+    usage = {"purpose": purpose, "kind": "similar", "subject": subject, "items": count}
+    max_tokens = suggest_max_tokens("similar", subject, count)
+
+    def call(m: str) -> List[str]:
+        payload = {
+            "model": m,
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": max_tokens
+        }
+        result = _post_chat(api_url, api_key, payload, "llm.chat", usage, images=int(kind == "vision"))
+        if _truncated(result) and max_tokens < MAX_TOKENS_CEILING:
+            payload["max_tokens"] = MAX_TOKENS_CEILING
+            result = _post_chat(api_url, api_key, payload, "llm.chat", usage, images=int(kind == "vision"))
+        
+        # 提取生成的文本
+        generated_text = result["choices"][0]["message"]["content"].strip()
+        
+        # 按行分割，过滤空行
+        questions = [q.strip() for q in generated_text.split("\n") if q.strip()]
+        if not questions:
+            raise Exception(f"API响应内容为空: {result}")
+        return questions
+
+    try:
+        questions, _ = call_routed(call, route_models(kind, model))
+    except Exception as e:
+        # 如果API调用失败，抛出异常以便上层处理
+        raise Exception(f"题目生成失败: {str(e)}")
+
+    # 如果生成的数量不够，重复最后一道题
+    while len(questions) < count:
+        questions.append(questions[-1])
+
+    # 如果生成的数量太多，只取前count个
+    return questions[:count]
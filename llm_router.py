@@ -0,0 +1,209 @@
+"""
+大模型调用路由：按模型统计最近的耗时与失败率，连续失败的模型熔断一段时间，慢调用对冲到备用模型。
+
+- 调用方给出按优先级排列的候选模型（哪些是文字模型、视觉模型由 llm.py 决定），这里依次尝试；
+- 熔断：某模型连续失败 FAILURE_THRESHOLD 次，或最近调用失败率过高，暂停调用 COOLDOWN_MIN 秒，
+  到期后放行一次试探调用，成功则恢复，失败则暂停时间翻倍（最长 COOLDOWN_MAX 秒）。所有候选都熔断时立即报错，不再逐个等超时；
+- 对冲：当前调用超过该模型最近的 p90 耗时（乘以系数，有上下限）仍未返回，同时向下一个候选模型发出同样的请求，
+  取先成功的结果。等待时间从调用在线程池中真正开始执行时算起，排队时间不计入，繁忙时不会因排队而多花一倍调用。
+  慢的那个调用不取消，结束后照常计入统计。
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 统计窗口：每个模型最近的调用次数与时长（秒）
+WINDOW_CALLS = 20
+WINDOW_SECONDS = 300
+# 熔断条件与暂停时长（秒）
+FAILURE_THRESHOLD = 3
+ERROR_RATE_THRESHOLD = 0.5
+ERROR_RATE_MIN_CALLS = 6
+COOLDOWN_MIN = 30
+COOLDOWN_MAX = 600
+# 对冲等待时长（秒）：最近成功调用的 p90 × HEDGE_FACTOR，限制在上下限内；样本不足时用默认值
+HEDGE_FACTOR = 1.5
+HEDGE_MIN = 3.0
+HEDGE_MAX = 20.0
+HEDGE_DEFAULT = 10.0
+HEDGE_MIN_SAMPLES = 5
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class _ModelHealth:
+    """单个模型的滚动统计与熔断状态。"""
+
+    def __init__(self):
+        self.calls: Deque[Tuple[float, float, bool]] = deque(maxlen=WINDOW_CALLS)  # (结束时间, 耗时, 是否成功)
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = COOLDOWN_MIN
+        self.trial = False
+
+    def _recent(self, now: float) -> List[Tuple[float, float, bool]]:
+        return [c for c in self.calls if now - c[0] <= WINDOW_SECONDS]
+
+    def available(self, now: float) -> bool:
+        return not self.open_until or (now >= self.open_until and not self.trial)
+
+    def acquire(self, now: float) -> bool:
+        """发起调用前调用：熔断中返回 False；暂停到期后只放行一次试探调用。"""
+        if not self.available(now):
+            return False
+        if self.open_until:
+            self.trial = True
+        return True
+
+    def record(self, seconds: float, ok: bool, now: float) -> None:
+        self.calls.append((now, seconds, ok))
+        self.trial = False
+        if ok:
+            self.failures = 0
+            self.open_until = 0.0
+            self.cooldown = COOLDOWN_MIN
+            return
+        self.failures += 1
+        recent = self._recent(now)
+        error_rate = sum(1 for c in recent if not c[2]) / len(recent)
+        if self.open_until or self.failures >= FAILURE_THRESHOLD or (
+            len(recent) >= ERROR_RATE_MIN_CALLS and error_rate >= ERROR_RATE_THRESHOLD
+        ):
+            self.open_until = now + self.cooldown
+            self.cooldown = min(self.cooldown * 2, COOLDOWN_MAX)
+
+    def latency(self, q: float, now: float) -> Optional[float]:
+        values = sorted(c[1] for c in self._recent(now) if c[2])
+        if len(values) < HEDGE_MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def hedge_delay(self, now: float) -> float:
+        p90 = self.latency(0.9, now)
+        if p90 is None:
+            return HEDGE_DEFAULT
+        return min(HEDGE_MAX, max(HEDGE_MIN, p90 * HEDGE_FACTOR))
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        recent = self._recent(now)
+        errors = sum(1 for c in recent if not c[2])
+        if not self.open_until:
+            state = "closed"
+        elif now < self.open_until:
+            state = "open"
+        else:
+            state = "half_open"
+        return {
+            "state": state,
+            "calls": len(recent),
+            "errors": errors,
+            "error_rate": round(errors / len(recent), 3) if recent else 0.0,
+            "p50_s": self.latency(0.5, now),
+            "p90_s": self.latency(0.9, now),
+            "open_for_s": round(max(0.0, self.open_until - now), 1),
+        }
+
+
+_health: Dict[str, _ModelHealth] = {}
+
+
+def _get_health(model: str) -> _ModelHealth:
+    health = _health.get(model)
+    if health is None:
+        health = _health[model] = _ModelHealth()
+    return health
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-call")
+        return _executor
+
+
+def model_available(model: str) -> bool:
+    """该模型当前是否可调用（未熔断）。"""
+    with _lock:
+        return _get_health(model).available(time.time())
+
+
+def _run(call: Callable[[str], Any], model: str) -> Any:
+    started = time.time()
+    try:
+        result = call(model)
+    except Exception:
+        with _lock:
+            _get_health(model).record(time.time() - started, False, time.time())
+        raise
+    with _lock:
+        _get_health(model).record(time.time() - started, True, time.time())
+    return result
+
+
+def call_routed(call: Callable[[str], Any], models: List[str], hedge: bool = True) -> Tuple[Any, str]:
+    """
+    依次用候选模型调用 call(model)，返回 (结果, 实际使用的模型)。
+    跳过熔断中的模型；当前调用失败立即换下一个，超过对冲等待时长仍未返回时同时发起下一个（hedge=True）。
+    全部失败时抛出最后一个错误；所有候选都熔断时抛出 RuntimeError。
+    """
+    queue = [m for m in dict.fromkeys(models) if m]
+    if not any(model_available(m) for m in queue):
+        raise RuntimeError(f"大模型暂时不可用（{'、'.join(queue) or '未配置模型'} 最近连续调用失败），请稍后再试")
+    pending: Dict[Any, str] = {}
+    # 各调用开始执行的时刻（在线程池中排队时还没有）
+    started: Dict[str, float] = {}
+    last_error: Optional[BaseException] = None
+
+    def run(model: str) -> Any:
+        started[model] = time.time()
+        return _run(call, model)
+
+    def start_next() -> Optional[str]:
+        while queue:
+            model = queue.pop(0)
+            with _lock:
+                allowed = _get_health(model).acquire(time.time())
+            if allowed:
+                pending[_get_executor().submit(run, model)] = model
+                return model
+        return None
+
+    current = start_next()
+    while pending:
+        timeout = delay = None
+        if hedge and queue and current:
+            with _lock:
+                delay = _get_health(current).hedge_delay(time.time())
+            began = started.get(current)
+            timeout = delay if began is None else max(0.0, began + delay - time.time())
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            began = started.get(current)
+            if began is None or time.time() - began < delay:
+                # 还在排队或刚开始执行：继续等，不对冲
+                continue
+            # 当前调用偏慢：对冲到下一个候选
+            current = start_next() or current
+            continue
+        for future in done:
+            model = pending.pop(future)
+            try:
+                return future.result(), model
+            except Exception as exc:  # noqa: BLE001
+                last_error = exc
+        if not pending:
+            current = start_next()
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError("大模型暂时不可用，请稍后再试")
+
+
+def router_stats() -> Dict[str, Dict[str, Any]]:
+    """各模型最近的调用次数、失败率、耗时与熔断状态（诊断页面显示）。"""
+    now = time.time()
+    with _lock:
+        return {model: health.stats(now) for model, health in sorted(_health.items())}
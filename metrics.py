@@ -0,0 +1,316 @@
+"""
+性能埋点：记录热点路径各阶段的耗时、次数与字节数，汇总出 p50/p95，供诊断页面查看、导出为 JSON Lines。
+
+数据保存在进程内存中（每个阶段只保留最近的若干次采样），所有会话、后台任务共用；
+设置环境变量 METRICS_LOG 为文件路径时，每条采样同时追加写入该文件，便于长时间离线分析。
+
+生产监控：设置 METRICS_PORT 后，在 Streamlit 旁另起一个 HTTP 端口，以 Prometheus 文本格式输出
+各外部接口的请求数与耗时直方图、缓存命中率、活跃会话数、预生成队列长度与导出任务耗时。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+# 每个阶段保留的最近采样数，以及全局最近事件数
+_MAX_SAMPLES = 1000
+_MAX_EVENTS = 5000
+
+# 直方图分桶上界（秒）
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 阶段 -> 外部接口，Prometheus 输出按接口聚合
+_ENDPOINTS = {
+    "feishu.token": "tenant_token",
+    "feishu.records_page": "bitable_search",
+    "feishu.records_batch_get": "record_batch_get",
+    "feishu.practice_page": "bitable_search",
+    "feishu.practice_create": "record_create",
+    "feishu.practice_update": "record_update",
+    "feishu.practice_delete": "record_delete",
+    "feishu.attachment_resolve": "media_download",
+    "feishu.attachment_download": "media_download",
+    "llm.chat": "chat_completions",
+    "llm.transcribe": "chat_completions",
+}
+
+# 多久没有刷新页面的会话不再计为活跃（秒）
+SESSION_ACTIVE_WINDOW = 300
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+_events: Deque[Dict[str, Any]] = deque(maxlen=_MAX_EVENTS)
+_cache_counts: Dict[str, Dict[str, int]] = {}
+_sessions: Dict[str, float] = {}
+_session_gauges: Dict[str, Dict[str, float]] = {}
+_server: Optional[Any] = None
+
+
+def _append_log(event: Dict[str, Any]) -> None:
+    path = os.getenv("METRICS_LOG")
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def record(stage: str, seconds: float, nbytes: int = 0, error: bool = False, **fields: Any) -> None:
+    """记录一次采样。fields 为附加信息（如条数、token 数），原样写入事件。"""
+    event = {"ts": round(time.time(), 3), "stage": stage, "ms": round(seconds * 1000, 2), "bytes": int(nbytes or 0), "error": bool(error)}
+    event.update(fields)
+    with _lock:
+        st = _stats.get(stage)
+        if st is None:
+            st = _stats[stage] = {
+                "count": 0, "errors": 0, "bytes": 0, "sum": 0.0,
+                "buckets": [0] * len(_BUCKETS), "samples": deque(maxlen=_MAX_SAMPLES),
+            }
+        st["count"] += 1
+        st["errors"] += 1 if error else 0
+        st["bytes"] += event["bytes"]
+        st["sum"] += seconds
+        for i, bound in enumerate(_BUCKETS):
+            if seconds <= bound:
+                st["buckets"][i] += 1
+        st["samples"].append(seconds)
+        _events.append(event)
+    _append_log(event)
+
+
+@contextmanager
+def timed(stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    计时上下文：with timed("feishu.records_page") as m: ...; m["bytes"] = len(resp.content)
+    块内可往 m 写入 bytes、error 及其他附加字段；块内抛出异常时记为失败并继续抛出。
+    """
+    info: Dict[str, Any] = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        info["error"] = True
+        raise
+    finally:
+        nbytes = info.pop("bytes", 0)
+        error = info.pop("error", False)
+        record(stage, time.perf_counter() - started, nbytes, error, **info)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近邻法求分位数，values 为空时返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summary() -> List[Dict[str, Any]]:
+    """按阶段汇总：次数、失败数、总字节、p50/p95/最大耗时（毫秒，基于最近采样）。"""
+    with _lock:
+        items = [(stage, dict(st, samples=list(st["samples"]))) for stage, st in _stats.items()]
+    rows = []
+    for stage, st in sorted(items):
+        samples = st["samples"]
+        rows.append({
+            "stage": stage,
+            "count": st["count"],
+            "errors": st["errors"],
+            "bytes": st["bytes"],
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+        })
+    return rows
+
+
+def recent_events(limit: int = 200) -> List[Dict[str, Any]]:
+    """最近的采样事件，按时间倒序。"""
+    with _lock:
+        events = list(_events)[-limit:]
+    return events[::-1]
+
+
+def export_jsonl() -> bytes:
+    """把内存中的全部事件导出为 JSON Lines。"""
+    with _lock:
+        events = list(_events)
+    return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events).encode("utf-8")
+
+
+def count_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存访问（cache 如 images / records / similar）。"""
+    with _lock:
+        counts = _cache_counts.setdefault(cache, {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+
+
+def touch_session(session_id: str) -> None:
+    """标记会话活跃（每次页面运行时调用）。"""
+    now = time.time()
+    with _lock:
+        _sessions[session_id] = now
+        for sid, seen in list(_sessions.items()):
+            if now - seen > SESSION_ACTIVE_WINDOW:
+                del _sessions[sid]
+                for values in _session_gauges.values():
+                    values.pop(sid, None)
+
+
+def set_session_gauge(name: str, session_id: str, value: float) -> None:
+    """设置某个会话的数值（如预生成队列剩余题数），输出时对活跃会话求和。"""
+    with _lock:
+        _session_gauges.setdefault(name, {})[session_id] = value
+
+
+def reset() -> None:
+    """清空统计。"""
+    with _lock:
+        _stats.clear()
+        _events.clear()
+        _cache_counts.clear()
+
+
+def _labels(**labels: str) -> str:
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _histogram_lines(name: str, label_key: str, groups: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = []
+    for label, h in sorted(groups.items()):
+        for bound, n in zip(_BUCKETS, h["buckets"]):
+            lines.append(f"{name}_bucket{_labels(**{label_key: label, 'le': repr(bound)})} {n}")
+        lines.append(f"{name}_bucket{_labels(**{label_key: label, 'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_labels(**{label_key: label})} {h['sum']:.6f}")
+        lines.append(f"{name}_count{_labels(**{label_key: label})} {h['count']}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """以 Prometheus 文本格式输出当前指标。"""
+    now = time.time()
+    with _lock:
+        stats = {stage: {k: (list(v) if k == "buckets" else v) for k, v in st.items() if k != "samples"} for stage, st in _stats.items()}
+        cache_counts = {k: dict(v) for k, v in _cache_counts.items()}
+        active = [sid for sid, seen in _sessions.items() if now - seen <= SESSION_ACTIVE_WINDOW]
+        gauges = {name: sum(v for sid, v in values.items() if sid in active) for name, values in _session_gauges.items()}
+
+    # 外部接口按 endpoint 聚合，其余阶段（记录解析、文档生成、导出任务等）按 stage 输出
+    endpoints: Dict[str, Dict[str, Any]] = {}
+    outcomes: Dict[tuple, int] = {}
+    stages: Dict[str, Dict[str, Any]] = {}
+    for stage, st in stats.items():
+        endpoint = _ENDPOINTS.get(stage)
+        if endpoint is None:
+            stages[stage] = st
+            continue
+        agg = endpoints.setdefault(endpoint, {"count": 0, "sum": 0.0, "buckets": [0] * len(_BUCKETS)})
+        agg["count"] += st["count"]
+        agg["sum"] += st["sum"]
+        agg["buckets"] = [a + b for a, b in zip(agg["buckets"], st["buckets"])]
+        outcomes[(endpoint, "error")] = outcomes.get((endpoint, "error"), 0) + st["errors"]
+        outcomes[(endpoint, "ok")] = outcomes.get((endpoint, "ok"), 0) + st["count"] - st["errors"]
+
+    lines = [
+        "# HELP cuoti_external_requests_total Requests to external endpoints (Feishu bitable/media, LLM).",
+        "# TYPE cuoti_external_requests_total counter",
+    ]
+    for (endpoint, outcome), n in sorted(outcomes.items()):
+        lines.append(f"cuoti_external_requests_total{_labels(endpoint=endpoint, outcome=outcome)} {n}")
+    lines += [
+        "# HELP cuoti_external_request_duration_seconds Latency of requests to external endpoints.",
+        "# TYPE cuoti_external_request_duration_seconds histogram",
+    ]
+    lines += _histogram_lines("cuoti_external_request_duration_seconds", "endpoint", endpoints)
+    lines += [
+        "# HELP cuoti_stage_duration_seconds Duration of internal stages (parsing, document builds, export jobs).",
+        "# TYPE cuoti_stage_duration_seconds histogram",
+    ]
+    lines += _histogram_lines("cuoti_stage_duration_seconds", "stage", stages)
+    lines += [
+        "# HELP cuoti_cache_requests_total Cache lookups by result.",
+        "# TYPE cuoti_cache_requests_total counter",
+    ]
+    for cache, counts in sorted(cache_counts.items()):
+        for result in ("hit", "miss"):
+            lines.append(f"cuoti_cache_requests_total{_labels(cache=cache, result=result)} {counts[result]}")
+    lines += [
+        "# HELP cuoti_cache_hit_ratio Cache hit ratio since process start.",
+        "# TYPE cuoti_cache_hit_ratio gauge",
+    ]
+    for cache, counts in sorted(cache_counts.items()):
+        total = counts["hit"] + counts["miss"]
+        lines.append(f"cuoti_cache_hit_ratio{_labels(cache=cache)} {counts['hit'] / total if total else 0:.4f}")
+    lines += [
+        f"# HELP cuoti_active_sessions Sessions that ran the app within the last {SESSION_ACTIVE_WINDOW} seconds.",
+        "# TYPE cuoti_active_sessions gauge",
+        f"cuoti_active_sessions {len(active)}",
+        "# HELP cuoti_pregenerate_queue_depth Questions still waiting for similar-question pregeneration.",
+        "# TYPE cuoti_pregenerate_queue_depth gauge",
+        f"cuoti_pregenerate_queue_depth {gauges.get('pregenerate_queue', 0):g}",
+    ]
+    from llm_router import router_stats
+
+    models = router_stats()
+    lines += [
+        "# HELP cuoti_llm_circuit_open Whether calls to an LLM model are paused after repeated failures (1 = open).",
+        "# TYPE cuoti_llm_circuit_open gauge",
+    ]
+    lines += [f"cuoti_llm_circuit_open{_labels(model=model)} {int(st['state'] == 'open')}" for model, st in models.items()]
+    lines += [
+        "# HELP cuoti_llm_error_ratio Recent error ratio of calls to an LLM model.",
+        "# TYPE cuoti_llm_error_ratio gauge",
+    ]
+    lines += [f"cuoti_llm_error_ratio{_labels(model=model)} {st['error_rate']:.4f}" for model, st in models.items()]
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> bool:
+    """
+    在后台线程启动 /metrics 服务（进程内只启动一次）。端口默认取 METRICS_PORT，未设置时不启动；
+    地址默认取 METRICS_HOST（默认只监听本机 127.0.0.1，从其他主机抓取时设为 0.0.0.0）。
+    端口被占用等启动失败时静默返回 False，不影响应用本身。
+    """
+    global _server
+    port = port if port is not None else int(os.getenv("METRICS_PORT") or 0)
+    if not port:
+        return False
+    # 指标不做鉴权（含会话数、缓存命中率、模型状态），默认不对外开放
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    with _lock:
+        if _server is not None:
+            return True
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError:
+            return False
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return True
@@ -0,0 +1,187 @@
+"""
+离线优先：飞书慢或连不上时，页面照常使用本地数据，练习写入排队，网络恢复后在后台补写。
+
+- 题库：有本地记录（内存或快照）时立即使用，过期了由后台线程重新同步（record_store.get_records(background=True)）；
+- 图片、类似题：直接读磁盘缓存，飞书不可达期间未缓存的图片立即返回失败，不再等待超时；
+- 练习记录：点击「会了/不会」只写本地账本与待写回队列（practice_ledger.enqueue），由本模块的后台线程按顺序写回飞书。
+
+后台线程每个进程只有一个：有新练习、数据过期时被唤醒，网络出错后按指数退避重试，
+状态（是否离线、待写回条数、数据更新时间）由 sync_status() 提供给页面显示。
+"""
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from metrics import timed
+
+# 在线时的例行检查间隔（秒）
+SYNC_INTERVAL = 30
+# 网络出错后的重试间隔（秒），逐次翻倍
+RETRY_MIN = 5
+RETRY_MAX = 300
+# 非网络原因（如权限、字段错误）写回失败的练习最多重试几次，之后留在队列里等人工处理
+MAX_ATTEMPTS = 5
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_thread: Optional[threading.Thread] = None
+_credentials: Dict[str, str] = {}
+_last_token: Dict[str, str] = {}
+_practice_tables: Set[str] = set()
+_state: Dict[str, Any] = {"offline_since": 0.0, "last_ok": 0.0, "last_error": "", "retry_at": 0.0}
+
+
+# ---- 连通状态 ----
+
+def is_network_error(exc: BaseException) -> bool:
+    """连接失败、超时、飞书返回 5xx / 429 视为网络问题（稍后重试即可），其余视为请求本身有误。"""
+    try:
+        import requests
+    except ImportError:
+        return False
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    text = str(exc)
+    return isinstance(exc, RuntimeError) and any(f"HTTP {code}" in text for code in ("429", "500", "502", "503", "504"))
+
+
+def note_network_error(exc: BaseException) -> None:
+    """记录一次飞书不可达；之后 is_offline() 为 True，直到后台同步成功一次。"""
+    with _lock:
+        if not _state["offline_since"]:
+            _state["offline_since"] = time.time()
+        _state["last_error"] = str(exc)[:300]
+
+
+def note_online() -> None:
+    with _lock:
+        _state["offline_since"] = 0.0
+        _state["last_ok"] = time.time()
+        _state["last_error"] = ""
+
+
+def is_offline() -> bool:
+    return bool(_state["offline_since"])
+
+
+# ---- 后台同步 ----
+
+def start_background_sync(app_id: Optional[str] = None, app_secret: Optional[str] = None) -> None:
+    """登记飞书凭据并启动后台同步线程（进程内只启动一次）。"""
+    global _thread
+    with _lock:
+        if app_id and app_secret:
+            _credentials.update(app_id=app_id, app_secret=app_secret)
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_loop, name="offline-sync", daemon=True)
+    _thread.start()
+
+
+def watch_practice_table(practice_table_id: str) -> None:
+    """让后台线程定期同步该练习记录表的本地账本。"""
+    if practice_table_id:
+        with _lock:
+            _practice_tables.add(practice_table_id)
+
+
+def request_sync(token: Optional[str] = None) -> None:
+    """唤醒后台线程尽快同步（离线退避期间不提前重试）。token 在未登记凭据时使用。"""
+    if token:
+        _last_token["token"] = token
+    start_background_sync()
+    if time.time() >= _state["retry_at"]:
+        _wake.set()
+
+
+def background_token() -> Optional[str]:
+    """后台任务使用的访问令牌：优先用登记的凭据获取（过期自动刷新），否则用页面最近传入的令牌。"""
+    from feishu_client import get_tenant_access_token
+
+    if _credentials:
+        return get_tenant_access_token(_credentials["app_id"], _credentials["app_secret"])
+    return _last_token.get("token")
+
+
+def drain_outbox(token: str) -> Dict[str, int]:
+    """
+    按顺序把待写回的练习写入飞书。同一题只写最新的一条（被它取代的旧条目直接移出队列），
+    网络出错时抛出（剩下的留待下次），其他错误记在该项上并继续。
+    """
+    from practice_ledger import get_ledger
+    from scheduler import push_practice_state
+
+    ledger = get_ledger()
+    stats = {"pushed": 0, "failed": 0, "superseded": ledger.collapse_pending()}
+    for outbox_id, table_id, rid, entry in ledger.pending(max_attempts=MAX_ATTEMPTS):
+        try:
+            push_practice_state(token, table_id, rid, entry)
+        except Exception as exc:  # noqa: BLE001
+            if is_network_error(exc):
+                raise
+            ledger.fail(outbox_id, str(exc))
+            stats["failed"] += 1
+            continue
+        ledger.ack(outbox_id)
+        stats["pushed"] += 1
+    return stats
+
+
+def reconcile(token: str) -> Dict[str, Any]:
+    """一次完整的后台同步：补写练习 → 过期的题库重新同步 → 过期的练习账本增量同步。"""
+    from practice_ledger import get_ledger
+    from record_store import RECORDS_TTL, get_record_store, invalidate_practice_map, records_ttl
+
+    with timed("offline.reconcile") as m:
+        result: Dict[str, Any] = drain_outbox(token)
+        store = get_record_store()
+        if store.expired(records_ttl()):
+            result["records"] = len(store.sync(token))
+        ledger = get_ledger()
+        for table_id in sorted(_practice_tables):
+            if time.time() - ledger.sync_state(table_id)["synced_at"] > RECORDS_TTL:
+                ledger.sync(token, table_id)
+                invalidate_practice_map(table_id)
+        m.update(pushed=result["pushed"])
+    return result
+
+
+def _loop() -> None:
+    backoff = 0
+    while True:
+        _wake.wait(backoff or SYNC_INTERVAL)
+        _wake.clear()
+        try:
+            token = background_token()
+            if not token:
+                continue
+            reconcile(token)
+        except Exception as exc:  # noqa: BLE001
+            if is_network_error(exc):
+                note_network_error(exc)
+                backoff = min(RETRY_MAX, max(RETRY_MIN, backoff * 2))
+            else:
+                _state["last_error"] = str(exc)[:300]
+                backoff = RETRY_MIN
+            _state["retry_at"] = time.time() + backoff
+            continue
+        note_online()
+        backoff = 0
+        _state["retry_at"] = 0.0
+
+
+def sync_status() -> Dict[str, Any]:
+    """供页面显示的同步状态：是否离线、题库数据年龄、待写回的练习条数。"""
+    from practice_ledger import get_ledger
+    from record_store import get_record_store
+
+    store = get_record_store()
+    return {
+        "offline": is_offline(),
+        "offline_since": _state["offline_since"],
+        "last_ok": _state["last_ok"],
+        "last_error": _state["last_error"],
+        "records_age": store.age(),
+        "records_source": store.source,
+        "pending_writes": get_ledger().pending_count(),
+    }
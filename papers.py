@@ -0,0 +1,309 @@
+"""
+组卷：按「学科 + 各知识点题数」的选题计划抽取原题或生成类似题，再导出为 Word/HTML。
+
+页面上的后台导出任务、命令行与批量生成共用这里的逻辑。
+
+类似题试卷逐题记录断点（SimilarCheckpoint）：任务标识由参考题决定，生成中途失败、超时或服务重启后，
+重新生成同一份试卷时已生成的题直接取断点中的结果，只为失败和未完成的题调用大模型。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from dedupe import dedupe_questions, question_cluster
+from exporters import DOCX_MIME, build_doc, build_html, get_cached_artifact, put_cached_artifact, selection_fingerprint
+from llm import generate_similar_questions_with_llm, load_similar_from_store, save_similar_to_store
+from metrics import timed
+from storage import atomic_write_json, get_data_dir, read_json
+
+# 进度回调：report(进度0~1, 说明文字)
+ProgressReporter = Callable[[float, str], None]
+
+_CHECKPOINT_DIR = "paper_checkpoints"
+# 断点保留时长（秒）
+CHECKPOINT_TTL = 7 * 86400
+
+_checkpoint_locks: Dict[str, threading.Lock] = {}
+_checkpoint_locks_guard = threading.Lock()
+
+
+def _no_report(progress: float, message: str = "") -> None:
+    pass
+
+
+def filter_by_subjects(records: List[Dict], subjects: List[str]) -> List[Dict]:
+    """只保留所选学科的题目。"""
+    return [r for r in records if r.get("subject") in subjects]
+
+
+def select_questions(filtered: List[Dict], selected_plan: Dict[str, int], rng: Optional[random.Random] = None) -> Dict[str, List[Dict]]:
+    """按计划从每个知识点随机抽取原题；近似重复的题（同一重复簇，见 dedupe.py）整张试卷只抽一道。"""
+    rng = rng or random
+    selections: Dict[str, List[Dict]] = {}
+    used: Set[str] = set()
+    for kp, count in selected_plan.items():
+        if count <= 0:
+            continue
+        pool = [r for r in filtered if kp in (r.get("knowledge_points") or [])]
+        # 同一簇的题随机留一道
+        rng.shuffle(pool)
+        pool = dedupe_questions(pool, exclude=used)
+        if count > len(pool):
+            count = len(pool)
+        if count > 0:
+            selections[kp] = rng.sample(pool, count)
+            used.update(filter(None, map(question_cluster, selections[kp])))
+    return selections
+
+
+def similar_reference_questions(filtered: List[Dict], selected_plan: Dict[str, int]) -> Dict[str, List[Dict]]:
+    """每个知识点取最新录入的若干道题作为生成类似题的参考题；近似重复的题只取一道。"""
+    references: Dict[str, List[Dict]] = {}
+    used: Set[str] = set()
+    for kp, count in selected_plan.items():
+        if count <= 0:
+            continue
+        pool = [r for r in filtered if kp in (r.get("knowledge_points") or [])]
+        pool = [r for r in pool if r.get("handwriting_text") or r.get("attachments")]
+        pool.sort(key=lambda r: r.get("created_time", 0), reverse=True)
+        pool = dedupe_questions(pool, exclude=used)
+        if not pool:
+            continue
+        references[kp] = pool[: min(count, len(pool))]
+        used.update(filter(None, map(question_cluster, references[kp])))
+    return references
+
+
+def similar_job_id(references: Dict[str, List[Dict]]) -> str:
+    """类似题试卷的任务标识：由各知识点的参考题（record_id + 版本）决定，同一份计划重新生成时得到同一标识。"""
+    digest = hashlib.sha1()
+    for kp, refs in references.items():
+        item = [kp, [[r.get("record_id") or "", r.get("version") or ""] for r in refs]]
+        digest.update(json.dumps(item, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class SimilarCheckpoint:
+    """类似题试卷的生成断点：每道参考题生成的类似题（或失败原因）逐题写入数据目录。"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.items: Dict[str, Dict] = {}
+        try:
+            self.path = get_data_dir(_CHECKPOINT_DIR) / f"{job_id}.json"
+        except OSError:
+            self.path = None
+            return
+        data = read_json(self.path)
+        if isinstance(data, dict) and isinstance(data.get("items"), dict):
+            self.items = data["items"]
+
+    @staticmethod
+    def item_key(kp: str, ref: Dict) -> str:
+        return f"{kp}:{(ref.get('record_id') or '').strip()}"
+
+    def text(self, key: str) -> Optional[str]:
+        return (self.items.get(key) or {}).get("text")
+
+    def mark_done(self, key: str, text: str) -> None:
+        self.items[key] = {"text": text, "updated_at": time.time()}
+        self._save()
+
+    def mark_failed(self, key: str, error: str) -> None:
+        attempts = (self.items.get(key) or {}).get("attempts", 0) + 1
+        self.items[key] = {"error": error, "attempts": attempts, "updated_at": time.time()}
+        self._save()
+
+    def counts(self) -> Dict[str, int]:
+        """已生成与失败的题数。"""
+        done = sum(1 for item in self.items.values() if item.get("text"))
+        return {"done": done, "failed": len(self.items) - done}
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            atomic_write_json(self.path, {"job_id": self.job_id, "updated_at": time.time(), "items": self.items})
+        except OSError:
+            pass
+
+
+def _checkpoint_lock(job_id: str) -> threading.Lock:
+    # 同一份试卷的 Word 与 HTML 同时生成时，后开始的等前一个生成完再直接读断点，不重复调用大模型
+    with _checkpoint_locks_guard:
+        lock = _checkpoint_locks.get(job_id)
+        if lock is None:
+            lock = _checkpoint_locks[job_id] = threading.Lock()
+        return lock
+
+
+def prune_checkpoints(ttl: float = CHECKPOINT_TTL) -> None:
+    """删除超过保留时长的断点文件。"""
+    try:
+        root = get_data_dir(_CHECKPOINT_DIR)
+        cutoff = time.time() - ttl
+        for path in root.glob("*.json"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+    except OSError:
+        pass
+
+
+def generate_similar_selections(
+    filtered: List[Dict],
+    selected_plan: Dict[str, int],
+    llm_api_key: str,
+    llm_api_base: Optional[str],
+    llm_model: Optional[str],
+    token: str,
+    report: ProgressReporter = _no_report,
+    errors: Optional[List[str]] = None,
+    checkpoint: Optional[SimilarCheckpoint] = None,
+) -> Dict[str, List[Dict]]:
+    """
+    为每道参考题生成一道类似题：断点中已有结果的直接使用；该题或同簇的重复题已有缓存的类似题（练习时生成、命令行预生成）时复用，
+    否则调用大模型并写入缓存。每道题的结果或失败原因写入断点（checkpoint 为 None 时按参考题取得断点）。
+    单题失败不中断，错误说明追加到 errors；进度通过 report 回传（占总进度的 0~0.8）。
+    """
+    similar_selections: Dict[str, List[Dict]] = {}
+    references = similar_reference_questions(filtered, selected_plan)
+    if checkpoint is None:
+        prune_checkpoints()
+        checkpoint = SimilarCheckpoint(similar_job_id(references))
+    total_upper = sum(c for c in selected_plan.values() if c > 0)
+    current = 0
+    resumed = 0
+
+    with _checkpoint_lock(checkpoint.job_id):
+        for kp, reference_questions in references.items():
+            generated_questions = []
+            for ref in reference_questions:
+                key = SimilarCheckpoint.item_key(kp, ref)
+                text = checkpoint.text(key)
+                if text:
+                    resumed += 1
+                else:
+                    try:
+                        texts = load_similar_from_store(ref)
+                        if not texts:
+                            texts = generate_similar_questions_with_llm(ref, 1, llm_api_key, llm_api_base, llm_model, token, purpose="exam")
+                            save_similar_to_store(ref, texts)
+                        if texts:
+                            text = texts[0]
+                            checkpoint.mark_done(key, text)
+                        else:
+                            checkpoint.mark_failed(key, "大模型未返回题目")
+                    except Exception as e:
+                        checkpoint.mark_failed(key, str(e))
+                        if errors is not None:
+                            errors.append(str(e))
+                if text:
+                    generated_questions.append({
+                        "subject": ref.get("subject"),
+                        "knowledge_points": [kp],
+                        "handwriting_text": text,
+                        "reason_type": "",
+                        "reason_detail": "",
+                        "attachments": [],
+                        "created_time": 0,
+                    })
+                current += 1
+                if total_upper > 0:
+                    note = f"，{resumed} 道取自上次的断点" if resumed else ""
+                    report(0.8 * min(1.0, current / total_upper), f"正在生成类似题... ({current}/{total_upper}){note}")
+
+            if generated_questions:
+                similar_selections[kp] = generated_questions
+
+    return similar_selections
+
+
+def render_selections(
+    subjects: List[str],
+    selections: Dict[str, List[Dict]],
+    fmt: str,
+    token: str,
+    report: ProgressReporter = _no_report,
+    start: float = 0.0,
+    use_cache: bool = True,
+    status_suffix: Callable[[], str] = lambda: "",
+) -> bytes:
+    """
+    把已选定的题目导出为 docx/html 字节内容。
+    use_cache 为 True 时（原题试卷）按选题指纹复用已生成的文件；附件下载失败的结果不缓存。
+    """
+    fingerprint = None
+    if use_cache:
+        fingerprint = selection_fingerprint(subjects, selections, fmt)
+        cached = get_cached_artifact(fingerprint)
+        if cached is not None:
+            report(1.0, "已复用相同选题的试卷")
+            return cached
+
+    def on_progress(done: int, total: int) -> None:
+        report(start + (1 - start) * done / max(total, 1), f"正在生成文档... ({done}/{total}){status_suffix()}")
+
+    report(start, "正在生成文档...")
+    attachment_errors: List[str] = []
+    questions = sum(len(qs) for qs in selections.values())
+    with timed(f"export.build_{fmt}", questions=questions) as m:
+        if fmt == "docx":
+            data = build_doc(subjects, selections, token, on_progress=on_progress, errors=attachment_errors)
+        else:
+            data = build_html(subjects, selections, token, on_progress=on_progress, errors=attachment_errors).encode("utf-8")
+        m.update(bytes=len(data), attachment_errors=len(attachment_errors))
+    if fingerprint and not attachment_errors:
+        put_cached_artifact(fingerprint, data)
+    return data
+
+
+def build_paper(
+    records: List[Dict],
+    subjects: List[str],
+    selected_plan: Dict[str, int],
+    fmt: str,
+    similar: bool,
+    token: str,
+    llm_api_key: Optional[str] = None,
+    llm_api_base: Optional[str] = None,
+    llm_model: Optional[str] = None,
+    report: ProgressReporter = _no_report,
+    rng: Optional[random.Random] = None,
+) -> bytes:
+    """
+    完整的组卷流程：筛选学科 → 抽原题或生成类似题 → 导出。没有可用题目时抛出 ValueError。
+    """
+    filtered = filter_by_subjects(records, subjects)
+    errors: List[str] = []
+    if similar:
+        report(0.0, "正在使用 AI 生成类似题目...")
+        selections = generate_similar_selections(
+            filtered, selected_plan, llm_api_key, llm_api_base, llm_model, token, report, errors
+        )
+        start = 0.8
+    else:
+        report(0.0, "正在准备题目...")
+        selections = select_questions(filtered, selected_plan, rng)
+        start = 0.3
+    if not selections:
+        detail = f"（{errors[0]}）" if errors else ""
+        raise ValueError(("生成失败或没有可用题目" if similar else "没有可用题目") + detail)
+
+    def status_suffix() -> str:
+        return f"，{len(errors)} 道类似题生成失败" if errors else ""
+
+    return render_selections(
+        subjects, selections, fmt, token, report, start=start, use_cache=not similar, status_suffix=status_suffix
+    )
+
+
+def paper_title(subjects: List[str], similar: bool) -> str:
+    kind = "类似题试卷" if similar else "原题试卷"
+    return f"{'、'.join(subjects)}_{kind}"
+
+
+def paper_mime(fmt: str) -> str:
+    return DOCX_MIME if fmt == "docx" else "text/html"
@@ -0,0 +1,371 @@
+"""
+练习记录本地账本（SQLite）：飞书练习记录表的读穿缓存。
+
+每道错题只保留一行（上次练习时间最大的一条），按 错题record_id 与 下次练习时间 建索引；
+与飞书表增量同步（只拉取上次同步以来有变化的行），「现在该练哪些题」用索引查询回答，
+开始练习的开销与练习历史的长短无关。今日已练的题目也记在这里，刷新页面或换一台设备不会丢失。
+
+练习写入先记入本地（practice 与 outbox 两张表），由后台线程（offline.py）按顺序写回飞书，
+点击「会了/不会」不等待飞书；outbox 中尚未写回的练习在每次同步后重新叠加，不会被飞书上的旧数据覆盖。
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from records import P_FIELD_COUNT, P_FIELD_LAST, P_FIELD_MASTERY, P_FIELD_NEXT
+from storage import get_data_dir
+
+_DB_NAME = "practice_ledger.sqlite3"
+
+# 超过该间隔做一次全量同步（能发现飞书上被删除或手工修改的旧行），其余时候增量同步
+FULL_SYNC_INTERVAL = 24 * 3600
+# 增量同步的回看窗口（毫秒），容忍各端时钟误差
+_INCREMENTAL_OVERLAP_MS = 5 * 60 * 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS practice (
+    table_id TEXT NOT NULL,
+    rid TEXT NOT NULL,
+    practice_record_id TEXT,
+    last_ms INTEGER NOT NULL DEFAULT 0,
+    mastery TEXT NOT NULL DEFAULT '不会',
+    count INTEGER NOT NULL DEFAULT 0,
+    next_ms INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_id, rid)
+);
+CREATE INDEX IF NOT EXISTS idx_practice_next ON practice (table_id, next_ms);
+CREATE TABLE IF NOT EXISTS sync_state (
+    table_id TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL DEFAULT 0,
+    full_synced_at REAL NOT NULL DEFAULT 0,
+    high_water_ms INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_id TEXT NOT NULL,
+    rid TEXT NOT NULL,
+    last_ms INTEGER NOT NULL,
+    mastery TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    next_ms INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS practiced_today (
+    day TEXT NOT NULL,
+    rid TEXT NOT NULL,
+    PRIMARY KEY (day, rid)
+);
+"""
+
+# 同一题保留 上次练习时间 更大的一行
+_UPSERT = """
+INSERT INTO practice (table_id, rid, practice_record_id, last_ms, mastery, count, next_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (table_id, rid) DO UPDATE SET
+    practice_record_id = COALESCE(excluded.practice_record_id, practice.practice_record_id),
+    last_ms = excluded.last_ms,
+    mastery = excluded.mastery,
+    count = excluded.count,
+    next_ms = excluded.next_ms
+WHERE excluded.last_ms >= practice.last_ms
+"""
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class PracticeLedger:
+    """练习记录账本。连接在线程间共用，所有操作串行执行。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    # ---- 同步 ----
+
+    def sync_state(self, table_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at, full_synced_at, high_water_ms FROM sync_state WHERE table_id = ?", (table_id,)
+            ).fetchone()
+        if not row:
+            return {"synced_at": 0.0, "full_synced_at": 0.0, "high_water_ms": 0}
+        return {"synced_at": row[0], "full_synced_at": row[1], "high_water_ms": row[2]}
+
+    def sync(self, token: str, table_id: str, full: bool = False) -> Dict[str, Any]:
+        """与飞书练习记录表同步：首次或超过 FULL_SYNC_INTERVAL 时全量，否则增量。返回同步统计。"""
+        from feishu_client import fetch_practice_records
+
+        started = time.time()
+        state = self.sync_state(table_id)
+        full = full or not state["full_synced_at"] or started - state["full_synced_at"] > FULL_SYNC_INTERVAL
+        since_ms = None if full else max(0, state["high_water_ms"] - _INCREMENTAL_OVERLAP_MS)
+        rows = fetch_practice_records(token, table_id, since_ms=since_ms)
+        high_water = max([state["high_water_ms"]] + [e.get(P_FIELD_LAST) or 0 for e in rows.values()])
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if full:
+                    # 全量结果即飞书上的现状：飞书上删掉的行本地也删掉，
+                    # 但拉取开始后才练习（或刚写回）的行比拉取结果新，保留
+                    local = self._conn.execute(
+                        "SELECT rid FROM practice WHERE table_id = ? AND last_ms < ?", (table_id, int(started * 1000))
+                    ).fetchall()
+                    self._conn.executemany(
+                        "DELETE FROM practice WHERE table_id = ? AND rid = ?",
+                        [(table_id, rid) for (rid,) in local if rid not in rows],
+                    )
+                # 只覆盖比本地旧的行（_UPSERT 按上次练习时间比较）：拉取期间写回飞书并移出队列的练习不会被旧数据改回
+                self._conn.executemany(_UPSERT, [self._row(table_id, rid, e) for rid, e in rows.items()])
+                # 尚未写回飞书的练习重新叠加上去（上次练习时间更新，会覆盖飞书上的旧行）
+                self._conn.execute(
+                    "INSERT INTO practice (table_id, rid, practice_record_id, last_ms, mastery, count, next_ms) "
+                    "SELECT table_id, rid, NULL, last_ms, mastery, count, next_ms FROM outbox "
+                    "WHERE table_id = ? ORDER BY id "
+                    "ON CONFLICT (table_id, rid) DO UPDATE SET last_ms = excluded.last_ms, mastery = excluded.mastery, "
+                    "count = excluded.count, next_ms = excluded.next_ms WHERE excluded.last_ms >= practice.last_ms",
+                    (table_id,),
+                )
+                self._conn.execute(
+                    "INSERT INTO sync_state (table_id, synced_at, full_synced_at, high_water_ms) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (table_id) DO UPDATE SET synced_at = excluded.synced_at, "
+                    "full_synced_at = CASE WHEN ? THEN excluded.full_synced_at ELSE sync_state.full_synced_at END, "
+                    "high_water_ms = excluded.high_water_ms",
+                    (table_id, started, started if full else state["full_synced_at"], high_water, int(full)),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"mode": "full" if full else "incremental", "rows": len(rows), "seconds": round(time.time() - started, 3)}
+
+    @staticmethod
+    def _row(table_id: str, rid: str, entry: Dict[str, Any]) -> tuple:
+        return (
+            table_id,
+            rid,
+            entry.get("practice_record_id"),
+            int(entry.get(P_FIELD_LAST) or 0),
+            entry.get(P_FIELD_MASTERY) or "不会",
+            int(entry.get(P_FIELD_COUNT) or 0),
+            int(entry.get(P_FIELD_NEXT) or 0),
+        )
+
+    # ---- 读写 ----
+
+    def upsert(self, table_id: str, rid: str, entry: Dict[str, Any]) -> None:
+        """写入一题的练习状态（练习后调用，与飞书写入保持一致）。"""
+        with self._lock:
+            self._conn.execute(_UPSERT, self._row(table_id, rid, entry))
+
+    def get(self, table_id: str, rid: str) -> Optional[Dict[str, Any]]:
+        """读取一题的练习状态，没有返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT practice_record_id, last_ms, mastery, count, next_ms FROM practice WHERE table_id = ? AND rid = ?",
+                (table_id, rid),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "practice_record_id": row[0],
+            P_FIELD_LAST: row[1],
+            P_FIELD_MASTERY: row[2],
+            P_FIELD_COUNT: row[3],
+            P_FIELD_NEXT: row[4],
+        }
+
+    def set_practice_record_id(self, table_id: str, rid: str, practice_record_id: Optional[str]) -> None:
+        """记下（或清除）一题在飞书练习记录表中对应的行。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE practice SET practice_record_id = ? WHERE table_id = ? AND rid = ?",
+                (practice_record_id, table_id, rid),
+            )
+
+    def practice_map(self, table_id: str) -> Dict[str, Dict[str, Any]]:
+        """返回与 fetch_practice_records 相同结构的 错题record_id -> 练习状态。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rid, practice_record_id, last_ms, mastery, count, next_ms FROM practice WHERE table_id = ?",
+                (table_id,),
+            ).fetchall()
+        return {
+            rid: {
+                "practice_record_id": prid,
+                P_FIELD_LAST: last_ms,
+                P_FIELD_MASTERY: mastery,
+                P_FIELD_COUNT: count,
+                P_FIELD_NEXT: next_ms,
+            }
+            for rid, prid, last_ms, mastery, count, next_ms in rows
+        }
+
+    def due_ids(self, table_id: str, now_ms: int, limit: Optional[int] = None) -> List[str]:
+        """有练习记录且 下次练习时间 <= now_ms 的错题，按下次练习时间升序（走 next_ms 索引）。"""
+        sql = "SELECT rid FROM practice WHERE table_id = ? AND next_ms <= ? ORDER BY next_ms"
+        params: tuple = (table_id, now_ms)
+        if limit:
+            sql += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, params).fetchall()]
+
+    def upcoming_ids(self, table_id: str, now_ms: int, limit: Optional[int] = None) -> List[str]:
+        """尚未到期（下次练习时间 > now_ms）的错题，按下次练习时间升序（走 next_ms 索引）。"""
+        sql = "SELECT rid FROM practice WHERE table_id = ? AND next_ms > ? ORDER BY next_ms"
+        params: tuple = (table_id, now_ms)
+        if limit:
+            sql += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, params).fetchall()]
+
+    def not_due_ids(self, table_id: str, now_ms: int) -> Set[str]:
+        """有练习记录且尚未到期的错题（没有记录的题视为到期，由调用方补上）。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rid FROM practice WHERE table_id = ? AND next_ms > ?", (table_id, now_ms)
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    # ---- 待写回飞书的练习 ----
+
+    def enqueue(self, table_id: str, rid: str, entry: Dict[str, Any]) -> None:
+        """记下一次练习：更新本地状态并加入待写回队列（同一事务）。"""
+        row = self._row(table_id, rid, entry)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(_UPSERT, row)
+                self._conn.execute(
+                    "INSERT INTO outbox (table_id, rid, last_ms, mastery, count, next_ms) VALUES (?, ?, ?, ?, ?, ?)",
+                    (table_id, rid) + row[3:],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def pending(self, max_attempts: Optional[int] = None) -> List[tuple]:
+        """待写回的练习，按加入顺序返回 [(id, table_id, rid, entry)]；max_attempts 用于跳过反复失败的项。"""
+        sql = "SELECT id, table_id, rid, last_ms, mastery, count, next_ms FROM outbox"
+        params: tuple = ()
+        if max_attempts is not None:
+            sql += " WHERE attempts < ?"
+            params = (max_attempts,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [
+            (oid, table_id, rid, {P_FIELD_LAST: last_ms, P_FIELD_MASTERY: mastery, P_FIELD_COUNT: count, P_FIELD_NEXT: next_ms})
+            for oid, table_id, rid, last_ms, mastery, count, next_ms in rows
+        ]
+
+    def collapse_pending(self) -> int:
+        """
+        同一题有多条待写回时只保留最新的一条（按练习时间，相同时按加入顺序），返回移出的条数。
+        每条都是该题完整的练习状态，最新的一条已包含之前的练习次数；旧的一条若留在队列里，
+        在最新一条写回之后重试会把飞书和本地账本改回旧状态。
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE EXISTS ("
+                "SELECT 1 FROM outbox AS newer WHERE newer.table_id = outbox.table_id AND newer.rid = outbox.rid "
+                "AND (newer.last_ms > outbox.last_ms OR (newer.last_ms = outbox.last_ms AND newer.id > outbox.id)))"
+            )
+            return cur.rowcount
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def ack(self, outbox_id: int) -> None:
+        """已写回飞书，移出队列。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+
+    def fail(self, outbox_id: int, error: str) -> None:
+        """写回失败（非网络原因），记下次数与原因。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?", (error[:500], outbox_id)
+            )
+
+    # ---- 今日已练 ----
+
+    def mark_practiced(self, rid: str, day: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO practiced_today (day, rid) VALUES (?, ?)", (day or _today(), rid))
+
+    def practiced_on(self, day: Optional[str] = None) -> Set[str]:
+        day = day or _today()
+        with self._lock:
+            # 顺便清理过去的日期
+            self._conn.execute("DELETE FROM practiced_today WHERE day < ?", (day,))
+            return {r[0] for r in self._conn.execute("SELECT rid FROM practiced_today WHERE day = ?", (day,)).fetchall()}
+
+
+def compact_practice_table(token: str, practice_table_id: str, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    清理练习记录表中的重复行：每道错题只保留一行（上次练习时间最大的一条，练习次数取各行最大值），
+    其余行批量删除，然后全量同步本地账本。dry_run 时只统计不修改。
+    """
+    from feishu_client import batch_delete_practice_records, fetch_practice_rows, update_practice_record
+
+    started = time.time()
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    rows = fetch_practice_rows(token, practice_table_id)
+    for rid, entry in rows:
+        groups.setdefault(rid, []).append(entry)
+
+    to_delete: List[str] = []
+    to_update: List[tuple] = []
+    for rid, entries in groups.items():
+        if len(entries) < 2:
+            continue
+        entries.sort(key=lambda e: (e.get(P_FIELD_LAST) or 0, e.get(P_FIELD_COUNT) or 0), reverse=True)
+        keep = entries[0]
+        merged_count = max(int(e.get(P_FIELD_COUNT) or 0) for e in entries)
+        if merged_count > int(keep.get(P_FIELD_COUNT) or 0):
+            to_update.append((keep, merged_count))
+        to_delete.extend(e["practice_record_id"] for e in entries[1:] if e.get("practice_record_id"))
+
+    if not dry_run:
+        for keep, merged_count in to_update:
+            update_practice_record(
+                token, practice_table_id, keep["practice_record_id"], keep[P_FIELD_MASTERY], merged_count,
+                keep[P_FIELD_NEXT], last_ms=keep[P_FIELD_LAST],
+            )
+        if to_delete:
+            batch_delete_practice_records(token, practice_table_id, to_delete)
+        get_ledger().sync(token, practice_table_id, full=True)
+
+    return {
+        "rows": len(rows),
+        "questions": len(groups),
+        "duplicate_questions": sum(1 for entries in groups.values() if len(entries) > 1),
+        "deleted": len(to_delete),
+        "merged_counts": len(to_update),
+        "dry_run": dry_run,
+        "seconds": round(time.time() - started, 3),
+    }
+
+
+_ledger: Optional[PracticeLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> PracticeLedger:
+    """获取进程内共享的练习账本（数据目录下的 practice_ledger.sqlite3）。"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = PracticeLedger(str(get_data_dir() / _DB_NAME))
+        return _ledger
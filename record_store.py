@@ -0,0 +1,300 @@
+"""
+错题记录存储：进程内共享的记录与索引，以及磁盘上的记录快照。
+
+所有 Streamlit 会话共用同一份记录；超过有效期才重新同步，同步期间其他会话等待同一次同步，
+不会各自重复拉取整张表。快照保存在数据目录，供命令行、启动预热和进程重启后直接读取。
+记录变化后增量更新近似重复题索引（见 dedupe.py）。
+页面使用离线优先模式（background=True）：有本地记录就立即返回，过期的由后台线程重新同步（见 offline.py）。
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import count_cache
+from storage import atomic_write_json, get_data_dir, read_json
+
+_SNAPSHOT_NAME = "records_snapshot.json"
+
+# 记录有效期（秒），超过后下次访问时重新同步
+RECORDS_TTL = int(os.getenv("RECORDS_TTL_SECONDS", "120"))
+# 接入记录变更事件（events.py）后，整表轮询只作兜底，间隔放宽到该值
+RECORDS_FALLBACK_TTL = int(os.getenv("RECORDS_FALLBACK_TTL_SECONDS", "1800"))
+
+_events_enabled = False
+
+
+def enable_event_updates() -> None:
+    """事件服务启动后调用：之后的单条变更由事件推送，整表轮询改为兜底间隔。"""
+    global _events_enabled
+    _events_enabled = True
+
+
+def records_ttl() -> float:
+    """当前的整表同步间隔：接入变更事件时为 RECORDS_FALLBACK_TTL，否则为 RECORDS_TTL。"""
+    return RECORDS_FALLBACK_TTL if _events_enabled else RECORDS_TTL
+
+
+def save_snapshot(records: List[Dict], table_id: str, synced_at: Optional[float] = None) -> Dict:
+    """保存记录快照，返回快照元信息。synced_at 默认为当前时间（按事件增量修改时传入上次整表同步的时间）。"""
+    snapshot = {
+        "table_id": table_id,
+        "synced_at": synced_at or time.time(),
+        "count": len(records),
+        "records": records,
+    }
+    atomic_write_json(get_data_dir() / _SNAPSHOT_NAME, snapshot)
+    return {k: v for k, v in snapshot.items() if k != "records"}
+
+
+def load_snapshot(table_id: Optional[str] = None) -> Optional[Dict]:
+    """读取记录快照；指定 table_id 时只接受同一张表的快照。"""
+    snapshot = read_json(get_data_dir() / _SNAPSHOT_NAME)
+    if not snapshot or not isinstance(snapshot.get("records"), list):
+        return None
+    if table_id and snapshot.get("table_id") != table_id:
+        return None
+    return snapshot
+
+
+def _update_duplicates(records: List[Dict]) -> None:
+    """题库变化后增量更新近似重复题索引（见 dedupe.py）；出错不影响题库本身。"""
+    from dedupe import get_duplicate_index
+
+    try:
+        get_duplicate_index().update(records)
+    except Exception:  # noqa: BLE001
+        pass
+
+
+def _merge_changes(records: List[Dict], changes: Dict[str, Optional[Dict]]) -> Tuple[List[Dict], List[Dict]]:
+    """按 record_id 替换、删除（值为 None）或追加记录，返回 (新列表, 被替换或删除的旧记录)。"""
+    pending = dict(changes)
+    old: List[Dict] = []
+    merged: List[Dict] = []
+    for r in records:
+        rid = r.get("record_id")
+        if rid in pending:
+            old.append(r)
+            new = pending.pop(rid)
+            if new is not None:
+                merged.append(new)
+            continue
+        merged.append(r)
+    merged.extend(r for r in pending.values() if r is not None)
+    return merged, old
+
+
+class RecordStore:
+    """进程内的错题记录与索引（按 record_id、学科、知识点）。"""
+
+    def __init__(self, table_id: str):
+        self.table_id = table_id
+        self._lock = threading.RLock()
+        # 同步（网络请求）单独加锁：同步期间读取方仍可拿到旧记录，多个同步请求只拉取一次
+        self._sync_lock = threading.RLock()
+        self.records: List[Dict] = []
+        self.by_id: Dict[str, Dict] = {}
+        self.by_subject: Dict[str, List[Dict]] = {}
+        self.by_knowledge: Dict[str, List[Dict]] = {}
+        self.loaded_at = 0.0
+        self.source = ""
+        # 有变更没能应用（如事件处理失败）：不论有效期，下次访问或后台同步时整表同步
+        self.stale = False
+        self._stale_marks = 0
+        # 整表同步进行中收到的变更（record_id -> 新记录，None 表示删除）：拉取的数据早于这些变更，同步完成后重新应用
+        self._changes_during_sync: Optional[Dict[str, Optional[Dict]]] = None
+
+    def _set(self, records: List[Dict], loaded_at: float, source: str) -> None:
+        by_id: Dict[str, Dict] = {}
+        by_subject: Dict[str, List[Dict]] = {}
+        by_knowledge: Dict[str, List[Dict]] = {}
+        for r in records:
+            rid = r.get("record_id")
+            if rid:
+                by_id[rid] = r
+            if r.get("subject"):
+                by_subject.setdefault(r["subject"], []).append(r)
+            for kp in r.get("knowledge_points") or []:
+                by_knowledge.setdefault(kp, []).append(r)
+        self.records, self.by_id, self.by_subject, self.by_knowledge = records, by_id, by_subject, by_knowledge
+        self.loaded_at = loaded_at
+        self.source = source
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            self.stale = True
+            self._stale_marks += 1
+
+    def expired(self, max_age: float) -> bool:
+        return self.stale or self.age() > max_age
+
+    def age(self) -> float:
+        """距上次同步的秒数；尚未加载时为无穷大。"""
+        return time.time() - self.loaded_at if self.loaded_at else float("inf")
+
+    def _shard_subjects(self, token: str) -> List[str]:
+        """整表同步的分片依据：已知的学科（内存或快照），都没有时读取 学科 字段的选项。"""
+        from feishu_client import FULL_SYNC_WORKERS, fetch_field_options
+
+        if FULL_SYNC_WORKERS <= 1:
+            return []
+        if self.by_subject:
+            return list(self.by_subject)
+        snapshot = load_snapshot(self.table_id)
+        known = {r.get("subject") for r in (snapshot or {}).get("records") or [] if r.get("subject")}
+        return sorted(known) or fetch_field_options(token, "学科")
+
+    def sync(self, token: str) -> List[Dict]:
+        """从飞书拉取整张表（按学科分片并发）并保存快照。"""
+        from feishu_client import fetch_records
+        from metrics import timed
+        from records import parse_records
+
+        with self._sync_lock:
+            with self._lock:
+                self._changes_during_sync = {}
+                stale_marks = self._stale_marks
+            try:
+                raw = fetch_records(token, subjects=self._shard_subjects(token))
+                with timed("records.parse", items=len(raw)):
+                    records = parse_records(raw)
+                with self._lock:
+                    # 拉取期间到达的变更事件比拉取的数据新，重新应用一遍，不被整表结果覆盖
+                    changes = self._changes_during_sync or {}
+                    records, _ = _merge_changes(records, changes)
+                    self._set(records, time.time(), "feishu")
+                    # 同步期间又有变更没能应用时保持待同步标记
+                    self.stale = self._stale_marks != stale_marks
+            finally:
+                with self._lock:
+                    self._changes_during_sync = None
+            save_snapshot(records, self.table_id)
+            _update_duplicates(records)
+            return records
+
+    def apply_changes(self, upserts: List[Dict], deleted_ids: List[str]) -> List[Dict]:
+        """
+        应用单条记录的新增、修改、删除（来自变更事件，upserts 为已解析的记录），重建索引；
+        返回被替换或删除的旧记录，供调用方清理相关缓存。尚未加载记录时不做处理（下次同步自然拿到）。
+        上次整表同步时间不变，快照由调用方在一批变更处理完后保存。
+        """
+        changes: Dict[str, Optional[Dict]] = {rid: None for rid in deleted_ids}
+        changes.update((r["record_id"], r) for r in upserts if r.get("record_id"))
+        with self._lock:
+            if self._changes_during_sync is not None:
+                self._changes_during_sync.update(changes)
+            if not self.records:
+                return []
+            records, old = _merge_changes(self.records, changes)
+            self._set(records, self.loaded_at, self.source)
+        _update_duplicates(records)
+        return old
+
+    def save_snapshot(self) -> None:
+        with self._lock:
+            records, loaded_at = self.records, self.loaded_at
+        save_snapshot(records, self.table_id, synced_at=loaded_at)
+
+    def load_from_snapshot(self, max_age: Optional[float] = None) -> bool:
+        """从磁盘快照加载；快照不存在或超过 max_age 秒时返回 False。"""
+        snapshot = load_snapshot(self.table_id)
+        if not snapshot:
+            return False
+        if max_age is not None and time.time() - snapshot.get("synced_at", 0) > max_age:
+            return False
+        with self._lock:
+            self._set(snapshot["records"], snapshot["synced_at"], "snapshot")
+        _update_duplicates(snapshot["records"])
+        return True
+
+    def get_records(self, token: str, max_age: Optional[float] = None, background: bool = False) -> List[Dict]:
+        """
+        返回记录：内存或快照在有效期内（默认 records_ttl()）直接使用，否则同步一次。
+        background=True 时只要本地有记录（不论新旧）就立即返回，过期的交给后台线程同步；本地完全没有才等待同步。
+        """
+        if max_age is None:
+            max_age = records_ttl()
+        with self._lock:
+            if self.records and not self.expired(max_age):
+                count_cache("records", True)
+                return self.records
+            if not self.stale and self.load_from_snapshot(max_age):
+                count_cache("records", True)
+                return self.records
+            if background and (self.records or self.load_from_snapshot()):
+                from offline import request_sync
+
+                count_cache("records", True)
+                request_sync(token)
+                return self.records
+        count_cache("records", False)
+        with self._sync_lock:
+            # 等锁期间其他会话可能已经同步完
+            if self.records and not self.expired(max_age):
+                return self.records
+            return self.sync(token)
+
+
+_stores: Dict[str, RecordStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_record_store(table_id: Optional[str] = None) -> RecordStore:
+    """获取进程内共享的记录存储（默认错题表）。"""
+    if table_id is None:
+        from feishu_client import TABLE_ID
+        table_id = TABLE_ID
+    with _stores_lock:
+        if table_id not in _stores:
+            _stores[table_id] = RecordStore(table_id)
+        return _stores[table_id]
+
+
+# 练习记录内存缓存：practice_table_id -> (practice_map, 加载时间)
+# practice_map 由 save_practice_feedback 就地更新（同时写入本地账本），因此多个会话共用同一份仍保持最新
+_practice_cache: Dict[str, Any] = {}
+_practice_lock = threading.Lock()
+
+
+def sync_practice_ledger(token: str, practice_table_id: str, max_age: float = RECORDS_TTL, background: bool = False) -> None:
+    """
+    本地练习账本超过 max_age 秒未同步时与飞书增量同步一次（不读出练习记录）；
+    background=True 且账本已有数据时改由后台线程同步，不等待。
+    """
+    from offline import request_sync, watch_practice_table
+    from practice_ledger import get_ledger
+
+    watch_practice_table(practice_table_id)
+    ledger = get_ledger()
+    state = ledger.sync_state(practice_table_id)
+    if time.time() - state["synced_at"] > max_age:
+        if background and state["full_synced_at"]:
+            request_sync(token)
+        else:
+            ledger.sync(token, practice_table_id)
+
+
+def get_practice_map(
+    token: str, practice_table_id: str, max_age: float = RECORDS_TTL, background: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """
+    返回练习记录（错题record_id -> 练习状态）。数据来自本地账本（practice_ledger），
+    账本超过 max_age 秒未同步时先与飞书增量同步一次；background=True 且账本已有数据时改由后台线程同步，不等待。
+    """
+    from practice_ledger import get_ledger
+
+    with _practice_lock:
+        cached = _practice_cache.get(practice_table_id)
+        if cached and time.time() - cached[1] <= max_age:
+            return cached[0]
+        sync_practice_ledger(token, practice_table_id, max_age, background)
+        practice_map = get_ledger().practice_map(practice_table_id)
+        _practice_cache[practice_table_id] = (practice_map, time.time())
+        return practice_map
+
+
+def invalidate_practice_map(practice_table_id: str) -> None:
+    """账本在后台同步后调用，下次 get_practice_map 从账本重新读取。"""
+    with _practice_lock:
+        _practice_cache.pop(practice_table_id, None)
@@ -0,0 +1,139 @@
+"""
+错题记录模型：把飞书多维表格返回的原始记录解析为统一结构，并定义练习记录表的字段名。
+
+本模块不依赖 Streamlit，可在命令行、后台任务中直接使用。
+"""
+import hashlib
+import json
+from typing import Dict, List
+
+# 练习记录表字段名（与飞书多维表格中新建表一致）
+P_FIELD_RID = "错题record_id"
+P_FIELD_LAST = "上次练习时间"
+P_FIELD_MASTERY = "掌握程度"
+P_FIELD_COUNT = "练习次数"
+P_FIELD_NEXT = "下次练习时间"
+
+
+def normalize_to_list(value) -> List[str]:
+    """
+    将单值或列表字段统一转成字符串列表。
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v) for v in value if v is not None]
+    return [str(value)]
+
+
+def normalize_text(value) -> str:
+    """
+    将字段安全转换为字符串；列表会合并成换行分隔。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join([str(v) for v in value if v is not None]).strip()
+    return str(value).strip()
+
+
+def is_image_file(name: str, mime: str = None) -> bool:
+    """
+    判断是否为图片文件（根据MIME类型或文件扩展名）。
+    """
+    if mime:
+        return mime.startswith("image/")
+    if name:
+        ext = name.lower().split(".")[-1] if "." in name else ""
+        return ext in ["jpg", "jpeg", "png", "gif", "bmp", "webp", "svg"]
+    return False
+
+
+def extract_attachments(value) -> List[Dict]:
+    """
+    提取附件列表，兼容飞书多维表格附件字段常见结构。
+    """
+    if not isinstance(value, list):
+        return []
+    result = []
+    for item in value:
+        if not isinstance(item, dict):
+            continue
+        url = item.get("download_url") or item.get("tmp_url") or item.get("url")
+        name = item.get("name") or item.get("file_name") or "附件"
+        mime = item.get("mime_type") or item.get("type")
+        result.append(
+            {
+                "name": name,
+                "url": url,
+                "mime": mime,
+                "file_token": item.get("file_token") or "",
+                "size": item.get("size") or 0,
+            }
+        )
+    return result
+
+
+def record_version(record: Dict) -> str:
+    """
+    计算记录内容的版本指纹：题干、错因、知识点或任一附件变化都会得到新的版本。
+    附件只取稳定标识（file_token/名称/大小），不受临时下载链接变化影响。
+    """
+    content = {
+        "subject": record.get("subject"),
+        "knowledge_points": record.get("knowledge_points") or [],
+        "handwriting_text": record.get("handwriting_text") or "",
+        "reason_type": record.get("reason_type") or "",
+        "reason_detail": record.get("reason_detail") or "",
+        "attachments": [
+            [att.get("file_token") or att.get("url"), att.get("name"), att.get("mime"), att.get("size")]
+            for att in (record.get("attachments") or [])
+        ],
+    }
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_records(raw_records: List[Dict]) -> List[Dict]:
+    """
+    将飞书接口返回的记录解析为标准结构。
+    """
+    parsed = []
+    for item in raw_records:
+        fields = item.get("fields", {})
+        subject = fields.get("学科")
+        knowledge_points = normalize_to_list(fields.get("知识点"))
+        reason_type = normalize_text(fields.get("不会/做错"))
+        reason_detail = normalize_text(fields.get("不会/做错原因"))
+        
+        # 处理"去手写"字段：优先作为附件处理，否则作为文本
+        handwriting_raw = fields.get("去手写")
+        attachments = extract_attachments(handwriting_raw)
+        handwriting_text = ""
+        # 如果不是附件列表，则作为文本处理
+        if not attachments:
+            handwriting_text = normalize_text(handwriting_raw)
+        
+        # 获取创建时间（飞书API返回的是毫秒时间戳）
+        created_time = item.get("created_time", 0)
+        if isinstance(created_time, str):
+            try:
+                created_time = int(created_time)
+            except ValueError:
+                created_time = 0
+
+        record_id = item.get("record_id") or ""
+
+        record = {
+            "record_id": record_id,
+            "subject": subject,
+            "knowledge_points": knowledge_points,
+            "handwriting_text": handwriting_text,
+            "reason_type": reason_type,
+            "reason_detail": reason_detail,
+            "attachments": attachments,
+            "created_time": created_time,  # 毫秒时间戳
+        }
+        record["version"] = record_version(record)
+        parsed.append(record)
+    return parsed
@@ -0,0 +1,155 @@
+"""
+本地检索相似错题：点击「不会」时，先从题库里找一道同学科、同知识点、题干相近的已有错题作为类似题，
+毫秒级返回，没有足够相似的题时才调用大模型生成。
+
+按学科建立 BM25 倒排索引（题干文字，只有图片的题用已保存的图片转写；按汉字二元组与英文单词切分，纯数字不计入，避免只因数字相同而匹配），
+索引随题库列表按需重建（同一份题库所有会话共用）。相似度为候选题得分与查询题自身得分之比，
+低于 MIN_SIMILARITY 视为没有好的匹配。与查询题同一重复簇（见 dedupe.py）的题是同一道题，不作为类似题返回。
+"""
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import timed
+
+# BM25 参数
+K1 = 1.5
+B = 0.75
+# 相似度阈值（候选题得分 / 查询题自身得分）
+MIN_SIMILARITY = 0.35
+
+_TOKEN = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """汉字连续段切成二元组（单字段保留单字），英文与数字按单词；纯数字丢弃。"""
+    tokens: List[str] = []
+    for run in _TOKEN.findall((text or "").lower()):
+        if run.isdigit():
+            continue
+        if run.isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _document_text(record: Dict) -> str:
+    from llm import question_text
+
+    return question_text(record)
+
+
+class _SubjectIndex:
+    """一个学科的 BM25 倒排索引。"""
+
+    def __init__(self, records: Iterable[Dict]):
+        self.docs: List[Dict] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for r in records:
+            tokens = tokenize(_document_text(r))
+            if not tokens:
+                continue
+            doc = len(self.docs)
+            self.docs.append(r)
+            self.lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for t in tokens:
+                counts[t] = counts.get(t, 0) + 1
+            for t, tf in counts.items():
+                self.postings.setdefault(t, []).append((doc, tf))
+        n = len(self.docs)
+        self.avgdl = sum(self.lengths) / n if n else 1.0
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self.postings.items()}
+
+    def _term_score(self, term: str, tf: int, length: int) -> float:
+        return self.idf.get(term, 0.0) * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avgdl))
+
+    def search(self, tokens: List[str]) -> Tuple[Dict[int, float], float]:
+        """返回 ({文档序号: 得分}, 查询题自身得分)。"""
+        counts: Dict[str, int] = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        scores: Dict[int, float] = {}
+        for t in counts:
+            for doc, tf in self.postings.get(t, ()):
+                scores[doc] = scores.get(doc, 0.0) + self._term_score(t, tf, self.lengths[doc])
+        self_score = sum(self._term_score(t, tf, len(tokens)) for t, tf in counts.items())
+        return scores, self_score
+
+
+class Retriever:
+    """一份题库的检索索引，按学科懒加载。"""
+
+    def __init__(self, records: List[Dict]):
+        self.records = records
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _SubjectIndex] = {}
+
+    def _index(self, subject: str) -> _SubjectIndex:
+        with self._lock:
+            index = self._indexes.get(subject)
+            if index is None:
+                with timed("retrieval.index", subject=subject) as m:
+                    index = _SubjectIndex(r for r in self.records if r.get("subject") == subject)
+                    m.update(items=len(index.docs))
+                self._indexes[subject] = index
+            return index
+
+    def search(self, question: Dict, limit: int = 3, exclude: Iterable[str] = ()) -> List[Tuple[Dict, float]]:
+        """
+        找与该题同学科、至少有一个相同知识点、题干相近的已有错题，按相似度从高到低返回 [(记录, 相似度)]，
+        只返回相似度不低于 MIN_SIMILARITY 的。exclude 为不要返回的 record_id。
+        """
+        from dedupe import question_cluster
+
+        tokens = tokenize(_document_text(question))
+        subject = question.get("subject")
+        if not tokens or not subject:
+            return []
+        with timed("retrieval.search") as m:
+            index = self._index(subject)
+            scores, self_score = index.search(tokens)
+            if self_score <= 0:
+                return []
+            kps = set(question.get("knowledge_points") or [])
+            skip = set(exclude)
+            skip.add((question.get("record_id") or "").strip())
+            own_cluster = question_cluster(question)
+            threshold = MIN_SIMILARITY * self_score
+            candidates = [(score, doc) for doc, score in scores.items() if score >= threshold]
+            candidates.sort(reverse=True)
+            results = []
+            for score, doc in candidates:
+                if len(results) >= limit:
+                    break
+                r = index.docs[doc]
+                if r.get("record_id") in skip or (kps and not kps & set(r.get("knowledge_points") or [])):
+                    continue
+                if own_cluster is not None and question_cluster(r) == own_cluster:
+                    continue
+                results.append((r, round(min(score / self_score, 1.0), 3)))
+            m.update(items=len(results))
+        return results
+
+
+_retriever: Optional[Retriever] = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever(records: List[Dict]) -> Retriever:
+    """该题库列表的检索索引；题库同步后（新的列表）自动重建。"""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None or _retriever.records is not records:
+            _retriever = Retriever(records)
+        return _retriever
+
+
+def find_similar_in_bank(question: Dict, records: List[Dict], limit: int = 3, exclude: Iterable[str] = ()) -> List[Dict]:
+    """在题库中检索与该题相似的已有错题，没有足够相似的返回空列表。"""
+    return [r for r, _ in get_retriever(records).search(question, limit=limit, exclude=exclude)]
@@ -4,6 +4,25 @@ import sys
 import subprocess
 from pathlib import Path
 
+def warm_up_before_start(app_dir: Path) -> None:
+    """启动服务前预热令牌、题库、练习记录和到期题目的图片；失败不影响启动。设置 SKIP_WARMUP=1 可跳过。"""
+    if os.getenv("SKIP_WARMUP") == "1":
+        return
+    if str(app_dir) not in sys.path:
+        sys.path.insert(0, str(app_dir))
+    try:
+        from warmup import warm_up
+    except ImportError as e:
+        print(f"跳过预热：{e}")
+        return
+    print("正在预热（令牌、题库、练习记录、到期题目图片）...")
+    report = warm_up(log=lambda msg: print(f"  {msg}"))
+    if report["ok"]:
+        steps = "，".join(f"{name} {seconds:.2f}s" for name, seconds in report["steps"].items())
+        print(f"✓ 预热完成，用时 {report['seconds']:.2f} 秒（{steps}）")
+    else:
+        print(f"预热未完成：{report['error']}（不影响使用，首次打开页面时再加载）")
+
 def main():
     """启动 Streamlit 应用"""
     # 获取 exe 所在目录（打包后）
@@ -27,6 +46,11 @@ def main():
     # 设置工作目录
     os.chdir(app_file.parent)
     
+    # 预热缓存：在同一进程中启动 streamlit 时，预热结果直接被页面复用；
+    # 以子进程方式启动时，也能复用磁盘上的题库快照与图片缓存
+    warm_up_before_start(app_file.parent)
+    print("服务已就绪：http://localhost:8501")
+    
     # 启动 streamlit
     try:
         # 使用 streamlit 模块运行
@@ -0,0 +1,237 @@
+"""
+错题练习选题与复习间隔（艾宾浩斯遗忘曲线）。
+"""
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from feishu_client import create_practice_record, find_practice_record, update_practice_record
+from practice_ledger import get_ledger
+from records import P_FIELD_COUNT, P_FIELD_LAST, P_FIELD_MASTERY, P_FIELD_NEXT
+
+
+def _interval_days_for_mastered(n: int) -> int:
+    """「会」时按练习次数给出的间隔天数。"""
+    return {1: 1, 2: 3, 3: 7, 4: 14}.get(n, 30)
+
+
+def _is_candidate(r: Dict) -> bool:
+    """可练习的题：有 record_id，且有题干或附件。"""
+    return bool((r.get("record_id") or "").strip() and (r.get("handwriting_text") or r.get("attachments")))
+
+
+def pick_next_question(
+    filtered: List[Dict],
+    practice_map: Dict[str, Dict[str, Any]],
+    now_ms: int,
+) -> Optional[Dict]:
+    """
+    从筛选后的错题中选一道：下次练习时间<=now 优先，否则取下次练习时间最早；无练习记录视为 0 最优先。
+    """
+    def next_ts(r: Dict) -> int:
+        rid = (r.get("record_id") or "").strip()
+        if not rid:
+            return 0
+        p = practice_map.get(rid)
+        return int(p.get(P_FIELD_NEXT, 0) or 0) if p else 0
+
+    # 过滤：至少有 record_id、且 去手写 或 附件 非空
+    cand = [r for r in filtered if (r.get("record_id") or "").strip() and (r.get("handwriting_text") or r.get("attachments"))]
+    if not cand:
+        return None
+
+    # 排序：下次练习时间 <= now 的优先；否则按 下次练习时间 升序
+    cand.sort(key=lambda r: (0 if next_ts(r) <= now_ms else 1, next_ts(r)))
+    return cand[0]
+
+
+def due_questions(
+    records: List[Dict],
+    practice_map: Dict[str, Dict[str, Any]],
+    now_ms: int,
+    horizon_ms: int = 0,
+) -> List[Dict]:
+    """
+    返回在 now_ms + horizon_ms 之前到期的题目（无练习记录视为已到期），按下次练习时间升序。
+    只包含有 record_id 且有题干或附件的题目，与 pick_next_question 的候选条件一致。
+    """
+    due = []
+    for r in records:
+        rid = (r.get("record_id") or "").strip()
+        if not rid or not (r.get("handwriting_text") or r.get("attachments")):
+            continue
+        p = practice_map.get(rid)
+        next_ms = int(p.get(P_FIELD_NEXT, 0) or 0) if p else 0
+        if next_ms <= now_ms + horizon_ms:
+            due.append((next_ms, r))
+    due.sort(key=lambda x: x[0])
+    return [r for _, r in due]
+
+
+def due_questions_indexed(
+    records: List[Dict],
+    practice_table_id: str,
+    now_ms: int,
+) -> List[Dict]:
+    """
+    与 due_questions 结果相同，但到期判断走本地练习账本的 下次练习时间 索引，不需要先构造完整的 practice_map：
+    没有练习记录的题在前，其余按下次练习时间升序。
+    """
+    ledger = get_ledger()
+    due_ids = ledger.due_ids(practice_table_id, now_ms)
+    not_due = ledger.not_due_ids(practice_table_id, now_ms)
+    by_id = {(r.get("record_id") or "").strip(): r for r in records if _is_candidate(r)}
+    known = set(due_ids) | not_due
+    never = [r for rid, r in by_id.items() if rid not in known]
+    return never + [by_id[rid] for rid in due_ids if rid in by_id]
+
+
+def pick_next_due(
+    queue: List[Dict],
+    candidates: List[Dict],
+    practice_table_id: str,
+    now_ms: int,
+    exclude: Iterable[str] = (),
+) -> Optional[Dict]:
+    """
+    选题规则与 pick_next_question 相同，但不构造 practice_map：queue 为本轮的到期题（due_questions_indexed 的结果，就地弹出），
+    每次只在本地账本中按主键核对弹出的那道题是否仍到期。队列用完时按 下次练习时间 索引重新查一次到期题，
+    仍没有则取账本中下次练习时间最早的题。exclude 为不要选的 record_id（如今日已练）。
+    """
+    ledger = get_ledger()
+    skip = set(exclude)
+    for refill in (False, True):
+        if refill:
+            queue[:] = due_questions_indexed(candidates, practice_table_id, now_ms)
+        while queue:
+            q = queue.pop(0)
+            rid = (q.get("record_id") or "").strip()
+            if rid in skip:
+                continue
+            state = ledger.get(practice_table_id, rid)
+            if state is None or int(state[P_FIELD_NEXT] or 0) <= now_ms:
+                return q
+    # 没有到期的题：取下次练习时间最早的
+    by_id = {(r.get("record_id") or "").strip(): r for r in candidates if _is_candidate(r)}
+    for rid in ledger.upcoming_ids(practice_table_id, now_ms):
+        if rid in by_id and rid not in skip:
+            return by_id[rid]
+    return None
+
+
+# 同一题的练习写入串行执行，避免多个会话或后台线程同时为一题新建两行
+_write_locks: Dict[tuple, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+# 练习记录 client_token 的命名空间：由 表ID:错题ID:练习次数:练习时间 确定性生成，
+# 同一次练习重复提交（超时重试、后台重放）只会新建一行
+_CLIENT_TOKEN_NS = uuid.UUID("6f1c2a4e-9b7d-4f3a-8c55-2d0e9a1b7c43")
+
+
+def _write_lock(practice_table_id: str, question_record_id: str) -> threading.Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault((practice_table_id, question_record_id), threading.Lock())
+
+
+def _is_stale_record_error(exc: Exception) -> bool:
+    """更新时练习行已被删除（如被合并清理）。"""
+    text = str(exc)
+    return "RecordIdNotFound" in text or "1254043" in text
+
+
+def next_practice_state(prev: Optional[Dict[str, Any]], mastered: bool, now_ms: int) -> Dict[str, Any]:
+    """根据上一次的练习状态与本次 会/不会，算出新的练习状态（保留 practice_record_id）。"""
+    count = int((prev or {}).get(P_FIELD_COUNT, 0) or 0) + 1
+    if mastered:
+        next_ts_ms = now_ms + _interval_days_for_mastered(count) * 24 * 60 * 60 * 1000
+    else:
+        next_ts_ms = now_ms + 5 * 60 * 1000  # +5 分钟
+    return {
+        "practice_record_id": (prev or {}).get("practice_record_id"),
+        P_FIELD_LAST: now_ms,
+        P_FIELD_MASTERY: "会" if mastered else "不会",
+        P_FIELD_COUNT: count,
+        P_FIELD_NEXT: next_ts_ms,
+    }
+
+
+def save_practice_feedback(
+    token: str,
+    practice_table_id: str,
+    question_record_id: str,
+    mastered: bool,
+    practice_map: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> None:
+    """
+    根据用户选择 会/不会 记录一次练习。mastered=True 表示「会」，False 表示「不会」。
+    传入 practice_map 时以其中的状态为上一次练习并就地更新；不传时从本地账本读取该题的状态，
+    并让共享的 practice_map 缓存失效（练习页按账本索引选题，不需要完整的 practice_map）。
+    练习先记入本地账本的待写回队列，由后台线程写回飞书（见 offline.py），不等待飞书。
+    """
+    from offline import request_sync
+    from record_store import invalidate_practice_map
+
+    ledger = get_ledger()
+    if practice_map is None:
+        p = ledger.get(practice_table_id, question_record_id) if question_record_id else None
+    else:
+        p = practice_map.get(question_record_id) if question_record_id else None
+    entry = next_practice_state(p, mastered, int(time.time() * 1000))
+    if practice_map is not None:
+        if p is not None:
+            p.update(entry)
+        else:
+            practice_map[question_record_id] = entry
+    if not question_record_id:
+        return
+    ledger.enqueue(practice_table_id, question_record_id, entry)
+    if practice_map is None:
+        invalidate_practice_map(practice_table_id)
+    request_sync(token)
+
+
+def push_practice_state(token: str, practice_table_id: str, question_record_id: str, entry: Dict[str, Any]) -> str:
+    """
+    把一次练习写回飞书练习记录表，返回对应行的 record_id。
+    本地没有该题的行时先到飞书表查找，已有行则更新，确实没有才新建，避免同一题出现多行；
+    本地记的行已被删除时改为重新查找或新建。
+    """
+    with _write_lock(practice_table_id, question_record_id):
+        ledger = get_ledger()
+        local = ledger.get(practice_table_id, question_record_id)
+        practice_record_id = (local or {}).get("practice_record_id")
+        entry = dict(entry)
+        for use_local in (True, False):
+            if not (use_local and practice_record_id):
+                existing = find_practice_record(token, practice_table_id, question_record_id)
+                practice_record_id = existing["practice_record_id"] if existing else None
+                if existing and not (local or {}).get("practice_record_id") and existing[P_FIELD_LAST] < entry[P_FIELD_LAST]:
+                    # 本地没见过这行（账本尚未同步到），练习次数接着飞书上的算
+                    entry[P_FIELD_COUNT] = max(entry[P_FIELD_COUNT], int(existing[P_FIELD_COUNT] or 0) + 1)
+            if not practice_record_id:
+                break
+            try:
+                update_practice_record(
+                    token, practice_table_id, practice_record_id, entry[P_FIELD_MASTERY], entry[P_FIELD_COUNT],
+                    entry[P_FIELD_NEXT], last_ms=entry[P_FIELD_LAST],
+                )
+                break
+            except RuntimeError as e:
+                if not (use_local and _is_stale_record_error(e)):
+                    raise
+                practice_record_id = None
+        if not practice_record_id:
+            client_token = str(uuid.uuid5(
+                _CLIENT_TOKEN_NS,
+                f"{practice_table_id}:{question_record_id}:{entry[P_FIELD_COUNT]}:{entry[P_FIELD_LAST]}",
+            ))
+            practice_record_id = create_practice_record(
+                token, practice_table_id, question_record_id, entry[P_FIELD_MASTERY], entry[P_FIELD_COUNT],
+                entry[P_FIELD_NEXT], client_token=client_token, last_ms=entry[P_FIELD_LAST],
+            )
+        # 写回期间又练了这道题时，本地已是更新的状态（还在待写回队列中）：只记下对应的行，不回退练习状态
+        current = ledger.get(practice_table_id, question_record_id)
+        if current is None or entry[P_FIELD_LAST] >= int(current[P_FIELD_LAST] or 0):
+            ledger.upsert(practice_table_id, question_record_id, dict(entry, practice_record_id=practice_record_id))
+        ledger.set_practice_record_id(practice_table_id, question_record_id, practice_record_id)
+        return practice_record_id
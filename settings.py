@@ -0,0 +1,58 @@
+"""
+本地配置文件读写与不依赖 Streamlit 的配置读取（供命令行等场景使用）。
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def get_config_file_path() -> Path:
+    """
+    获取配置文件路径（在项目目录下的 .feishu_config.json）。
+    """
+    return Path(__file__).parent / ".feishu_config.json"
+
+
+def load_config() -> Dict[str, Optional[str]]:
+    """
+    从本地配置文件加载凭据。
+    """
+    config_file = get_config_file_path()
+    if config_file.exists():
+        try:
+            with open(config_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+
+def save_config(app_id: str, app_secret: str) -> None:
+    """
+    保存凭据到本地配置文件。
+    注意：在 Streamlit Cloud 等只读文件系统上，此操作会静默失败。
+    """
+    config_file = get_config_file_path()
+    try:
+        config = {"FEISHU_APP_ID": app_id, "FEISHU_APP_SECRET": app_secret}
+        with open(config_file, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        # 设置文件权限（仅所有者可读写）
+        if os.name != "nt":  # 非Windows系统
+            os.chmod(config_file, 0o600)
+    except (IOError, OSError, PermissionError):
+        # 在 Streamlit Cloud 等只读文件系统上，保存失败是正常的
+        # 配置应通过环境变量或 st.secrets 提供
+        pass
+    except Exception:
+        pass  # 其他错误也静默处理
+
+
+def get_setting(key: str, config: Optional[Dict] = None, default: Optional[str] = None) -> Optional[str]:
+    """
+    读取配置项：环境变量优先，其次本地配置文件。
+    """
+    if config is None:
+        config = load_config()
+    return os.getenv(key) or config.get(key) or default
@@ -0,0 +1,69 @@
+"""
+类似题后台生成：练习页不在 Streamlit 脚本线程里等待大模型，生成交给进程内线程池，页面只等待一个时间预算。
+
+同一道题（同一版本、同样道数）同时只生成一次，多个会话、点击「不会」与后台预生成共用同一个任务；
+生成两道及以上时结果写入类似题持久化缓存（llm.save_similar_to_store），其他会话和命令行也能直接用。
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from metrics import timed
+
+MAX_WORKERS = 4
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_inflight: Dict[str, Future] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="similar-gen")
+    return _executor
+
+
+def _job_key(question: Dict, count: int) -> str:
+    return f"{(question.get('record_id') or '').strip()}:{question.get('version') or ''}:{count}"
+
+
+def _generate(question: Dict, count: int, api_key: str, api_base: str, model: str, token: str, purpose: str) -> List[str]:
+    from llm import generate_similar_questions_with_llm, save_similar_to_store
+
+    with timed("similar.background", purpose=purpose) as m:
+        texts = generate_similar_questions_with_llm(question, count, api_key, api_base, model, token, purpose=purpose)
+        m.update(items=len(texts))
+    if count >= 2:
+        save_similar_to_store(question, texts)
+    return texts
+
+
+def submit_similar(
+    question: Dict, count: int, api_key: str, api_base: str = None, model: str = None, token: str = None, purpose: str = ""
+) -> Future:
+    """
+    在后台为该题生成 count 道类似题，立即返回 Future（结果为题目文字列表，失败时为异常）。
+    该题已有同样的任务在进行时直接返回那个任务。
+    """
+    key = _job_key(question, count)
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None and not future.done():
+            return future
+        future = _get_executor().submit(_generate, question, count, api_key, api_base, model, token, purpose)
+        _inflight[key] = future
+    future.add_done_callback(lambda f: _forget(key, f))
+    return future
+
+
+def _forget(key: str, future: Future) -> None:
+    with _lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def inflight_count() -> int:
+    """正在生成或排队的任务数。"""
+    with _lock:
+        return len(_inflight)
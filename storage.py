@@ -0,0 +1,138 @@
+"""
+本地数据目录与持久化小工具。
+
+导出任务、缓存等需要落盘的数据统一放在数据目录下（默认项目目录下的 .cuoti_data，
+可通过环境变量 CUOTI_DATA_DIR 覆盖）。写文件一律先写临时文件再替换，避免进程中断留下半个文件。
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+
+def get_data_dir(*parts: str) -> Path:
+    """返回数据目录（或其子目录），不存在时自动创建。"""
+    base = os.getenv("CUOTI_DATA_DIR") or str(Path(__file__).parent / ".cuoti_data")
+    path = Path(base).joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """原子写入二进制文件。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp-", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: Path, obj: Any) -> None:
+    """原子写入 JSON 文件（UTF-8，保留中文）。"""
+    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def read_json(path: Path, default: Optional[Any] = None) -> Any:
+    """读取 JSON 文件，文件不存在或损坏时返回 default。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class DiskCache:
+    """
+    以 key 为文件名的磁盘缓存（key 通常是内容指纹的十六进制串）。
+    读取时刷新文件修改时间，超出容量时按最近使用时间淘汰。
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = 500 * 1024 * 1024, prune_every: int = 20):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._puts = 0
+
+    @property
+    def root(self) -> Path:
+        return get_data_dir("cache", self.namespace)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """命中返回内容，未命中返回 None。"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """写入缓存；写入失败（如只读文件系统）时静默忽略。"""
+        try:
+            atomic_write_bytes(self._path(key), data)
+        except OSError:
+            return
+        self._puts += 1
+        if self._puts % self.prune_every == 1:
+            self.prune()
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get_json(self, key: str) -> Optional[Any]:
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            return None
+
+    def put_json(self, key: str, obj: Any) -> None:
+        self.put(key, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def prune(self) -> None:
+        """按最近使用时间淘汰，直到总大小不超过 max_bytes。"""
+        entries = []
+        total = 0
+        for path in self.root.glob("*/*"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if path.name.startswith(".tmp-"):
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,209 @@
+"""
+基准测试：在本地模拟服务（standin_server.py）与合成题库上测量热点路径，输出可在不同提交间对比的 JSON。
+
+覆盖：
+- fetch_parse      fetch_records + parse_records（整表分页拉取与解析）
+- fetch_sharded    按学科分片并发的整表拉取与解析（FEISHU_SYNC_WORKERS 路并发；--latency-ms 为 0 时看不出差别）
+- pick_next        pick_next_question（半数题目有练习记录）
+- build_doc_cold / build_doc_warm     Word 导出（缓存为空 / 单题片段已缓存）
+- build_html_cold / build_html_warm   HTML 导出
+- similar_paper    类似题试卷完整流程（大模型生成 + 导出 Word）
+
+每项运行 --repeat 次，报告中位数、最小、最大耗时（毫秒）；缓存与数据目录放在临时目录，不影响本机数据。
+
+用法：
+    python tools/bench.py                                    # 默认 1k、10k 两档题库
+    python tools/bench.py --sizes 1000,10000,50000 -o bench.json
+    python tools/bench.py --latency-ms 20 --llm-latency-ms 500 --compare bench_old.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from standin_server import StandinServer, standin_env  # noqa: E402
+from synth_bank import generate_bank  # noqa: E402
+
+# 导出类基准每份试卷的题数、类似题试卷的题数
+PAPER_QUESTIONS = 30
+SIMILAR_QUESTIONS = 10
+
+
+def _git_revision() -> Dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=str(ROOT), capture_output=True, text=True).stdout.strip())
+        return {"commit": rev, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def _measure(fn: Callable[[], Dict], repeat: int, before: Callable[[], None] = None) -> Dict:
+    times = []
+    extra: Dict = {}
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        extra = fn() or {}
+        times.append(time.perf_counter() - started)
+    result = {
+        "runs": repeat,
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "min_ms": round(min(times) * 1000, 2),
+        "max_ms": round(max(times) * 1000, 2),
+    }
+    result.update(extra)
+    return result
+
+
+def _paper_plan(records: List[Dict], subject: str, questions: int) -> Dict[str, int]:
+    """把 questions 道题平均分到该学科题目最多的几个知识点上。"""
+    counts: Dict[str, int] = {}
+    for r in records:
+        if r.get("subject") == subject:
+            for kp in r.get("knowledge_points") or []:
+                counts[kp] = counts.get(kp, 0) + 1
+    kps = sorted(counts, key=counts.get, reverse=True)[:5]
+    return {kp: questions // len(kps) + (1 if i < questions % len(kps) else 0) for i, kp in enumerate(kps)}
+
+
+def run_size(size: int, server: StandinServer, repeat: int, data_dir: Path) -> List[Dict]:
+    """对一档题库规模运行全部基准。"""
+    from exporters import build_doc, build_html
+    from feishu_client import FULL_SYNC_WORKERS, fetch_field_options, fetch_records, get_tenant_access_token
+    from papers import build_paper, select_questions
+    from records import P_FIELD_NEXT, parse_records
+    from scheduler import pick_next_question
+
+    server.set_items(generate_bank(size))
+    token = get_tenant_access_token("standin", "standin")
+    results = []
+
+    def clear_caches() -> None:
+        shutil.rmtree(data_dir / "cache", ignore_errors=True)
+
+    def fetch_parse() -> Dict:
+        raw = fetch_records(token)
+        return {"records": len(parse_records(raw))}
+
+    results.append(dict(bench="fetch_parse", size=size, **_measure(fetch_parse, repeat)))
+
+    def fetch_sharded() -> Dict:
+        subjects = fetch_field_options(token, "学科")
+        raw = fetch_records(token, subjects=subjects, max_workers=max(2, FULL_SYNC_WORKERS))
+        return {"records": len(parse_records(raw)), "shards": len(subjects) + 1}
+
+    results.append(dict(bench="fetch_sharded", size=size, **_measure(fetch_sharded, repeat)))
+    records = parse_records(fetch_records(token))
+
+    rng = random.Random(0)
+    now_ms = int(time.time() * 1000)
+    practice_map = {
+        r["record_id"]: {P_FIELD_NEXT: now_ms + rng.randint(-10, 10) * 86_400_000}
+        for r in records if rng.random() < 0.5
+    }
+    results.append(dict(bench="pick_next", size=size, **_measure(lambda: {"picked": bool(pick_next_question(records, practice_map, now_ms))}, repeat)))
+
+    subject = records[0]["subject"]
+    selections = select_questions(records, _paper_plan(records, subject, PAPER_QUESTIONS), random.Random(1))
+    n_questions = sum(len(qs) for qs in selections.values())
+
+    def doc() -> Dict:
+        return {"bytes": len(build_doc([subject], selections, token)), "questions": n_questions}
+
+    def html() -> Dict:
+        return {"bytes": len(build_html([subject], selections, token).encode("utf-8")), "questions": n_questions}
+
+    results.append(dict(bench="build_doc_cold", size=size, **_measure(doc, repeat, before=clear_caches)))
+    results.append(dict(bench="build_doc_warm", size=size, **_measure(doc, repeat)))
+    results.append(dict(bench="build_html_cold", size=size, **_measure(html, repeat, before=clear_caches)))
+    results.append(dict(bench="build_html_warm", size=size, **_measure(html, repeat)))
+
+    similar_plan = _paper_plan(records, subject, SIMILAR_QUESTIONS)
+    llm_settings = (os.environ["LLM_API_KEY"], os.environ["LLM_API_BASE"], None)
+
+    def similar() -> Dict:
+        data = build_paper(records, [subject], similar_plan, "docx", True, token, *llm_settings)
+        return {"bytes": len(data), "questions": SIMILAR_QUESTIONS}
+
+    results.append(dict(bench="similar_paper", size=size, **_measure(similar, repeat, before=clear_caches)))
+    return results
+
+
+def compare(current: Dict, previous: Dict) -> List[str]:
+    """按 (bench, size) 对比中位数耗时，返回可打印的行。"""
+    old = {(r["bench"], r["size"]): r for r in previous.get("results", [])}
+    lines = [f"对比基线 {previous.get('meta', {}).get('commit')} -> {current['meta'].get('commit')}"]
+    for r in current["results"]:
+        prev = old.get((r["bench"], r["size"]))
+        if not prev:
+            lines.append(f"  {r['bench']:<16} {r['size']:>6}  {r['median_ms']:>10.2f} ms  （基线无此项）")
+            continue
+        delta = (r["median_ms"] - prev["median_ms"]) / prev["median_ms"] * 100 if prev["median_ms"] else 0.0
+        lines.append(f"  {r['bench']:<16} {r['size']:>6}  {prev['median_ms']:>10.2f} -> {r['median_ms']:>10.2f} ms  {delta:+6.1f}%")
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="在本地模拟服务与合成题库上运行基准测试")
+    parser.add_argument("--sizes", default="1000,10000", help="题库规模，逗号分隔（默认 1000,10000）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟飞书接口延迟")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="模拟大模型接口延迟")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="模拟飞书接口限流（每秒请求数）")
+    parser.add_argument("-o", "--output", help="结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的结果文件对比")
+    args = parser.parse_args(argv)
+
+    server = StandinServer(latency_ms=args.latency_ms, llm_latency_ms=args.llm_latency_ms, rate_limit=args.rate_limit).start()
+    data_dir = Path(tempfile.mkdtemp(prefix="cuoti-bench-"))
+    # 必须在导入项目模块前设置：接口地址、表 ID 在导入时读取
+    os.environ.update(standin_env(server))
+    os.environ["CUOTI_DATA_DIR"] = str(data_dir)
+
+    results: List[Dict] = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            for r in run_size(size, server, args.repeat, data_dir):
+                results.append(r)
+                print(f"{r['bench']:<16} {size:>6}  median {r['median_ms']:>10.2f} ms  (min {r['min_ms']:.2f}, max {r['max_ms']:.2f})", file=sys.stderr)
+    finally:
+        server.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "meta": dict(
+            _git_revision(),
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            options={k: getattr(args, k) for k in ("sizes", "repeat", "latency_ms", "llm_latency_ms", "rate_limit")},
+        ),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print("\n".join(compare(report, json.load(f))), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
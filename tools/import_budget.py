@@ -0,0 +1,116 @@
+"""
+启动与导入耗时预算检查。
+
+在全新的子进程中逐个导入项目模块，测量导入耗时，并检查重量级依赖（requests、python-docx、Pillow 等）
+没有在导入阶段被提前加载。app 模块在 Streamlit 已导入的前提下测量，只统计项目自身的开销。
+
+用法：
+    python tools/import_budget.py            # 打印表格，超预算时返回 1
+    python tools/import_budget.py --json     # 输出 JSON，便于在不同提交间对比
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 导入阶段不应加载的重量级依赖
+HEAVY = ("requests", "docx", "lxml", "PIL")
+
+# 模块 -> (预算毫秒, 预先导入的模块)
+BUDGETS = {
+    "storage": (30, None),
+    "records": (30, None),
+    "settings": (30, None),
+    "metrics": (30, None),
+    "offline": (30, None),
+    "events": (30, None),
+    "dedupe": (30, None),
+    "retrieval": (30, None),
+    "feishu_client": (50, None),
+    "scheduler": (50, None),
+    "similar_jobs": (30, None),
+    "record_store": (50, None),
+    "practice_ledger": (50, None),
+    "llm": (50, None),
+    "llm_router": (30, None),
+    "usage": (30, None),
+    "aio": (30, None),
+    "exporters": (60, None),
+    "papers": (60, None),
+    "export_jobs": (60, None),
+    "batch": (100, None),
+    "cli": (50, None),
+    "app": (150, "streamlit"),
+}
+
+# 命令行整体启动（含解释器启动）的预算
+CLI_STARTUP_BUDGET_MS = 500
+
+_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+{pre}
+t = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - t) * 1000
+print(json.dumps({{"ms": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, pre: str = None) -> dict:
+    code = _SNIPPET.format(root=str(ROOT), pre=f"import {pre}" if pre else "", module=module, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], cwd=str(ROOT), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure_cli_startup() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, str(ROOT / "cli.py"), "--help"], cwd=str(ROOT), capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查模块导入耗时预算")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取中位数（默认 3）")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    results = []
+    for module, (budget, pre) in BUDGETS.items():
+        runs = [measure_import(module, pre) for _ in range(args.repeat)]
+        ms = statistics.median(r["ms"] for r in runs)
+        heavy = sorted({m for r in runs for m in r["heavy"]})
+        results.append({
+            "name": f"import {module}",
+            "ms": round(ms, 1),
+            "budget_ms": budget,
+            "heavy": heavy,
+            "ok": ms <= budget and not heavy,
+        })
+    cli_ms = statistics.median(measure_cli_startup() for _ in range(args.repeat))
+    results.append({
+        "name": "cli.py --help",
+        "ms": round(cli_ms, 1),
+        "budget_ms": CLI_STARTUP_BUDGET_MS,
+        "heavy": [],
+        "ok": cli_ms <= CLI_STARTUP_BUDGET_MS,
+    })
+
+    ok = all(r["ok"] for r in results)
+    if args.json:
+        print(json.dumps({"ok": ok, "python": sys.version.split()[0], "results": results}, ensure_ascii=False, indent=2))
+    else:
+        for r in results:
+            mark = "✓" if r["ok"] else "✗"
+            extra = f"  提前导入：{', '.join(r['heavy'])}" if r["heavy"] else ""
+            print(f"{mark} {r['name']:<22} {r['ms']:>7.1f} ms / {r['budget_ms']} ms{extra}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
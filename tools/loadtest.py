@@ -0,0 +1,279 @@
+"""
+多会话压力测试：在本地模拟服务上并发驱动多个模拟会话走真实的 app.py main() 流程，
+估算一个实例能同时服务多少学生。
+
+每个会话：打开主页 → 进入错题练习 → 开始练习 → 随机点击「会了/不会」若干次 → 返回主页 → 生成试卷（Word）。
+会话数按 --sessions 逐级增加，每级报告：
+- 各类点击的延迟 p50/p95/最大值（秒）
+- 每个会话占用的内存（进程 RSS 增量 / 会话数）
+- CPU 利用率（进程 CPU 时间 / 墙钟时间 / CPU 核数）
+- 外部接口请求速率（模拟服务统计的每秒请求数，含被限流次数）
+- 导出任务耗时
+
+会话由 Streamlit 的 AppTest 驱动（与浏览器会话执行同一脚本，但不经过 websocket），
+结果用于比较不同提交、不同配置之间的容量变化，而不是精确的线上数字。
+
+用法：
+    python tools/loadtest.py --sessions 1,5,10,20 --clicks 10 --latency-ms 30 --llm-latency-ms 500
+    python tools/loadtest.py --sessions 10 --size 10000 -o loadtest.json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from standin_server import StandinServer, standin_env  # noqa: E402
+from synth_bank import generate_bank  # noqa: E402
+
+PRACTICE_TABLE_ID = "tblStandinPractice"
+
+
+def _rss_bytes() -> int:
+    """当前进程常驻内存（Linux 读 /proc，其他平台退回 ru_maxrss 峰值）。"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _patch_apptest_for_threads() -> None:
+    """
+    AppTest 原本只在单线程中使用，并发运行多个会话前做两处调整：
+    - 每次运行结束都会把全局 Runtime 置空，其他会话会报 "Runtime hasn't been created!"，
+      这里让 Runtime.instance() 在被置空时回退到最近一次的模拟 Runtime；
+    - 每次运行都会重新编译脚本，Python 3.11 中多线程同时解析 AST 偶尔报
+      "AST constructor recursion depth mismatch"，这里把编译串行化（只锁编译，不锁脚本执行）。
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    original_instance = Runtime.instance.__func__
+    last: Dict = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in last:
+            return last["runtime"]
+        return original_instance(cls)
+
+    Runtime.instance = classmethod(instance)
+
+    original_get_bytecode = ScriptCache.get_bytecode
+    compile_lock = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            return original_get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = get_bytecode
+
+
+class _Session:
+    """一个模拟会话：按流程点击，记录每次点击（脚本重新运行）的耗时。"""
+
+    def __init__(self, idx: int, clicks: int, export: bool, samples: Dict[str, List[float]], errors: List[str], lock: threading.Lock):
+        from streamlit.testing.v1 import AppTest
+
+        self.idx = idx
+        self.clicks = clicks
+        self.export = export
+        self.samples = samples
+        self.errors = errors
+        self.lock = lock
+        self.rng = random.Random(idx)
+        self.completed = False
+        self.at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=300)
+
+    def _timed(self, action: str, fn) -> bool:
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as exc:  # noqa: BLE001
+            with self.lock:
+                self.errors.append(f"会话{self.idx} {action}: {exc}")
+            return False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples.setdefault(action, []).append(elapsed)
+            if self.at.exception:
+                self.errors.append(f"会话{self.idx} {action}: {self.at.exception[0].value}")
+        return not self.at.exception
+
+    def _click(self, action: str, key: str) -> bool:
+        buttons = [b for b in self.at.button if b.key == key]
+        if not buttons:
+            return False
+        return self._timed(action, lambda: buttons[0].click().run())
+
+    def run(self) -> None:
+        if not self._timed("open_home", self.at.run):
+            return
+        if not self._click("open_practice", "home_practice_btn") or not self._click("practice_start", "practice_start"):
+            return
+        for _ in range(self.clicks):
+            key = self.rng.choice(("practice_btn_yes", "practice_btn_no"))
+            if not self._click("click_yes" if key.endswith("yes") else "click_no", key):
+                return
+        if self.export:
+            if not (
+                self._click("back_home", "practice_back_bottom")
+                and self._click("open_exam", "home_exam_btn")
+                and self._click("export_submit", "exam_word")
+            ):
+                return
+        self.completed = True
+
+
+def run_level(n_sessions: int, args, server: StandinServer) -> Dict:
+    """以 n_sessions 个并发会话跑一轮，返回本级统计。"""
+    from export_jobs import JOB_DONE, JOB_FAILED, get_job_manager
+
+    samples: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    lock = threading.Lock()
+    gc.collect()
+    rss_before = _rss_bytes()
+    stats_before = server.stats()
+    cpu_before = time.process_time()
+    started = time.time()
+
+    sessions = [_Session(i, args.clicks, not args.no_export, samples, errors, lock) for i in range(n_sessions)]
+    threads = []
+    for i, session in enumerate(sessions):
+        t = threading.Thread(target=session.run, name=f"session-{i}", daemon=True)
+        t.start()
+        threads.append(t)
+        if args.ramp:
+            time.sleep(args.ramp / n_sessions)
+    for t in threads:
+        t.join()
+
+    # 等待本级提交的导出任务完成
+    jobs = []
+    deadline = time.time() + args.job_timeout
+    while time.time() < deadline:
+        jobs = [j for j in get_job_manager().list_jobs(limit=1000) if j.get("created_at", 0) >= started]
+        if all(j.get("status") in (JOB_DONE, JOB_FAILED) for j in jobs):
+            break
+        time.sleep(0.2)
+
+    wall = time.time() - started
+    cpu = time.process_time() - cpu_before
+    rss_after = _rss_bytes()
+    stats_after = server.stats()
+    requests = {k: stats_after.get(k, 0) - stats_before.get(k, 0) for k in stats_after}
+    durations = [j["duration"] for j in jobs if j.get("status") == JOB_DONE and j.get("duration") is not None]
+    level = {
+        "sessions": n_sessions,
+        "completed": sum(1 for session in sessions if session.completed),
+        "wall_seconds": round(wall, 2),
+        "cpu_utilization": round(cpu / wall / (os.cpu_count() or 1), 3) if wall else 0.0,
+        "memory_per_session_mb": round((rss_after - rss_before) / n_sessions / 1024 / 1024, 2),
+        "rss_mb": round(rss_after / 1024 / 1024, 1),
+        "actions": {
+            action: {
+                "count": len(values),
+                "p50_s": round(statistics.median(values), 3),
+                "p95_s": round(_pct(values, 0.95), 3),
+                "max_s": round(max(values), 3),
+            }
+            for action, values in sorted(samples.items())
+        },
+        "requests_per_second": {k: round(v / wall, 2) for k, v in sorted(requests.items()) if v},
+        "export_jobs": {
+            "count": len(jobs),
+            "failed": sum(1 for j in jobs if j.get("status") == JOB_FAILED),
+            "p50_s": round(statistics.median(durations), 2) if durations else None,
+            "max_s": round(max(durations), 2) if durations else None,
+        },
+        "errors": errors[:20],
+    }
+    del sessions
+    return level
+
+
+def _print_level(level: Dict) -> None:
+    clicks = [v for k, v in level["actions"].items() if k.startswith("click_")]
+    click_p95 = max((v["p95_s"] for v in clicks), default=0.0)
+    rps = sum(level["requests_per_second"].values())
+    print(
+        f"会话 {level['sessions']:>3}（完成 {level['completed']}）  点击 p95 {click_p95:6.3f}s  CPU {level['cpu_utilization'] * 100:5.1f}%  "
+        f"内存/会话 {level['memory_per_session_mb']:6.2f}MB  外部请求 {rps:7.1f}/s  "
+        f"导出 p50 {level['export_jobs']['p50_s']}s  错误 {len(level['errors'])}",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="多会话压力测试（本地模拟服务 + 真实页面流程）")
+    parser.add_argument("--sessions", default="1,5,10", help="逐级并发会话数，逗号分隔（默认 1,5,10）")
+    parser.add_argument("--clicks", type=int, default=10, help="每个会话点击「会了/不会」的次数")
+    parser.add_argument("--size", type=int, default=1000, help="合成题库题数")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="模拟飞书接口延迟")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="模拟大模型接口延迟")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="模拟飞书接口限流（每秒请求数）")
+    parser.add_argument("--ramp", type=float, default=1.0, help="每级内所有会话在多少秒内陆续启动")
+    parser.add_argument("--no-export", action="store_true", help="会话不生成试卷")
+    parser.add_argument("--job-timeout", type=float, default=300.0, help="每级等待导出任务完成的最长秒数")
+    parser.add_argument("-o", "--output", help="结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    server = StandinServer(
+        generate_bank(args.size), latency_ms=args.latency_ms, llm_latency_ms=args.llm_latency_ms, rate_limit=args.rate_limit
+    ).start()
+    data_dir = Path(tempfile.mkdtemp(prefix="cuoti-load-"))
+    # 必须在导入项目模块前设置
+    os.environ.update(standin_env(server))
+    os.environ.update(CUOTI_DATA_DIR=str(data_dir), FEISHU_PRACTICE_TABLE_ID=PRACTICE_TABLE_ID)
+
+    _patch_apptest_for_threads()
+    levels = []
+    try:
+        for n in (int(s) for s in args.sessions.split(",") if s.strip()):
+            level = run_level(n, args, server)
+            levels.append(level)
+            _print_level(level)
+    finally:
+        server.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "options": {k: getattr(args, k) for k in ("sessions", "clicks", "size", "latency_ms", "llm_latency_ms", "rate_limit")},
+        "cpu_count": os.cpu_count(),
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
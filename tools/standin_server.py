@@ -0,0 +1,536 @@
+"""
+飞书多维表格与大模型接口的本地模拟服务，用于基准测试与压力测试。
+
+模拟的接口（路径与真实接口一致，FEISHU_API_BASE 指向 <地址>/open-apis、LLM_API_BASE 指向 <地址>/llm 即可）：
+- POST /open-apis/auth/v3/tenant_access_token/internal/
+- POST /open-apis/bitable/v1/apps/<app>/tables/<table>/records/search   错题表返回合成题库，其他表视为练习记录表（支持 sort 与 is/isNot 条件的 filter）
+- GET  /open-apis/bitable/v1/apps/<app>/tables/<table>/fields           字段列表（学科 为单选字段）
+- POST /open-apis/bitable/v1/apps/<app>/tables/<table>/records          新建练习记录（支持 client_token 幂等）
+- POST /open-apis/bitable/v1/apps/<app>/tables/<table>/records/batch_delete  批量删除练习记录
+- POST /open-apis/bitable/v1/apps/<app>/tables/<table>/records/batch_get     按 record_id 读取错题
+- POST /open-apis/drive/v1/files/<app>/subscribe                        订阅记录变更事件（只计数）
+- PUT  /open-apis/bitable/v1/apps/<app>/tables/<table>/records/<id>     更新练习记录
+- GET  /open-apis/drive/v1/medias/<file_token>/download                 图片附件（可选先返回临时下载地址 JSON）
+- POST /llm/chat/completions                                           按提示词要求的道数返回类似题（转写提示词返回一道题）
+另有 GET /_stats 返回各接口请求数、限流次数，POST /_reset 清空统计与练习记录。
+
+延迟、抖动、限流（每秒请求数，超出返回 HTTP 429）与每页最大条数都可配置。
+
+记录变更事件：指定 event_url（即本项目事件服务的 /feishu/events 地址）后，add_record / edit_record / delete_record
+修改错题表并按飞书格式推送 drive.file.bitable_record_changed_v1 事件；命令行 --mutate-every 定时随机修改题库。
+
+用法：
+    python tools/standin_server.py --size 10000 --latency-ms 30 --llm-latency-ms 800 --rate-limit 50
+    python tools/standin_server.py --bank bank_10k.json --port 8765 --media-indirect
+    python tools/standin_server.py --event-url http://127.0.0.1:8502/feishu/events --mutate-every 5
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from synth_bank import generate_bank, make_png
+
+DEFAULT_APP_TOKEN = "standinApp"
+DEFAULT_TABLE_ID = "tblStandinBank"
+
+_RE_SEARCH = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records/search$")
+_RE_RECORDS = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records$")
+_RE_BATCH_DELETE = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records/batch_delete$")
+_RE_BATCH_GET = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records/batch_get$")
+_RE_FIELDS = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/fields$")
+_RE_SUBSCRIBE = re.compile(r"^/open-apis/drive/v1/files/([^/]+)/subscribe$")
+_RE_RECORD = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records/([^/]+)$")
+_RE_MEDIA = re.compile(r"^/open-apis/drive/v1/medias/([^/]+)/download$")
+_RE_MEDIA_TMP = re.compile(r"^/_tmp_media/([^/]+)$")
+_RE_COUNT = re.compile(r"生成\s*(\d+)\s*道")
+
+
+class _RateLimiter:
+    """令牌桶：rate 为每秒请求数，0 表示不限。"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def _automatic_fields(item: Dict, body: Dict) -> Dict:
+    """与飞书一致：请求中没有 automatic_fields=true 时不返回 created_time 等系统字段。"""
+    if body.get("automatic_fields"):
+        return item
+    return {k: v for k, v in item.items() if k not in ("created_time", "last_modified_time")}
+
+
+class StandinServer:
+    """模拟服务：start() 后在后台线程运行，base_url 为根地址。"""
+
+    def __init__(
+        self,
+        items: Optional[List[Dict]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        table_id: str = DEFAULT_TABLE_ID,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        llm_latency_ms: float = 0.0,
+        rate_limit: float = 0.0,
+        max_page_size: int = 500,
+        media_indirect: bool = False,
+        image_size: tuple = (160, 120),
+        event_url: Optional[str] = None,
+        app_token: str = DEFAULT_APP_TOKEN,
+    ):
+        self.items = items or []
+        self.table_id = table_id
+        self.event_url = event_url
+        self.app_token = app_token
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.max_page_size = max_page_size
+        self.media_indirect = media_indirect
+        self.image_size = image_size
+        self._limiter = _RateLimiter(rate_limit)
+        self._lock = threading.Lock()
+        self._practice: Dict[str, Dict[str, Dict]] = {}
+        self._client_tokens: Dict[str, Dict] = {}
+        self._stats: Dict[str, int] = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandinServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def set_items(self, items: List[Dict]) -> None:
+        with self._lock:
+            self.items = items
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._practice.clear()
+            self._client_tokens.clear()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + 1
+
+    def _sleep(self, base_ms: float) -> None:
+        delay = base_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    # ---- 修改错题表并推送变更事件 ----
+
+    def add_record(self, fields: Dict) -> str:
+        record_id = "recN" + uuid.uuid4().hex[:12]
+        with self._lock:
+            self.items = self.items + [{"record_id": record_id, "fields": dict(fields), "created_time": int(time.time() * 1000)}]
+        self.post_event("record_added", [record_id])
+        return record_id
+
+    def edit_record(self, record_id: str, fields: Dict) -> bool:
+        with self._lock:
+            items = [dict(it, fields=dict(it["fields"], **fields)) if it["record_id"] == record_id else it for it in self.items]
+            found = items != self.items
+            self.items = items
+        if found:
+            self.post_event("record_edited", [record_id])
+        return found
+
+    def delete_record(self, record_id: str) -> bool:
+        with self._lock:
+            items = [it for it in self.items if it["record_id"] != record_id]
+            found = len(items) != len(self.items)
+            self.items = items
+        if found:
+            self.post_event("record_deleted", [record_id])
+        return found
+
+    def post_event(self, action: str, record_ids: List[str], event_id: Optional[str] = None) -> Optional[int]:
+        """按飞书事件格式（schema 2.0）推送一条记录变更事件，返回 HTTP 状态码；未设置 event_url 时不推送。"""
+        if not self.event_url:
+            return None
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+
+        payload = {
+            "schema": "2.0",
+            "header": {
+                "event_id": event_id or uuid.uuid4().hex,
+                "event_type": "drive.file.bitable_record_changed_v1",
+                "create_time": str(int(time.time() * 1000)),
+                "token": os.getenv("FEISHU_EVENT_TOKEN", ""),
+                "app_id": "standin",
+            },
+            "event": {
+                "file_token": self.app_token,
+                "file_type": "bitable",
+                "table_id": self.table_id,
+                "action_list": [{"record_id": rid, "action": action} for rid in record_ids],
+            },
+        }
+        request = Request(self.event_url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"})
+        self._count("event_posted")
+        try:
+            with urlopen(request, timeout=5) as resp:
+                return resp.status
+        except HTTPError as exc:
+            return exc.code
+        except URLError:
+            self._count("event_failed")
+            return None
+
+    def mutate_randomly(self, rng: random.Random) -> str:
+        """随机新增、修改或删除一道题，返回动作名。"""
+        with self._lock:
+            items = list(self.items)
+        roll = rng.random()
+        if roll < 0.2 or not items:
+            template = rng.choice(items)["fields"] if items else {"学科": "数学", "知识点": ["数学知识点01"]}
+            self.add_record(dict(template, 去手写=f"新录入的错题 {uuid.uuid4().hex[:6]}"))
+            return "record_added"
+        target = rng.choice(items)["record_id"]
+        if roll < 0.3:
+            self.delete_record(target)
+            return "record_deleted"
+        self.edit_record(target, {"不会/做错原因": rng.choice(("概念不清", "计算粗心", "审题错误", "方法不会"))})
+        return "record_edited"
+
+    # ---- 各接口 ----
+
+    def _search(self, table_id: str, body: Dict) -> Dict:
+        page_size = max(1, min(int(body.get("page_size") or 20), self.max_page_size))
+        offset = int(body.get("page_token") or 0)
+        with self._lock:
+            source = self.items if table_id == self.table_id else list(self._practice.get(table_id, {}).values())
+            for cond in (body.get("filter") or {}).get("conditions") or []:
+                name, values = cond.get("field_name"), cond.get("value", [])
+                if cond.get("operator") == "is":
+                    source = [it for it in source if str(it["fields"].get(name)) in values]
+                elif cond.get("operator") == "isNot":
+                    source = [it for it in source if str(it["fields"].get(name)) not in values]
+            for rule in reversed(body.get("sort") or []):
+                source = sorted(source, key=lambda it, f=rule.get("field_name"): it["fields"].get(f) or 0, reverse=bool(rule.get("desc")))
+            page = source[offset:offset + page_size]
+            total = len(source)
+        if table_id == self.table_id:
+            page = [self._with_media_urls(item) for item in page]
+        page = [_automatic_fields(item, body) for item in page]
+        has_more = offset + page_size < total
+        data = {"items": page, "has_more": has_more, "total": total}
+        if has_more:
+            data["page_token"] = str(offset + page_size)
+        return {"code": 0, "msg": "success", "data": data}
+
+    def _with_media_urls(self, item: Dict) -> Dict:
+        value = item.get("fields", {}).get("去手写")
+        if not isinstance(value, list):
+            return item
+        fields = dict(item["fields"])
+        fields["去手写"] = [
+            dict(att, url=f"{self.base_url}/open-apis{att['url']}") if att.get("url", "").startswith("/") else att
+            for att in value
+        ]
+        return dict(item, fields=fields)
+
+    def _create(self, table_id: str, body: Dict, client_token: Optional[str] = None) -> Dict:
+        with self._lock:
+            if client_token and client_token in self._client_tokens:
+                return {"code": 0, "msg": "success", "data": {"record": self._client_tokens[client_token]}}
+            record_id = "recP" + uuid.uuid4().hex[:12]
+            record = {"record_id": record_id, "fields": body.get("fields") or {}}
+            self._practice.setdefault(table_id, {})[record_id] = record
+            if client_token:
+                self._client_tokens[client_token] = record
+        return {"code": 0, "msg": "success", "data": {"record": record}}
+
+    def _fields(self) -> Dict:
+        with self._lock:
+            subjects = sorted({str(it["fields"].get("学科")) for it in self.items if it["fields"].get("学科")})
+        items = [
+            {"field_id": "fldSubject", "field_name": "学科", "type": 3, "property": {"options": [{"name": s} for s in subjects]}},
+            {"field_id": "fldKnowledge", "field_name": "知识点", "type": 4},
+            {"field_id": "fldHandwriting", "field_name": "去手写", "type": 17},
+        ]
+        return {"code": 0, "msg": "success", "data": {"items": items, "has_more": False, "total": len(items)}}
+
+    def _batch_get(self, table_id: str, body: Dict) -> Dict:
+        wanted = set(body.get("record_ids") or [])
+        with self._lock:
+            source = self.items if table_id == self.table_id else list(self._practice.get(table_id, {}).values())
+            found = [it for it in source if it["record_id"] in wanted]
+        if table_id == self.table_id:
+            found = [self._with_media_urls(item) for item in found]
+        found = [_automatic_fields(item, body) for item in found]
+        return {"code": 0, "msg": "success", "data": {"records": found}}
+
+    def _batch_delete(self, table_id: str, body: Dict) -> Dict:
+        results = []
+        with self._lock:
+            rows = self._practice.setdefault(table_id, {})
+            for record_id in body.get("records") or []:
+                results.append({"record_id": record_id, "deleted": rows.pop(record_id, None) is not None})
+        return {"code": 0, "msg": "success", "data": {"records": results}}
+
+    def _update(self, table_id: str, record_id: str, body: Dict) -> Dict:
+        with self._lock:
+            record = self._practice.setdefault(table_id, {}).get(record_id)
+            if record is None:
+                return {"code": 1254043, "msg": "RecordIdNotFound"}
+            record["fields"].update(body.get("fields") or {})
+        return {"code": 0, "msg": "success", "data": {"record": record}}
+
+    def _chat(self, body: Dict) -> Dict:
+        prompt = ""
+        for message in body.get("messages") or []:
+            content = message.get("content")
+            if isinstance(content, list):
+                prompt += "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            elif isinstance(content, str):
+                prompt += content
+        n = random.randint(10, 99)
+        if "转写为文字" in prompt:
+            lines = [f"（模拟转写）已知 x + {n} = {2 * n}，求 x 的值。"]
+        else:
+            match = _RE_COUNT.search(prompt)
+            count = int(match.group(1)) if match else 1
+            lines = [f"（模拟）已知 x + {n + i} = {2 * n + i}，求 x 的值。" for i in range(count)]
+        completion_tokens = sum(len(line) for line in lines)
+        return {
+            "id": uuid.uuid4().hex,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "\n".join(lines)}}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": completion_tokens, "total_tokens": len(prompt) + completion_tokens},
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头与正文分两次写出：复用连接的客户端（连接池）否则会撞上 Nagle 与延迟确认，每个请求多等约 40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_json(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                if not length:
+                    return {}
+                try:
+                    return json.loads(self.rfile.read(length).decode("utf-8"))
+                except ValueError:
+                    return {}
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, obj: Dict, status: int = 200) -> None:
+                self._send(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+            def _limited(self, name: str) -> bool:
+                server._count(name)
+                if server._limiter.allow():
+                    return False
+                server._count("rate_limited")
+                self._json({"code": 99991400, "msg": "request trigger frequency limit"}, status=429)
+                return True
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/_stats":
+                    self._json(server.stats())
+                    return
+                media = _RE_MEDIA.match(path)
+                if media:
+                    if self._limited("media_download"):
+                        return
+                    server._sleep(server.latency_ms)
+                    file_token = media.group(1)
+                    if server.media_indirect:
+                        tmp_url = f"{server.base_url}/_tmp_media/{file_token}"
+                        self._json({"code": 0, "data": {"tmp_download_urls": [{"file_token": file_token, "tmp_download_url": tmp_url}]}})
+                    else:
+                        self._send(200, make_png(file_token, *server.image_size), "image/png")
+                    return
+                if _RE_FIELDS.match(path):
+                    if self._limited("bitable_fields"):
+                        return
+                    server._sleep(server.latency_ms)
+                    self._json(server._fields())
+                    return
+                tmp = _RE_MEDIA_TMP.match(path)
+                if tmp:
+                    server._count("media_tmp_download")
+                    server._sleep(server.latency_ms)
+                    self._send(200, make_png(tmp.group(1), *server.image_size), "image/png")
+                    return
+                self._json({"code": 404, "msg": "not found"}, status=404)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._read_json()
+                if path == "/_reset":
+                    server.reset()
+                    self._json({"code": 0})
+                    return
+                if path.startswith("/open-apis/auth/v3/tenant_access_token"):
+                    server._count("tenant_token")
+                    self._json({"code": 0, "msg": "ok", "tenant_access_token": "t-standin", "expire": 7200})
+                    return
+                search = _RE_SEARCH.match(path)
+                if search:
+                    if self._limited("bitable_search"):
+                        return
+                    server._sleep(server.latency_ms)
+                    self._json(server._search(search.group(2), body))
+                    return
+                batch_get = _RE_BATCH_GET.match(path)
+                if batch_get:
+                    if self._limited("record_batch_get"):
+                        return
+                    server._sleep(server.latency_ms)
+                    self._json(server._batch_get(batch_get.group(2), body))
+                    return
+                if _RE_SUBSCRIBE.match(path):
+                    server._count("subscribe")
+                    self._json({"code": 0, "msg": "success", "data": {}})
+                    return
+                delete = _RE_BATCH_DELETE.match(path)
+                if delete:
+                    if self._limited("record_delete"):
+                        return
+                    server._sleep(server.latency_ms)
+                    self._json(server._batch_delete(delete.group(2), body))
+                    return
+                records = _RE_RECORDS.match(path)
+                if records:
+                    if self._limited("record_create"):
+                        return
+                    server._sleep(server.latency_ms)
+                    client_token = (parse_qs(urlparse(self.path).query).get("client_token") or [None])[0]
+                    self._json(server._create(records.group(2), body, client_token))
+                    return
+                if path.endswith("/chat/completions"):
+                    server._count("chat_completions")
+                    server._sleep(server.llm_latency_ms)
+                    self._json(server._chat(body))
+                    return
+                self._json({"code": 404, "msg": "not found"}, status=404)
+
+            def do_PUT(self):
+                path = urlparse(self.path).path
+                body = self._read_json()
+                record = _RE_RECORD.match(path)
+                if record:
+                    if self._limited("record_update"):
+                        return
+                    server._sleep(server.latency_ms)
+                    self._json(server._update(record.group(2), record.group(3), body))
+                    return
+                self._json({"code": 404, "msg": "not found"}, status=404)
+
+        return Handler
+
+
+def standin_env(server: StandinServer, app_token: str = DEFAULT_APP_TOKEN) -> Dict[str, str]:
+    """让本项目连接模拟服务所需的环境变量（需在导入 feishu_client / llm 之前设置）。"""
+    return {
+        "FEISHU_API_BASE": f"{server.base_url}/open-apis",
+        "FEISHU_APP_TOKEN": app_token,
+        "FEISHU_TABLE_ID": server.table_id,
+        "FEISHU_APP_ID": "standin",
+        "FEISHU_APP_SECRET": "standin",
+        "LLM_API_BASE": f"{server.base_url}/llm",
+        "LLM_API_KEY": "standin",
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="飞书多维表格 / 大模型接口的本地模拟服务")
+    parser.add_argument("--bank", help="synth_bank.py 生成的题库文件")
+    parser.add_argument("--size", type=int, default=1000, help="未指定 --bank 时现场生成的题目数（默认 1000）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="飞书接口固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="额外随机延迟上限")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="大模型接口延迟")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="飞书接口每秒请求上限，超出返回 429（0 为不限）")
+    parser.add_argument("--max-page-size", type=int, default=500)
+    parser.add_argument("--media-indirect", action="store_true", help="附件下载先返回临时下载地址 JSON")
+    parser.add_argument("--event-url", help="记录变更事件推送地址（本项目事件服务的 /feishu/events）")
+    parser.add_argument("--mutate-every", type=float, default=0.0, help="每隔多少秒随机修改一道题并推送事件（0 为不修改）")
+    args = parser.parse_args(argv)
+
+    if args.bank:
+        with open(args.bank, "r", encoding="utf-8") as f:
+            items = json.load(f)["items"]
+    else:
+        items = generate_bank(args.size)
+    server = StandinServer(
+        items, args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        llm_latency_ms=args.llm_latency_ms, rate_limit=args.rate_limit, max_page_size=args.max_page_size,
+        media_indirect=args.media_indirect, event_url=args.event_url,
+    ).start()
+    print(f"模拟服务已启动：{server.base_url}（{len(items)} 道题）")
+    for key, value in standin_env(server).items():
+        print(f"  {key}={value}")
+    rng = random.Random(0)
+    try:
+        while True:
+            if args.mutate_every > 0:
+                time.sleep(args.mutate_every)
+                print(f"推送事件：{server.mutate_randomly(rng)}")
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+生成合成错题库，供本地模拟服务（standin_server.py）与基准测试（bench.py）使用。
+
+题库是飞书 records/search 返回的原始记录列表（与 feishu_client.fetch_records 的返回值结构相同），
+按固定随机种子生成，同样的参数总是得到同样的题库，便于在不同提交之间对比。
+图片附件只记录 file_token，图片内容由模拟服务按 file_token 确定性地生成。
+
+用法：
+    python tools/synth_bank.py 10000 -o bank_10k.json
+    python tools/synth_bank.py 1000 --image-ratio 0.8 --seed 7 -o bank_1k.json
+"""
+import argparse
+import json
+import random
+import struct
+import sys
+import zlib
+from typing import Dict, List
+
+SUBJECTS = ("数学", "语文", "英语", "物理", "化学")
+KNOWLEDGE_POINTS_PER_SUBJECT = 12
+REASONS = ("不会", "做错")
+REASON_DETAILS = ("概念不清", "计算粗心", "审题错误", "方法不会", "")
+
+# 合成记录的创建时间起点（毫秒），每道题递增一分钟
+_BASE_CREATED_MS = 1_700_000_000_000
+
+
+def knowledge_points(subject: str) -> List[str]:
+    return [f"{subject}知识点{i + 1:02d}" for i in range(KNOWLEDGE_POINTS_PER_SUBJECT)]
+
+
+def media_path(file_token: str) -> str:
+    """附件下载路径（相对于 FEISHU_API_BASE），模拟服务返回记录时补全为完整地址。"""
+    return f"/drive/v1/medias/{file_token}/download"
+
+
+def generate_bank(size: int, seed: int = 42, image_ratio: float = 0.6, max_images: int = 2) -> List[Dict]:
+    """生成 size 道题的原始记录。image_ratio 为带图片附件（而非文字题干）的题目比例。"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(size):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        kps = rng.sample(knowledge_points(subject), rng.choice((1, 1, 1, 2)))
+        fields: Dict = {
+            "学科": subject,
+            "知识点": kps,
+            "不会/做错": rng.choice(REASONS),
+            "不会/做错原因": rng.choice(REASON_DETAILS),
+        }
+        if rng.random() < image_ratio:
+            attachments = []
+            for j in range(rng.randint(1, max_images)):
+                file_token = f"ft{seed}x{i:06d}x{j}"
+                attachments.append({
+                    "file_token": file_token,
+                    "name": f"题目{i + 1}_{j + 1}.png",
+                    "type": "image/png",
+                    "size": 0,
+                    "url": media_path(file_token),
+                })
+            fields["去手写"] = attachments
+        else:
+            a, b = rng.randint(2, 99), rng.randint(2, 99)
+            fields["去手写"] = f"第{i + 1}题：已知 x + {a} = {a + b}，求 x 的值，并写出检验过程。"
+        items.append({
+            "record_id": f"rec{seed}x{i:06d}",
+            "fields": fields,
+            "created_time": _BASE_CREATED_MS + i * 60_000,
+        })
+    return items
+
+
+def make_png(file_token: str, width: int = 160, height: int = 120) -> bytes:
+    """按 file_token 确定性地生成一张噪点 PNG（几乎不可压缩，大小约 width*height*3 字节）。"""
+    rng = random.Random(file_token)
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="生成合成错题库（飞书 records/search 原始记录格式）")
+    parser.add_argument("size", type=int, help="题目数量，如 1000 / 10000 / 50000")
+    parser.add_argument("-o", "--output", required=True, help="输出 JSON 文件")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--image-ratio", type=float, default=0.6, help="带图片附件的题目比例（默认 0.6）")
+    parser.add_argument("--max-images", type=int, default=2, help="每道题最多几张图片（默认 2）")
+    args = parser.parse_args(argv)
+
+    items = generate_bank(args.size, args.seed, args.image_ratio, args.max_images)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"seed": args.seed, "items": items}, f, ensure_ascii=False)
+    images = sum(len(it["fields"]["去手写"]) for it in items if isinstance(it["fields"]["去手写"], list))
+    print(json.dumps({"questions": len(items), "images": images, "output": args.output}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
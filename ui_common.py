@@ -0,0 +1,67 @@
+"""
+页面公共组件：读取 st.secrets、在页面中渲染题目。
+"""
+import io
+from typing import Dict, Optional
+
+import streamlit as st
+
+from feishu_client import fetch_attachment_cached, read_cached_attachment
+from records import is_image_file
+
+
+def _load_image_bytes_for_display(url: str, token: str, file_token: str = "") -> Optional[bytes]:
+    """
+    下载附件图片用于 Streamlit 展示，支持飞书临时 JSON。
+    先读磁盘缓存：离线启动时 token 为空，已缓存的图片照常显示，只有未缓存的才需要令牌下载。
+    """
+    if not url:
+        return None
+    cached = read_cached_attachment(url, file_token)
+    if cached is not None or not token:
+        return cached
+    data, _, _ = fetch_attachment_cached(url, token, file_token=file_token)
+    return data
+
+
+def render_question_streamlit(record: Dict, token: str) -> None:
+    """在 Streamlit 中渲染一道题的文本与图片。"""
+    t = (record.get("handwriting_text") or "").strip()
+    if t:
+        st.markdown(t)
+    for att in (record.get("attachments") or []):
+        if not is_image_file(att.get("name"), att.get("mime")):
+            continue
+        url = att.get("url")
+        raw = _load_image_bytes_for_display(url, token, att.get("file_token") or "")
+        if raw:
+            try:
+                st.image(io.BytesIO(raw))
+            except Exception:
+                pass
+
+
+def safe_get_secret(key: str):
+    """
+    安全读取 st.secrets，支持两种格式：
+    1. 直接格式: KEY = "value"
+    2. 嵌套格式: [secrets] 下的 KEY = "value"
+    """
+    try:
+        # 方式1: 直接访问
+        value = st.secrets.get(key)
+        if value is not None and value != "":
+            return value
+    except:
+        pass
+    
+    try:
+        # 方式2: 从 [secrets] 嵌套结构读取
+        if "secrets" in st.secrets:
+            value = st.secrets["secrets"].get(key)
+            if value is not None and value != "":
+                return value
+    except:
+        pass
+    
+    return None
@@ -0,0 +1,113 @@
+"""
+诊断页面（隐藏）：在地址后加 ?diag=1 打开，查看各阶段耗时统计并导出 JSON Lines。
+"""
+import time
+
+import streamlit as st
+
+from metrics import export_jsonl, recent_events, reset, summary
+from warmup import load_last_report
+
+
+def _format_bytes(n: int) -> str:
+    if n >= 1024 * 1024:
+        return f"{n / 1024 / 1024:.1f} MB"
+    if n >= 1024:
+        return f"{n / 1024:.1f} KB"
+    return f"{n} B"
+
+
+def render_diagnostics_page() -> None:
+    st.title("🔧 性能诊断")
+    st.caption("统计来自当前服务进程（所有会话共用），只保留每个阶段最近 1000 次采样；服务重启后清空。")
+
+    rows = summary()
+    if rows:
+        st.markdown("### 各阶段耗时")
+        st.table([
+            {
+                "阶段": r["stage"],
+                "次数": r["count"],
+                "失败": r["errors"],
+                "字节": _format_bytes(r["bytes"]),
+                "p50 (ms)": r["p50_ms"],
+                "p95 (ms)": r["p95_ms"],
+                "最大 (ms)": r["max_ms"],
+            }
+            for r in rows
+        ])
+    else:
+        st.info("暂无数据：打开练习或生成试卷页面后再来查看。")
+
+    events = recent_events(limit=50)
+    if events:
+        with st.expander("最近 50 条记录"):
+            st.table(events)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "导出 JSON Lines",
+            data=export_jsonl(),
+            file_name=f"metrics_{time.strftime('%Y%m%d_%H%M%S')}.jsonl",
+            mime="application/x-ndjson",
+            key="diag_export",
+        )
+    with col2:
+        if st.button("清空统计", key="diag_reset"):
+            reset()
+            st.rerun()
+
+    report = load_last_report()
+    if report:
+        st.markdown("### 最近一次启动预热")
+        st.json(report, expanded=False)
+
+    st.markdown("### 后台同步")
+    from dedupe import get_duplicate_index
+    from events import event_stats
+    from offline import sync_status
+
+    st.json(dict(sync_status(), events=event_stats(), duplicates=get_duplicate_index().stats()), expanded=False)
+
+    st.markdown("### 大模型路由")
+    from llm_router import router_stats
+
+    st.json(router_stats(), expanded=False)
+
+    _render_llm_usage()
+
+
+def _render_llm_usage() -> None:
+    """大模型用量：最近 7 天按天、用途、模型汇总，可导出明细 CSV。"""
+    from usage import get_usage_ledger, report_csv
+
+    st.markdown("### 大模型用量（最近 7 天）")
+    ledger = get_usage_ledger()
+    rows = ledger.summary(days=7)
+    if not rows:
+        st.info("暂无大模型调用记录。")
+        return
+    st.table([
+        {
+            "日期": r["day"],
+            "用途": r["purpose"] or "-",
+            "模型": r["model"],
+            "次数": r["calls"],
+            "失败": r["errors"],
+            "输入 token": r["prompt_tokens"],
+            "输出 token": r["completion_tokens"],
+            "平均 (s)": r["avg_seconds"],
+            "最大 (s)": r["max_seconds"],
+            "截断": r["truncated"],
+            "费用 (元)": "-" if r["cost"] is None else r["cost"],
+        }
+        for r in rows
+    ])
+    st.download_button(
+        "导出调用明细 CSV",
+        data=report_csv(ledger.rows(days=7)).encode("utf-8-sig"),
+        file_name=f"llm_usage_{time.strftime('%Y%m%d')}.csv",
+        mime="text/csv",
+        key="diag_usage_export",
+    )
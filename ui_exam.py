@@ -0,0 +1,206 @@
+"""
+生成试卷页面：选择学科、知识点与题数，提交后台导出任务并展示任务进度与下载。
+"""
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import streamlit as st
+
+from export_jobs import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, get_job_manager
+from papers import (
+    SimilarCheckpoint,
+    build_paper,
+    filter_by_subjects,
+    paper_mime,
+    paper_title,
+    similar_job_id,
+    similar_reference_questions,
+)
+
+
+_JOB_STATUS_LABELS = {
+    JOB_PENDING: "⏳ 排队中",
+    JOB_RUNNING: "⚙️ 生成中",
+    JOB_DONE: "✓ 已完成",
+    JOB_FAILED: "✗ 失败",
+}
+
+
+def _render_retry(job: Dict, retry: Optional[Callable[[Dict], None]]) -> None:
+    """类似题试卷有题生成失败或任务中断时，显示失败题数与重试按钮（已生成的题从断点复用）。"""
+    if not job.get("checkpoint") or not job.get("paper") or retry is None:
+        return
+    counts = SimilarCheckpoint(job["checkpoint"]).counts()
+    if job.get("status") == JOB_DONE:
+        if not counts["failed"]:
+            return
+        st.warning(f"{counts['failed']} 道类似题生成失败，试卷中缺少这些题")
+        label = "重试失败的题"
+    else:
+        label = f"重试（已生成的 {counts['done']} 道直接复用）" if counts["done"] else "重试"
+    if st.button(label, key=f"job_retry_{job['job_id']}"):
+        retry(job)
+        st.rerun()
+
+
+def _render_export_jobs(retry: Optional[Callable[[Dict], None]] = None):
+    """渲染导出任务列表：生成中的任务自动刷新进度，已完成的提供下载（可跨会话下载）；类似题试卷可从断点重试。"""
+    manager = get_job_manager()
+    jobs = manager.list_jobs(limit=10)
+    if not jobs:
+        return
+    
+    active = any(j.get("status") in (JOB_PENDING, JOB_RUNNING) for j in jobs)
+    mine = set(st.session_state.get("export_job_ids", []))
+    
+    st.markdown("---")
+    st.markdown("### 导出任务")
+    st.caption("生成在后台进行，离开页面不会中断；完成后可随时回来下载。")
+    
+    @st.fragment(run_every=1.0 if active else None)
+    def _jobs_fragment():
+        current = manager.list_jobs(limit=10)
+        for job in current:
+            job_id = job["job_id"]
+            status = job.get("status")
+            created = datetime.fromtimestamp(job.get("created_at") or 0).strftime("%m-%d %H:%M")
+            tag = "（本次）" if job_id in mine else ""
+            st.markdown(f"**{job.get('title') or job_id}** {tag}  \n{_JOB_STATUS_LABELS.get(status, status)} · {created}")
+            if status in (JOB_PENDING, JOB_RUNNING):
+                st.progress(float(job.get("progress") or 0.0), text=job.get("message") or "")
+            elif status == JOB_DONE:
+                data = manager.read_artifact(job_id)
+                if data is not None:
+                    st.download_button(
+                        "📥 下载",
+                        data=data,
+                        file_name=job.get("filename") or f"{job_id}.bin",
+                        mime=job.get("mime") or "application/octet-stream",
+                        key=f"job_dl_{job_id}",
+                    )
+                _render_retry(job, retry)
+            else:
+                st.error(f"生成失败：{job.get('error') or '未知错误'}")
+                _render_retry(job, retry)
+        # 所有任务结束后整页刷新一次，停止轮询
+        if active and not any(j.get("status") in (JOB_PENDING, JOB_RUNNING) for j in current):
+            st.rerun()
+    
+    _jobs_fragment()
+
+
+def render_exam_page(token, records, llm_api_key, llm_api_base, llm_model):
+    """渲染生成试卷页面"""
+    # 返回按钮
+    if st.button("← 返回主页", key="exam_back"):
+        st.session_state["current_page"] = "home"
+        st.rerun()
+    
+    st.title("📄 生成试卷")
+    st.caption("选择学科和知识点，生成错题专项训练")
+    
+    # 学科选择
+    subjects = sorted({r["subject"] for r in records if r.get("subject")})
+    if not subjects:
+        st.warning("没有找到学科数据")
+        return
+    
+    selected_subjects = st.multiselect("选择学科", options=subjects, default=subjects, key="exam_subjects")
+    if not selected_subjects:
+        st.info("请选择至少一个学科")
+        return
+    
+    filtered = [r for r in records if r.get("subject") in selected_subjects]
+    
+    # 知识点选择
+    knowledge_options = sorted({kp for r in filtered for kp in r.get("knowledge_points") or []})
+    selected_kp = st.multiselect("选择知识点", options=knowledge_options, default=knowledge_options, key="exam_kp")
+    
+    # 每个知识点的题目数量
+    selected_plan: Dict[str, int] = {}
+    for kp in selected_kp:
+        pool = [r for r in filtered if kp in (r.get("knowledge_points") or [])]
+        max_count = len(pool)
+        count = st.number_input(f"{kp}（最多 {max_count} 题）", min_value=0, max_value=max_count, value=max_count, key=f"exam_count_{kp}")
+        selected_plan[kp] = count
+    
+    # 显示当前选择的总题目数量
+    total_count = sum(selected_plan.values())
+    st.markdown(f"### 当前选择题目数量：{total_count} 道")
+    
+    has_valid_selection = any(count > 0 for count in selected_plan.values())
+    
+    if not has_valid_selection:
+        st.info("请至少选择一道题目")
+        return
+    
+    def submit_export(similar: bool, fmt: str, subjects: Optional[list] = None, plan: Optional[Dict] = None) -> None:
+        if not token:
+            # 离线启动（本次用本地数据，尚无令牌）：未缓存的图片无法下载，类似题也无法生成
+            st.warning("飞书暂时连不上（离线模式），网络恢复后再生成试卷")
+            return
+        subjects = list(subjects or selected_subjects)
+        plan = dict(plan or selected_plan)
+        label = "Word" if fmt == "docx" else "HTML"
+        title = paper_title(subjects, similar)
+        extra = None
+        if similar:
+            # 记下断点标识与组卷参数：中途失败后可从断点重试
+            references = similar_reference_questions(filter_by_subjects(records, subjects), plan)
+            extra = {"checkpoint": similar_job_id(references), "paper": {"subjects": subjects, "plan": plan, "fmt": fmt}}
+        
+        def work(report) -> bytes:
+            # 在后台任务线程中运行，不能调用 st.*
+            return build_paper(
+                records, subjects, plan, fmt, similar, token,
+                llm_api_key, llm_api_base, llm_model, report=report,
+            )
+        
+        job_id = get_job_manager().submit(
+            title=f"{title.replace('_', ' ')}（{label}）",
+            filename=f"{title}.{fmt}",
+            mime=paper_mime(fmt),
+            work=work,
+            extra=extra,
+        )
+        st.session_state.setdefault("export_job_ids", []).insert(0, job_id)
+        st.toast("已提交后台生成，可在下方「导出任务」查看进度")
+    
+    st.markdown("---")
+    st.markdown("### 生成原题试卷")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("生成 Word 文档", type="primary", use_container_width=True, key="exam_word"):
+            submit_export(False, "docx")
+    
+    with col2:
+        if st.button("生成 HTML 文档", type="primary", use_container_width=True, key="exam_html"):
+            submit_export(False, "html")
+    
+    st.markdown("---")
+    st.markdown("### 生成类似题试卷")
+    
+    if not llm_api_key:
+        st.warning("⚠️ 需要配置智谱AI API Key 才能生成类似题目")
+    else:
+        col3, col4 = st.columns(2)
+        with col3:
+            if st.button("生成类似题 Word", type="primary", use_container_width=True, key="exam_similar_word"):
+                submit_export(True, "docx")
+        
+        with col4:
+            if st.button("生成类似题 HTML", type="primary", use_container_width=True, key="exam_similar_html"):
+                submit_export(True, "html")
+    
+    def retry_export(job: Dict) -> None:
+        paper = job["paper"]
+        submit_export(True, paper["fmt"], paper["subjects"], paper["plan"])
+    
+    _render_export_jobs(retry_export)
+    
+    # 底部返回按钮
+    st.markdown("---")
+    if st.button("← 返回主页", key="exam_back_bottom"):
+        st.session_state["current_page"] = "home"
+        st.rerun()
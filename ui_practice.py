@@ -0,0 +1,499 @@
+"""
+错题练习页面：按艾宾浩斯遗忘曲线选题，「不会」时出类似题，并在后台预生成类似题。
+
+大模型调用都在后台线程池中进行（见 similar_jobs.py）：点击「不会」最多等待 PRACTICE_LATENCY_BUDGET 秒，
+类似题没有按时生成好就先出下一道题，生成好后在页面上方提示，可随时切过去练。
+"""
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from llm import load_similar_from_store, save_similar_to_store
+from metrics import set_session_gauge
+from practice_ledger import get_ledger
+from record_store import sync_practice_ledger
+from retrieval import find_similar_in_bank
+from scheduler import due_questions_indexed, pick_next_due, save_practice_feedback
+from similar_jobs import submit_similar
+from ui_common import render_question_streamlit, safe_get_secret
+
+# 每次点击等待类似题的时间上限（秒）
+PRACTICE_LATENCY_BUDGET = float(os.getenv("PRACTICE_LATENCY_BUDGET_SECONDS", "3"))
+
+# 离开练习页时清理的会话状态
+_PRACTICE_STATE_KEYS = (
+    "practice_current", "practice_origin", "practice_is_similar", "practice_similar_count", "practice_due_queue",
+    "practice_filtered", "practice_table_id", "pregenerate_queue", "pregenerate_done", "pregenerate_pending",
+    "pregenerate_failed", "practice_bank_shown", "practice_deferred",
+)
+
+
+def _get_today_str() -> str:
+    """获取今天的日期字符串"""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _init_daily_practice_tracking():
+    """初始化每日练习追踪，每天重置；今日已练的题目从本地账本恢复（刷新页面、换设备不丢失）"""
+    today = _get_today_str()
+    if st.session_state.get("practice_date") != today:
+        st.session_state["practiced_today"] = get_ledger().practiced_on(today)
+        st.session_state["practice_date"] = today
+        st.session_state["similar_cache"] = {}  # 每天也清空缓存
+        st.session_state["pregenerate_queue"] = []
+        st.session_state["pregenerate_done"] = set()
+        st.session_state["pregenerate_pending"] = {}
+        st.session_state["pregenerate_failed"] = set()
+
+
+def _mark_practiced_today(record_id: str):
+    """标记某题今日已练过"""
+    if not record_id:
+        return
+    _init_daily_practice_tracking()
+    practiced = st.session_state.get("practiced_today", set())
+    practiced.add(record_id)
+    st.session_state["practiced_today"] = practiced
+    get_ledger().mark_practiced(record_id, st.session_state["practice_date"])
+
+
+def _is_practiced_today(record_id: str) -> bool:
+    """检查某题今日是否已练过"""
+    if not record_id:
+        return False
+    _init_daily_practice_tracking()
+    return record_id in st.session_state.get("practiced_today", set())
+
+
+def _practiced_today_ids() -> set:
+    """今日已练过的题目（含其他会话、其他设备今日练过的）"""
+    _init_daily_practice_tracking()
+    return st.session_state.get("practiced_today", set()) | get_ledger().practiced_on(st.session_state["practice_date"])
+
+
+def _filter_not_practiced_today(questions: List[Dict]) -> List[Dict]:
+    """过滤掉今日已练过的题目（含其他会话、其他设备今日练过的）"""
+    practiced = _practiced_today_ids()
+    return [q for q in questions if (q.get("record_id") or "").strip() not in practiced]
+
+
+def _similar_texts(question: Dict) -> List[str]:
+    """取某题的类似题：先查会话缓存，再查持久化缓存（命令行预生成、其他会话生成的）。"""
+    record_id = (question.get("record_id") or "").strip()
+    if not record_id:
+        return []
+    cache = st.session_state.setdefault("similar_cache", {})
+    if not cache.get(record_id):
+        stored = load_similar_from_store(question)
+        if stored:
+            cache[record_id] = stored
+    return cache.get(record_id) or []
+
+
+def _get_similar_from_cache(question: Dict) -> Optional[str]:
+    """从缓存获取类似题"""
+    texts = _similar_texts(question)
+    # 取出一道（不删除，因为可能需要第二道）
+    return texts[0] if texts else None
+
+
+def _get_second_similar_from_cache(question: Dict) -> Optional[str]:
+    """从缓存获取第二道类似题"""
+    texts = _similar_texts(question)
+    return texts[1] if len(texts) >= 2 else None
+
+
+def _add_to_similar_cache(question: Dict, similar_texts: List[str]):
+    """添加类似题到缓存（会话缓存 + 持久化缓存）"""
+    record_id = (question.get("record_id") or "").strip()
+    if not record_id or not similar_texts:
+        return
+    if "similar_cache" not in st.session_state:
+        st.session_state["similar_cache"] = {}
+    st.session_state["similar_cache"][record_id] = similar_texts
+    save_similar_to_store(question, similar_texts)
+
+
+def _bank_similar(question: Dict, records: List[Dict]) -> Optional[Dict]:
+    """从题库中找一道与该题相似的已有错题（同学科、同知识点，见 retrieval.py），本轮已出过的不再出；没有则返回 None。"""
+    shown = st.session_state.setdefault("practice_bank_shown", [])
+    matches = find_similar_in_bank(question, records, limit=1, exclude=shown)
+    if not matches:
+        return None
+    shown.append(matches[0]["record_id"])
+    # 作为类似题展示：不带 record_id，点击「会了/不会」不写练习记录
+    return dict(matches[0], record_id="", similar_source="bank")
+
+
+def _pregenerate_one_similar(question: Dict, llm_api_key: str, llm_api_base: str, llm_model: str, token: str) -> bool:
+    """为一道题预生成类似题（在后台生成，不阻塞页面），返回是否已就绪"""
+    record_id = (question.get("record_id") or "").strip()
+    if not record_id:
+        return False
+    
+    # 已经生成过则跳过
+    done = st.session_state.setdefault("pregenerate_done", set())
+    if record_id in done:
+        return True
+    
+    # 持久化缓存中已有两道则无需再调用大模型
+    if len(_similar_texts(question)) >= 2:
+        done.add(record_id)
+        return True
+    
+    pending = st.session_state.setdefault("pregenerate_pending", {})
+    future = pending.get(record_id)
+    if future is None:
+        # 生成2道类似题（第一次不会和第二次不会各用一道）
+        pending[record_id] = submit_similar(question, 2, llm_api_key, llm_api_base, llm_model, token, purpose="pregenerate")
+        return False
+    if not future.done():
+        return False
+    pending.pop(record_id, None)
+    try:
+        texts = future.result()
+    except Exception:
+        texts = []
+    if texts:
+        _add_to_similar_cache(question, texts)
+        done.add(record_id)
+        return True
+    # 本轮不再重试这道题
+    st.session_state.setdefault("pregenerate_failed", set()).add(record_id)
+    return False
+
+
+def _similar_within_budget(
+    question: Dict, count: int, started: float, similar_count: int,
+    llm_api_key: str, llm_api_base: str, llm_model: str, token: str,
+) -> Optional[List[str]]:
+    """
+    在后台生成类似题，最多等到本次点击的时间预算用完（started 为点击时刻）。
+    超时返回 None，生成继续进行，记为待提示（生成好后可切过去练，见 _render_deferred_similar）；生成失败时抛出异常。
+    """
+    future = submit_similar(question, count, llm_api_key, llm_api_base, llm_model, token, purpose="practice")
+    remaining = max(0.0, PRACTICE_LATENCY_BUDGET - (time.monotonic() - started))
+    try:
+        return future.result(timeout=remaining)
+    except FutureTimeout:
+        st.session_state["practice_deferred"] = {"origin": question, "future": future, "similar_count": similar_count}
+        return None
+
+
+def _question_label(question: Dict, limit: int = 20) -> str:
+    text = " ".join((question.get("handwriting_text") or "").split())
+    if not text:
+        return "图片题"
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _render_deferred_similar() -> None:
+    """超过时间预算仍在生成的类似题：生成中时每秒刷新一次，生成好后提示切过去练。"""
+    deferred = st.session_state.get("practice_deferred")
+    if not deferred:
+        return
+    polling = not deferred["future"].done()
+    
+    @st.fragment(run_every=1.0 if polling else None)
+    def _deferred_fragment():
+        future = deferred["future"]
+        if not future.done():
+            st.caption(f"⏳ 「{_question_label(deferred['origin'])}」的类似题仍在生成，先练下一题，生成好后会在这里提示")
+            return
+        if polling:
+            # 生成结束后整页刷新一次，停止轮询
+            st.rerun()
+        try:
+            texts = future.result()
+        except Exception:
+            texts = []
+        if not texts:
+            st.caption(f"「{_question_label(deferred['origin'])}」的类似题生成失败，已跳过")
+            st.session_state.pop("practice_deferred", None)
+            return
+        st.info(f"✓ 「{_question_label(deferred['origin'])}」的类似题已生成")
+        col_take, col_skip = st.columns(2)
+        with col_take:
+            if st.button("练这道类似题", type="primary", use_container_width=True, key="practice_deferred_take"):
+                origin = deferred["origin"]
+                if len(texts) >= 2:
+                    _add_to_similar_cache(origin, texts)
+                st.session_state["practice_current"] = {"handwriting_text": texts[0], "attachments": [], "record_id": ""}
+                st.session_state["practice_origin"] = origin
+                st.session_state["practice_is_similar"] = True
+                st.session_state["practice_similar_count"] = deferred["similar_count"]
+                st.session_state.pop("practice_deferred", None)
+                st.rerun()
+        with col_skip:
+            if st.button("不用了", use_container_width=True, key="practice_deferred_skip"):
+                st.session_state.pop("practice_deferred", None)
+                st.rerun()
+    
+    _deferred_fragment()
+
+
+def _get_pregenerate_progress() -> tuple:
+    """获取预生成进度 (已完成, 总数)"""
+    done = len(st.session_state.get("pregenerate_done", set()))
+    queue = st.session_state.get("pregenerate_queue", [])
+    total = len(queue)
+    return (done, total)
+
+
+def _report_pregenerate_queue() -> None:
+    """把本会话预生成队列的剩余题数报给监控。"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    done_count, total_count = _get_pregenerate_progress()
+    remaining = max(0, total_count - done_count) if st.session_state.get("pregenerate_started") else 0
+    set_session_gauge("pregenerate_queue", ctx.session_id, remaining)
+
+
+def render_practice_page(token, records, llm_api_key, llm_api_base, llm_model, config):
+    """渲染错题练习页面"""
+    # 初始化每日练习追踪
+    _init_daily_practice_tracking()
+    
+    # 返回按钮
+    if st.button("← 返回主页", key="practice_back"):
+        # 清理练习状态
+        for k in _PRACTICE_STATE_KEYS:
+            st.session_state.pop(k, None)
+        st.session_state["current_page"] = "home"
+        st.rerun()
+    
+    st.title("📝 错题练习")
+    st.caption("根据艾宾浩斯遗忘曲线智能安排复习（错题原题每天只出现一次）")
+    
+    practice_table_id = (
+        os.getenv("FEISHU_PRACTICE_TABLE_ID")
+        or safe_get_secret("FEISHU_PRACTICE_TABLE_ID")
+        or config.get("FEISHU_PRACTICE_TABLE_ID")
+        or ""
+    )
+    
+    if not practice_table_id:
+        st.error(
+            "错题练习需要配置 **FEISHU_PRACTICE_TABLE_ID**（练习记录表的 table_id）。\n\n"
+            "请在 `.feishu_config.json` 中配置。\n\n"
+            "需在同一多维表格下新建一张表，包含字段：错题record_id、上次练习时间、掌握程度、练习次数、下次练习时间。"
+        )
+        return
+    
+    # 学科筛选
+    subjects = sorted({r["subject"] for r in records if r.get("subject")})
+    selected_subjects = st.multiselect("选择学科", options=subjects, default=subjects, key="practice_subjects")
+    filtered = [r for r in records if r.get("subject") in selected_subjects]
+    
+    # 知识点筛选
+    knowledge_options = sorted({kp for r in filtered for kp in r.get("knowledge_points") or []})
+    selected_kp = st.multiselect("选择知识点", options=knowledge_options, default=knowledge_options, key="practice_kp")
+    
+    filtered_practice = [r for r in filtered if any(kp in (r.get("knowledge_points") or []) for kp in selected_kp)] if selected_kp else filtered
+    
+    st.markdown("---")
+    
+    # 显示预生成进度
+    done_count, total_count = _get_pregenerate_progress()
+    if total_count > 0:
+        if done_count < total_count:
+            st.caption(f"⏳ 正在准备类似题... ({done_count}/{total_count})")
+        else:
+            st.caption(f"✓ 类似题已就绪 ({done_count}/{total_count})")
+    
+    _render_deferred_similar()
+    
+    def _go_next_practice() -> None:
+        """进入下一道题，并标记当前题已练过"""
+        # 标记当前题今日已练
+        cur = st.session_state.get("practice_current")
+        if cur and not st.session_state.get("practice_is_similar"):
+            rid = (cur.get("record_id") or "").strip()
+            if rid:
+                _mark_practiced_today(rid)
+        
+        # 从本轮到期队列中取下一道（跳过今日已练过的），不必每次读出全部练习记录
+        n = pick_next_due(
+            st.session_state.setdefault("practice_due_queue", []),
+            st.session_state.get("practice_filtered", []),
+            st.session_state.get("practice_table_id", ""),
+            int(time.time() * 1000),
+            exclude=_practiced_today_ids(),
+        )
+        if n:
+            st.session_state["practice_current"] = n
+            st.session_state["practice_origin"] = None
+            st.session_state["practice_is_similar"] = False
+            st.session_state["practice_similar_count"] = 0
+        else:
+            for k in ("practice_current", "practice_origin", "practice_is_similar", "practice_similar_count"):
+                st.session_state.pop(k, None)
+            st.success("🎉 本轮可复习的题目已练完！")
+    
+    if st.session_state.get("practice_current"):
+        cur = st.session_state["practice_current"]
+        st.session_state.setdefault("practice_filtered", [])
+        
+        # 显示题目
+        st.markdown("### 当前题目")
+        if st.session_state.get("practice_is_similar"):
+            st.caption("📌 类似题（题库中的相似错题）" if cur.get("similar_source") == "bank" else "📌 类似题")
+        
+        render_question_streamlit(cur, token)
+        
+        st.markdown("---")
+        st.markdown("**掌握了吗？**")
+        
+        col_a, col_b = st.columns(2)
+        with col_a:
+            if st.button("✓ 会了", type="primary", use_container_width=True, key="practice_btn_yes"):
+                is_sim = st.session_state.get("practice_is_similar", False)
+                if not is_sim:
+                    save_practice_feedback(
+                        token,
+                        st.session_state["practice_table_id"],
+                        (cur.get("record_id") or "").strip(),
+                        True,
+                    )
+                _go_next_practice()
+                st.rerun()
+        
+        with col_b:
+            if st.button("✗ 不会", use_container_width=True, key="practice_btn_no"):
+                clicked = time.monotonic()
+                is_sim = st.session_state.get("practice_is_similar", False)
+                orig = st.session_state.get("practice_origin")
+                ptid = st.session_state.get("practice_table_id", "")
+                
+                if not is_sim:
+                    # 第一次点击"不会"
+                    rid = (cur.get("record_id") or "").strip()
+                    save_practice_feedback(token, ptid, rid, False)
+                    st.session_state["practice_origin"] = cur
+                    
+                    # 优先从缓存获取类似题，其次从题库检索相似的已有错题，都没有才实时生成
+                    cached_similar = _get_similar_from_cache(cur)
+                    bank_similar = None if cached_similar else _bank_similar(cur, records)
+                    if cached_similar or bank_similar:
+                        st.session_state["practice_current"] = bank_similar or {"handwriting_text": cached_similar, "attachments": [], "record_id": ""}
+                        st.session_state["practice_is_similar"] = True
+                        st.session_state["practice_similar_count"] = 1
+                        st.rerun()
+                    elif llm_api_key and not token:
+                        # 离线启动（本次用本地数据，尚无令牌）：不实时生成
+                        st.info("飞书暂时连不上（离线模式），网络恢复后再生成类似题，先练下一题")
+                        _go_next_practice()
+                    elif llm_api_key:
+                        # 缓存未命中，实时生成；超过时间预算先出下一题，生成好后再提示
+                        with st.spinner("正在生成类似题目…"):
+                            try:
+                                texts = _similar_within_budget(cur, 2, clicked, 1, llm_api_key, llm_api_base, llm_model, token)
+                                if texts:
+                                    _add_to_similar_cache(cur, texts)
+                                    st.session_state["practice_current"] = {"handwriting_text": texts[0], "attachments": [], "record_id": ""}
+                                    st.session_state["practice_is_similar"] = True
+                                    st.session_state["practice_similar_count"] = 1
+                                    st.rerun()
+                                else:
+                                    _go_next_practice()
+                            except Exception as e:
+                                st.error(f"生成类似题目失败：{e}")
+                                _go_next_practice()
+                    else:
+                        _go_next_practice()
+                else:
+                    # 第二次点击"不会"（在类似题上）
+                    cnt = st.session_state.get("practice_similar_count", 0)
+                    if cnt < 2 and orig:
+                        # 优先从缓存获取第二道类似题，其次从题库检索
+                        cached_second = _get_second_similar_from_cache(orig)
+                        bank_second = None if cached_second else _bank_similar(orig, records)
+                        if cached_second or bank_second:
+                            st.session_state["practice_current"] = bank_second or {"handwriting_text": cached_second, "attachments": [], "record_id": ""}
+                            st.session_state["practice_similar_count"] = 2
+                            st.rerun()
+                        elif llm_api_key and not token:
+                            st.info("飞书暂时连不上（离线模式），网络恢复后再生成类似题，先练下一题")
+                            _go_next_practice()
+                        elif llm_api_key:
+                            with st.spinner("再出一道类似题目…"):
+                                try:
+                                    texts = _similar_within_budget(orig, 1, clicked, 2, llm_api_key, llm_api_base, llm_model, token)
+                                    if texts:
+                                        st.session_state["practice_current"] = {"handwriting_text": texts[0], "attachments": [], "record_id": ""}
+                                        st.session_state["practice_similar_count"] = 2
+                                        st.rerun()
+                                    else:
+                                        _go_next_practice()
+                                except Exception:
+                                    _go_next_practice()
+                    else:
+                        _go_next_practice()
+                st.rerun()
+    else:
+        st.info("点击下方按钮开始练习")
+        if st.button("🚀 开始练习", type="primary", use_container_width=True, key="practice_start"):
+            with st.spinner("正在加载练习记录…"):
+                try:
+                    sync_practice_ledger(token, practice_table_id, background=True)
+                    
+                    # 过滤掉今日已练过的题目
+                    available_questions = _filter_not_practiced_today(filtered_practice)
+                    
+                    # 到期题走本地账本的下次练习时间索引，之后每次点击从这个队列取题
+                    now_ms = int(time.time() * 1000)
+                    due_queue = due_questions_indexed(available_questions, practice_table_id, now_ms)
+                    n = pick_next_due(due_queue, available_questions, practice_table_id, now_ms)
+                    if not n:
+                        st.info("暂无需要复习的题目，或今日的题目已全部练完。")
+                    else:
+                        # 立即显示第一道题
+                        st.session_state["practice_current"] = n
+                        st.session_state["practice_due_queue"] = due_queue
+                        st.session_state["practice_table_id"] = practice_table_id
+                        st.session_state["practice_filtered"] = filtered_practice
+                        st.session_state["practice_origin"] = None
+                        st.session_state["practice_is_similar"] = False
+                        st.session_state["practice_similar_count"] = 0
+                        
+                        # 设置预生成队列（所有可练习的题目）
+                        st.session_state["pregenerate_queue"] = available_questions
+                        st.session_state["pregenerate_done"] = set()
+                        st.session_state["pregenerate_pending"] = {}
+                        st.session_state["pregenerate_failed"] = set()
+                        st.session_state["pregenerate_started"] = True
+                        
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"加载练习记录失败：{e}")
+    
+    # 后台预生成逻辑：每次页面刷新时尝试生成一道（离线时没有令牌，等网络恢复后的刷新再继续）
+    if st.session_state.get("pregenerate_started") and llm_api_key and token:
+        queue = st.session_state.get("pregenerate_queue", [])
+        done = st.session_state.get("pregenerate_done", set())
+        
+        failed = st.session_state.get("pregenerate_failed", set())
+        
+        # 找到下一个需要预生成的题目（缓存中已有的直接跳过）
+        for q in queue:
+            rid = (q.get("record_id") or "").strip()
+            if rid and rid not in done and rid not in failed:
+                # 预生成这道题的类似题（在后台生成，不阻塞UI）
+                if not _pregenerate_one_similar(q, llm_api_key, llm_api_base, llm_model, token):
+                    break  # 同时只在后台生成一道，把线程池留给点击「不会」的实时生成
+    _report_pregenerate_queue()
+    
+    # 底部返回按钮
+    st.markdown("---")
+    if st.button("← 返回主页", key="practice_back_bottom"):
+        for k in _PRACTICE_STATE_KEYS + ("pregenerate_started",):
+            st.session_state.pop(k, None)
+        _report_pregenerate_queue()
+        st.session_state["current_page"] = "home"
+        st.rerun()
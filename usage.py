@@ -0,0 +1,231 @@
+"""
+大模型用量记账（SQLite）：每次调用记录模型、用途（页面）、学科、prompt/completion token 数、耗时与是否成功，
+按天、用途、模型汇总，供诊断页面显示和命令行导出（python cli.py usage）。
+
+记账数据同时用于自适应 max_tokens：按「类型 + 学科」统计最近成功调用中每道题的输出 token 数，
+max_tokens 取 p95 留出余量后乘以请求的道数，不再一律 2000；最近出现过输出被截断时回到上限。
+
+费用按 LLM_PRICES 配置的单价计算（JSON，{模型: [输入单价, 输出单价]}，单位：元 / 百万 token），未配置的模型不计费用。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from storage import get_data_dir
+
+_DB_NAME = "llm_usage.sqlite3"
+
+# 记录保留天数
+RETENTION_DAYS = 90
+# max_tokens 的上下限与无统计数据时每道题的预估输出 token 数
+MAX_TOKENS_CEILING = 2000
+MAX_TOKENS_FLOOR = 256
+DEFAULT_TOKENS_PER_ITEM = {"similar": 600, "transcribe": 1200}
+# 统计每道题输出长度时取最近多少次成功调用；样本少于 MIN_SAMPLES 时使用预估值
+SAMPLE_CALLS = 50
+MIN_SAMPLES = 10
+# 在 p95 基础上的余量系数与固定开销（换行等）
+HEADROOM = 1.3
+OVERHEAD_TOKENS = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    purpose TEXT NOT NULL DEFAULT '',
+    kind TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL DEFAULT '',
+    items INTEGER NOT NULL DEFAULT 1,
+    max_tokens INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    ok INTEGER NOT NULL DEFAULT 1,
+    truncated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_calls_day ON calls (day);
+CREATE INDEX IF NOT EXISTS idx_calls_kind ON calls (kind, subject, id);
+"""
+
+_COLUMNS = (
+    "ts", "day", "purpose", "kind", "subject", "model", "items", "max_tokens",
+    "prompt_tokens", "completion_tokens", "seconds", "ok", "truncated",
+)
+
+
+def _prices() -> Dict[str, List[float]]:
+    try:
+        prices = json.loads(os.getenv("LLM_PRICES") or "{}")
+    except ValueError:
+        return {}
+    return prices if isinstance(prices, dict) else {}
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int, prices: Optional[Dict] = None) -> Optional[float]:
+    """按配置的单价计算一次调用的费用（元）；该模型未配置单价时返回 None。"""
+    price = (prices if prices is not None else _prices()).get(model)
+    if not price:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+class UsageLedger:
+    """大模型用量账本。连接在线程间共用，所有操作串行执行。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._inserts = 0
+
+    def record(self, **call: Any) -> None:
+        """记录一次调用（字段见 _COLUMNS，缺省为 0 / 空）。"""
+        now = time.time()
+        call.setdefault("ts", now)
+        call.setdefault("day", datetime.fromtimestamp(call["ts"]).strftime("%Y-%m-%d"))
+        row = tuple(call.get(c, "" if c in ("purpose", "kind", "subject", "model") else 0) for c in _COLUMNS)
+        with self._lock:
+            self._conn.execute(f"INSERT INTO calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})", row)
+            self._inserts += 1
+            if self._inserts % 500 == 1:
+                self._conn.execute("DELETE FROM calls WHERE ts < ?", (now - RETENTION_DAYS * 86400,))
+
+    def suggest_max_tokens(self, kind: str, subject: str, items: int) -> int:
+        """按最近同类调用每道题的输出长度给出 max_tokens；最近被截断过或出错时取上限。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT completion_tokens, items, truncated FROM calls WHERE kind = ? AND subject = ? AND ok = 1 "
+                "ORDER BY id DESC LIMIT ?",
+                (kind, subject or "", SAMPLE_CALLS),
+            ).fetchall()
+        if any(truncated for _, _, truncated in rows[:MIN_SAMPLES]):
+            return MAX_TOKENS_CEILING
+        per_item = sorted(c / max(n, 1) for c, n, _ in rows if c)
+        if len(per_item) < MIN_SAMPLES:
+            estimate = DEFAULT_TOKENS_PER_ITEM.get(kind, MAX_TOKENS_CEILING)
+        else:
+            estimate = per_item[min(len(per_item) - 1, int(0.95 * len(per_item)))] * HEADROOM
+        return int(min(MAX_TOKENS_CEILING, max(MAX_TOKENS_FLOOR, estimate * max(items, 1) + OVERHEAD_TOKENS)))
+
+    def spent(self, since: float, purpose: str = "") -> Dict[str, Any]:
+        """since（时间戳）以来的调用次数、token 数与费用（可只统计某一用途）；有模型未配置单价时 cost 只含已配置的部分。"""
+        sql = "SELECT model, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens) FROM calls WHERE ts >= ?"
+        params: list = [since]
+        if purpose:
+            sql += " AND purpose = ?"
+            params.append(purpose)
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY model", params).fetchall()
+        prices = _prices()
+        total = {"calls": 0, "tokens": 0, "cost": 0.0, "unpriced_calls": 0}
+        for model, calls, prompt, completion in rows:
+            total["calls"] += calls
+            total["tokens"] += (prompt or 0) + (completion or 0)
+            cost = call_cost(model, prompt or 0, completion or 0, prices)
+            if cost is None:
+                total["unpriced_calls"] += calls
+            else:
+                total["cost"] += cost
+        total["cost"] = round(total["cost"], 4)
+        return total
+
+    def summary(self, days: int = 7, group_by: tuple = ("day", "purpose", "model")) -> List[Dict[str, Any]]:
+        """最近 days 天按 group_by 汇总：调用次数、失败次数、token 数、平均/最大耗时、费用。"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        keys = [k for k in group_by if k in _COLUMNS]
+        select = ", ".join(keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {select}, model, COUNT(*), SUM(1 - ok), SUM(prompt_tokens), SUM(completion_tokens), "
+                f"AVG(seconds), MAX(seconds), SUM(truncated) FROM calls WHERE day >= ? GROUP BY {select}, model "
+                f"ORDER BY {select}",
+                (since,),
+            ).fetchall()
+        prices = _prices()
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for row in rows:
+            group = tuple(row[: len(keys)])
+            model, calls, errors, prompt, completion, avg_s, max_s, truncated = row[len(keys):]
+            agg = merged.setdefault(group, dict(zip(keys, group), calls=0, errors=0, prompt_tokens=0, completion_tokens=0,
+                                                seconds_total=0.0, max_seconds=0.0, truncated=0, cost=None))
+            agg["calls"] += calls
+            agg["errors"] += errors
+            agg["prompt_tokens"] += prompt or 0
+            agg["completion_tokens"] += completion or 0
+            agg["seconds_total"] += (avg_s or 0) * calls
+            agg["max_seconds"] = max(agg["max_seconds"], max_s or 0)
+            agg["truncated"] += truncated or 0
+            cost = call_cost(model, prompt or 0, completion or 0, prices)
+            if cost is not None:
+                agg["cost"] = round((agg["cost"] or 0) + cost, 4)
+        result = []
+        for agg in merged.values():
+            agg["avg_seconds"] = round(agg.pop("seconds_total") / agg["calls"], 2) if agg["calls"] else 0.0
+            agg["max_seconds"] = round(agg["max_seconds"], 2)
+            result.append(agg)
+        return result
+
+    def rows(self, days: int = 7) -> List[Dict[str, Any]]:
+        """最近 days 天的逐次调用明细（导出报告用）。"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM calls WHERE day >= ? ORDER BY id", (since,)
+            ).fetchall()
+        prices = _prices()
+        result = []
+        for row in rows:
+            item = dict(zip(_COLUMNS, row))
+            item["cost"] = call_cost(item["model"], item["prompt_tokens"], item["completion_tokens"], prices)
+            result.append(item)
+        return result
+
+
+def report_csv(rows: List[Dict[str, Any]]) -> str:
+    """把汇总或明细行转为 CSV 文本（表头取第一行的字段）。"""
+    import csv
+    import io
+
+    if not rows:
+        return ""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """获取进程内共享的用量账本（数据目录下的 llm_usage.sqlite3）。"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger(str(get_data_dir() / _DB_NAME))
+        return _ledger
+
+
+def record_call(**call: Any) -> None:
+    """记一笔用量；写入失败（如只读文件系统）时静默忽略。"""
+    try:
+        get_usage_ledger().record(**call)
+    except sqlite3.Error:
+        pass
+
+
+def suggest_max_tokens(kind: str, subject: str, items: int) -> int:
+    try:
+        return get_usage_ledger().suggest_max_tokens(kind, subject, items)
+    except sqlite3.Error:
+        return MAX_TOKENS_CEILING
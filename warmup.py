@@ -0,0 +1,76 @@
+"""
+启动预热：在第一位用户打开页面之前完成准备工作。
+
+依次获取访问令牌、加载（或同步）题库快照并建立索引、拉取练习记录，
+再预下载当前到期题目的图片到附件缓存。结果写入数据目录下的 warmup.json。
+由 run_app.py 在启动服务前调用，也可以用 `python cli.py warmup` 单独执行。
+"""
+import time
+from typing import Callable, Dict, Optional
+
+from storage import atomic_write_json, get_data_dir, read_json
+
+_REPORT_NAME = "warmup.json"
+
+
+def warm_up(config: Optional[Dict] = None, max_images: int = 60, log: Callable[[str], None] = print) -> Dict:
+    """执行预热并返回报告；单个步骤失败不抛出，记录在报告的 error 中。"""
+    from feishu_client import get_tenant_access_token, prefetch_attachments
+    from record_store import get_practice_map, get_record_store
+    from records import is_image_file
+    from scheduler import due_questions, due_questions_indexed
+    from settings import get_setting, load_config
+
+    if config is None:
+        config = load_config()
+    started = time.perf_counter()
+    report: Dict = {"ok": False, "started_at": time.time(), "steps": {}, "error": None}
+
+    def step(name: str, fn):
+        t = time.perf_counter()
+        result = fn()
+        report["steps"][name] = round(time.perf_counter() - t, 3)
+        return result
+
+    try:
+        app_id = get_setting("FEISHU_APP_ID", config)
+        app_secret = get_setting("FEISHU_APP_SECRET", config)
+        if not app_id or not app_secret:
+            raise RuntimeError("未配置 FEISHU_APP_ID / FEISHU_APP_SECRET，跳过预热")
+
+        token = step("token", lambda: get_tenant_access_token(app_id, app_secret))
+        store = get_record_store()
+        records = step("records", lambda: store.get_records(token))
+        report["records"] = len(records)
+        report["records_source"] = store.source
+        log(f"题库已就绪：{len(records)} 道题（来源：{'本地快照' if store.source == 'snapshot' else '飞书'}）")
+
+        practice_map: Dict = {}
+        practice_table_id = get_setting("FEISHU_PRACTICE_TABLE_ID", config)
+        if practice_table_id:
+            practice_map = step("practice", lambda: get_practice_map(token, practice_table_id))
+            report["practice_records"] = len(practice_map)
+
+        now_ms = int(time.time() * 1000)
+        due = due_questions_indexed(records, practice_table_id, now_ms) if practice_table_id else due_questions(records, {}, now_ms)
+        report["due"] = len(due)
+        images = [
+            att for r in due for att in (r.get("attachments") or [])
+            if is_image_file(att.get("name"), att.get("mime"))
+        ][:max_images]
+        report["images"] = step("images", lambda: prefetch_attachments(images, token))
+        log(f"到期题目 {len(due)} 道，已预下载图片 {report['images']['downloaded']} 张")
+        report["ok"] = True
+    except Exception as exc:  # noqa: BLE001
+        report["error"] = str(exc)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    try:
+        atomic_write_json(get_data_dir() / _REPORT_NAME, report)
+    except OSError:
+        pass
+    return report
+
+
+def load_last_report() -> Optional[Dict]:
+    """读取最近一次预热报告。"""
+    return read_json(get_data_dir() / _REPORT_NAME)